@@ -0,0 +1,3 @@
+from .stream_benchmark import run_stream_benchmark, print_stream_benchmark
+from .image_benchmark import run_image_benchmark, print_image_benchmark
+from .results import BenchmarkResults
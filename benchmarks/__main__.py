@@ -0,0 +1,80 @@
+import sys
+from argparse import ArgumentParser
+
+from . import (
+    BenchmarkResults,
+    print_image_benchmark,
+    print_stream_benchmark,
+    run_image_benchmark,
+    run_stream_benchmark,
+)
+
+
+SUITES = ["image", "stream"]
+
+
+def setup_argparse() -> ArgumentParser:
+    p = ArgumentParser(description="Time image and stream operations, optionally against a saved baseline.")
+    p.add_argument("suites", nargs="*", default=None, metavar="{image,stream}",
+        help="The benchmarks to run, all of them by default.")
+    p.add_argument("--data_size", type=int, default=64,
+        help="The size of the game files in the synthetic image, in MiB.")
+    p.add_argument("--file_count", type=int, default=1000)
+    p.add_argument("--directory_depth", type=int, default=3)
+    p.add_argument("--repeat", type=int, default=5, help="How many times each image operation is run.")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("-o", "--output", type=str, help="Save the results as JSON to this path.")
+    p.add_argument("-b", "--baseline", type=str,
+        help="Compare against results saved with --output, and exit with an error if any got slower.")
+    p.add_argument("--tolerance", type=float, default=0.25,
+        help="How much slower than the baseline a benchmark can be, as a fraction.")
+    return p
+
+
+def main() -> int:
+    parser = setup_argparse()
+    args = parser.parse_args()
+    # checked here since some Python versions check the empty list of a "*" argument against choices
+    if not args.suites:
+        args.suites = SUITES
+    for suite in args.suites:
+        if suite not in SUITES:
+            parser.error(f"argument suites: invalid choice: {suite!r} (choose from 'image', 'stream')")
+    config = {
+        "suites": args.suites,
+        "data_size": args.data_size,
+        "file_count": args.file_count,
+        "directory_depth": args.directory_depth,
+        "seed": args.seed,
+    }
+
+    timings = {}
+    if "image" in args.suites:
+        image_results = run_image_benchmark(
+            args.data_size << 20, args.file_count, args.directory_depth, args.repeat, args.seed
+        )
+        print_image_benchmark(image_results)
+        timings.update({f"image/{name}": min(runs) for name, runs in image_results.items()})
+    if "stream" in args.suites:
+        stream_results = run_stream_benchmark(seed=args.seed)
+        print_stream_benchmark(stream_results)
+        for workload, backends in stream_results.items():
+            timings.update({f"stream/{workload}/{backend}": t for backend, t in backends.items()})
+
+    results = BenchmarkResults(timings, config)
+    if args.output is not None:
+        results.save(args.output)
+
+    if args.baseline is not None:
+        baseline = BenchmarkResults.load(args.baseline)
+        results.print_comparison(baseline)
+        regressions = results.compare(baseline, args.tolerance)
+        for name, previous, current in regressions:
+            print(f"regression: {name} took {current:.4f}s, the baseline took {previous:.4f}s")
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
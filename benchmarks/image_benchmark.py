@@ -0,0 +1,131 @@
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.definitions import MemoryStream, NotImplementedFile
+from src.gamecube import GamecubeISO
+from src.patch import apply_patch
+from tests.synthetic_image import SyntheticImage
+
+
+def _measure(repeat: int, setup, run, teardown=None) -> "list[float]":
+    """
+    Time run repeat times, each time on a fresh state from setup that isn't part of the timing.
+    """
+    runs = []
+    for _ in range(repeat):
+        state = setup()
+        try:
+            start_time = time.perf_counter()
+            run(state)
+            runs.append(time.perf_counter() - start_time)
+        finally:
+            if teardown is not None:
+                teardown(state)
+    return runs
+
+
+def run_image_benchmark(
+    data_size: int = 0x4000000,
+    file_count: int = 1000,
+    directory_depth: int = 3,
+    repeat: int = 5,
+    seed: int = 0,
+) -> "dict[str, list[float]]":
+    """
+    Time the common operations on a synthetic image generated from the arguments: opening it,
+    parsing the FST, looking files up by name, searching the tree, extracting every file,
+    replacing and rebuilding a tenth of the files, and creating and applying a patch.
+    Returns the time in seconds of every run of each operation.
+    """
+    synthetic_image = SyntheticImage(data_size, file_count, directory_depth, seed=seed)
+    paths = list(synthetic_image.files)
+    names = [path.rsplit("/", 1)[-1] for path in paths]
+    generator = random.Random(seed)
+    changed_names = generator.sample(names, max(1, len(names) // 10))
+    searched_names = generator.sample(names, min(50, len(names)))
+
+    results: "dict[str, list[float]]" = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        image_path = temp_path.joinpath("benchmark.iso")
+        synthetic_image.write(image_path)
+
+        def open_image() -> GamecubeISO:
+            return GamecubeISO.open_image_file(image_path)
+
+        def open_with_fst() -> GamecubeISO:
+            iso = open_image()
+            iso.table_of_contents
+            return iso
+
+        def open_with_changes() -> GamecubeISO:
+            iso = open_with_fst()
+            for name in changed_names:
+                iso.open_file(name).replace_bytes(0, b"changed")
+            return iso
+
+        def open_with_replaced_files() -> GamecubeISO:
+            iso = open_with_fst()
+            replace_files(iso)
+            return iso
+
+        def replace_files(iso: GamecubeISO):
+            with iso.batch() as batch:
+                for name in changed_names:
+                    contents = MemoryStream(bytes([len(name)]) * (len(name) * 0x400))
+                    batch.replace_file(NotImplementedFile(name, contents))
+
+        def close(iso: GamecubeISO):
+            iso.file_contents.close()
+
+        def lookup(iso: GamecubeISO):
+            iso.table_of_contents.invalidate()
+            for name in names:
+                iso.table_of_contents.search_file_by_name(name)
+
+        def search(iso: GamecubeISO):
+            toc = iso.table_of_contents
+            for name in searched_names:
+                toc.search_file_by_name(name, toc.root_directory)
+            for path in paths[:: max(1, len(paths) // 50)]:
+                if "/" in path:
+                    toc.search_directory_by_name(path.rsplit("/", 2)[-2])
+
+        def extract(iso: GamecubeISO):
+            for name in names:
+                iso.open_file(name)
+
+        patch_path = temp_path.joinpath("benchmark.patch")
+        changed_iso = open_with_changes()
+        patch_path.write_bytes(changed_iso.build_patch_file())
+        close(changed_iso)
+
+        results["open"] = _measure(repeat, lambda: None, lambda _: close(open_image()))
+        results["parse_fst"] = _measure(repeat, open_image, lambda iso: iso.table_of_contents, close)
+        results["lookup"] = _measure(repeat, open_with_fst, lookup, close)
+        results["search"] = _measure(repeat, open_with_fst, search, close)
+        results["extract"] = _measure(repeat, open_with_fst, extract, close)
+        results["replace"] = _measure(repeat, open_with_fst, replace_files, close)
+        results["build"] = _measure(
+            repeat,
+            open_with_replaced_files,
+            lambda iso: iso.save_to_disk(temp_path.joinpath("built.iso")),
+            close,
+        )
+        results["patch_create"] = _measure(
+            repeat, open_with_changes, lambda iso: iso.build_patch_file(), close
+        )
+        results["patch_apply"] = _measure(
+            repeat, open_with_fst, lambda iso: apply_patch(iso, patch_path), close
+        )
+
+    return results
+
+
+def print_image_benchmark(results: "dict[str, list[float]]"):
+    print(f"{'operation':<20}{'min':>20}{'median':>20}")
+    for operation, runs in results.items():
+        print(f"{operation:<20}{min(runs):>19.4f}s{statistics.median(runs):>19.4f}s")
@@ -0,0 +1,60 @@
+import json
+import os
+import platform
+from pathlib import Path
+
+
+class BenchmarkResults:
+    """
+    The timings of a benchmark run by name, like 'image/build' or 'stream/random/mmap', with the
+    configuration and machine they were measured with. Each timing is the fastest run, it's the
+    least affected by other work on the machine.
+    """
+
+    def __init__(self, timings: "dict[str, float]", config: dict = None, environment: dict = None) -> None:
+        self.timings = timings
+        self.config = config or {}
+        self.environment = environment or {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        }
+
+    def to_json_obj(self) -> dict:
+        return {"environment": self.environment, "config": self.config, "timings": self.timings}
+
+    def save(self, path: "Path | str"):
+        Path(path).write_text(json.dumps(self.to_json_obj(), indent=2))
+
+    @classmethod
+    def load(cls, path: "Path | str") -> "BenchmarkResults":
+        json_obj = json.loads(Path(path).read_text())
+        return cls(json_obj["timings"], json_obj.get("config"), json_obj.get("environment"))
+
+    def compare(
+        self, baseline: "BenchmarkResults", tolerance: float = 0.25, min_difference: float = 0.005
+    ) -> "list[tuple[str, float, float]]":
+        """
+        Get the (name, baseline, current) timings that are more than tolerance slower than the
+        baseline. Differences under min_difference seconds are noise and never count.
+        """
+        regressions = []
+        for name, current in self.timings.items():
+            previous = baseline.timings.get(name)
+            if previous is None:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > min_difference:
+                regressions.append((name, previous, current))
+        return regressions
+
+    def print_comparison(self, baseline: "BenchmarkResults"):
+        if baseline.config != self.config:
+            print(f"baseline was measured with {baseline.config}, not {self.config}")
+        print(f"{'benchmark':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+        for name, current in self.timings.items():
+            previous = baseline.timings.get(name)
+            if previous is None:
+                print(f"{name:<40}{'-':>12}{current:>11.4f}s{'new':>10}")
+            else:
+                change = (current - previous) / previous if previous > 0 else 0.0
+                print(f"{name:<40}{previous:>11.4f}s{current:>11.4f}s{change:>+10.1%}")
@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+import time
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+
+from src.definitions import FileStream, MMapStream, Stream
+
+
+def _random_reads(stream: Stream, offsets: "list[tuple[int, int]]"):
+    for offset, count in offsets:
+        stream.get_bytes_at_offset(offset, count)
+
+
+def _sequential_reads(stream: Stream, chunk_size: int):
+    for offset in range(0, stream.stream_size, chunk_size):
+        stream.get_bytes_at_offset(offset, chunk_size)
+
+
+def _small_sequential_reads(stream: Stream):
+    # FST and header parsing read a few bytes at a time in order
+    for offset in range(0, min(stream.stream_size, 0x100000), 4):
+        stream.get_int_at_offset(offset)
+
+
+def run_stream_benchmark(
+    image_size: int = 0x4000000, read_count: int = 20000, seed: int = 0
+) -> "dict[str, dict[str, float]]":
+    """
+    Compare MMapStream and FileStream for random and sequential read workloads.
+    Returns the time in seconds for each workload and stream type.
+    """
+    generator = random.Random(seed)
+    offsets = [
+        (generator.randrange(0, image_size - 0x10000), generator.choice([4, 0x20, 0x800, 0x8000]))
+        for _ in range(read_count)
+    ]
+
+    results: "dict[str, dict[str, float]]" = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir).joinpath("benchmark.iso")
+        with path.open("wb") as image_file:
+            for _ in range(0, image_size, 0x100000):
+                image_file.write(os.urandom(0x100000))
+
+        def open_mmap():
+            with path.open("rb") as image_file:
+                return MMapStream(mmap(image_file.fileno(), 0, access=ACCESS_READ))
+
+        def open_file():
+            return FileStream.from_file(path)
+
+        def open_file_sequential():
+            stream = FileStream.from_file(path)
+            stream.advise("sequential")
+            return stream
+
+        workloads = {
+            "random": lambda stream: _random_reads(stream, offsets),
+            "sequential 1MiB": lambda stream: _sequential_reads(stream, 0x100000),
+            "sequential 2KiB": lambda stream: _sequential_reads(stream, 0x800),
+            "sequential int": _small_sequential_reads,
+        }
+        backends = {"mmap": open_mmap, "file": open_file, "file (sequential)": open_file_sequential}
+
+        for workload_name, workload in workloads.items():
+            results[workload_name] = {}
+            for backend_name, open_stream in backends.items():
+                if workload_name == "random" and backend_name == "file (sequential)":
+                    # reading ahead on every miss only makes sense for sequential reads
+                    continue
+                stream = open_stream()
+                start_time = time.perf_counter()
+                workload(stream)
+                results[workload_name][backend_name] = time.perf_counter() - start_time
+                stream.close()
+
+    return results
+
+
+def print_stream_benchmark(results: "dict[str, dict[str, float]]"):
+    backends = []
+    for timings in results.values():
+        backends.extend(b for b in timings if b not in backends)
+
+    print(f"{'workload':<20}" + "".join(f"{backend:>20}" for backend in backends))
+    for workload_name, timings in results.items():
+        print(
+            f"{workload_name:<20}"
+            + "".join(f"{timings[b]:>19.3f}s" if b in timings else f"{'-':>20}" for b in backends)
+        )
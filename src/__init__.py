@@ -1,3 +1,11 @@
 from .definitions import *
 from .gamecube import GamecubeISO
-from .patch import patch
\ No newline at end of file
+from .patch import patch
+
+
+def __getattr__(name: str):
+    if name == "AsyncGamecubeISO":
+        from .gamecube import AsyncGamecubeISO
+
+        return AsyncGamecubeISO
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,9 @@
 import argparse
+import json
 from pathlib import Path
 
-from tqdm import tqdm
-from . import GamecubeISO, patch
+from . import GamecubeISO, MemoryBudget, patch, Instrumentation, TqdmInstrumentation, JSONLinesInstrumentation, ProfilingInstrumentation
+from .gamecube import AccessTrace, DirectoryImageBuilder, ImageWatcher
 
 def cmdline_args():
         # Make parser object
@@ -11,45 +12,123 @@ def cmdline_args():
     
     p.add_argument("input_image_path",
                    help="Path to the gamecube disc image.", type=Path)
-    p.add_argument("action", type=str, choices=['extract', 'save', 'patch'], default='extract',
-                   help="One of 'extract', 'save' (default: %(default)s)")
+    p.add_argument("action", type=str, choices=['extract', 'save', 'patch', 'scrub', 'build', 'watch', 'probe', 'diff'], default='extract',
+                   help="One of 'extract', 'save', 'patch', 'scrub', 'build', 'watch', 'probe', 'diff' (default: %(default)s)")
     p.add_argument("--with_system_files", action="store_true",
                    help="If true, and action is extract, save the system file images as well.")
     p.add_argument("-d", "--defragment", action="store_true",
                    help="If true, update the image to remove junk data.")
+    p.add_argument("-t", "--access_trace", type=Path,
+                   help="If given, reorder the files so the ones in this trace of file names or offsets are read in one sweep.")
     p.add_argument("-o", "--output", type=Path,
                    help="increase output verbosity (default: %(default)s)")
     p.add_argument("-p", "--patch", type=Path,
                    help="increase output verbosity (default: %(default)s)")
+    p.add_argument("-j", "--junk", action="store_true",
+                   help="If true, and action is save, fill the gaps between files with junk data like on a disc instead of zeros.")
+    p.add_argument("-m", "--memory_budget", type=int,
+                   help="If given, and action is save, keep the file data held in memory under this many MiB, spilling changed files to disk.")
+    p.add_argument("--sparse", action="store_true",
+                   help="If true, and action is scrub, leave holes in the output instead of writing zeros.")
+    p.add_argument("-b", "--backend", type=str, choices=['mmap', 'file'], default='mmap',
+                   help="How to read the input image (default: %(default)s)")
+    p.add_argument("-f", "--format", type=str, choices=['iso', 'ciso', 'gcz'], default='iso',
+                   help="Image format to use when saving (default: %(default)s)")
+    p.add_argument("-e", "--events", type=str, choices=['tqdm', 'jsonl', 'profile', 'none'], default='tqdm',
+                   help="How to report progress: progress bars, JSON lines on stderr, a profile of each phase or nothing (default: %(default)s)")
+    p.add_argument("-s", "--system_image", type=Path,
+                   help="If action is build or watch and the input directory has no sys/ directory, take the system files from this image.")
+    p.add_argument("-c", "--compare_image", type=Path,
+                   help="If action is diff, the image to compare the input image to.")
                    
 
     return p.parse_args()
 
 
+def get_instrumentation(events: str) -> Instrumentation:
+    import sys
+
+    if events == 'tqdm':
+        return TqdmInstrumentation()
+    if events == 'jsonl':
+        return JSONLinesInstrumentation(sys.stderr)
+    if events == 'profile':
+        return ProfilingInstrumentation()
+    return Instrumentation()
+
+
 
 def extract_files(out_path: Path, ir: GamecubeISO):
     fst_file_list = ir.table_of_contents.get_fst_file_list()
-    for file in tqdm(fst_file_list):
-        file = ir._extract_file(str(file.filename))
-        with out_path.joinpath(file.file_name).open('wb') as outfile:
-            outfile.write(file.to_bytes())
+    with ir.instrumentation.phase("extract", total=len(fst_file_list)) as phase:
+        for file in fst_file_list:
+            file = ir._extract_file(str(file.filename))
+            file_bytes = file.to_bytes()
+            with out_path.joinpath(file.file_name).open('wb') as outfile:
+                outfile.write(file_bytes)
+            phase.update(files=1, bytes_read=len(file_bytes), bytes_written=len(file_bytes))
 
 if __name__ == "__main__":
     args = cmdline_args()
     in_path = Path(args.input_image_path)
-    out_path = Path(args.output)
-    patch_path = Path(args.patch)
-    ir = GamecubeISO.open_image_file(in_path)
+    out_path = args.output
+    patch_path = args.patch
+
+    if args.action == 'probe':
+        print(json.dumps(GamecubeISO.probe_image_file(in_path).to_json_obj()))
+        raise SystemExit(0)
+
+    if args.action in ('build', 'watch'):
+        system_image = None
+        if args.system_image is not None:
+            system_image = GamecubeISO.open_image_file(args.system_image, args.backend)
+
+        if args.action == 'build':
+            image_size = DirectoryImageBuilder(in_path, system_image).build(out_path)
+            print(f"Built a {image_size} byte image.")
+        else:
+            watcher = ImageWatcher(in_path, out_path, system_image)
+            print(f"Watching {in_path} for changes, press Ctrl+C to stop.")
+            try:
+                watcher.watch(lambda changed_paths: print(f"Updated {', '.join(changed_paths)}"))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                watcher.close()
+        raise SystemExit(0)
+
+    instrumentation = get_instrumentation(args.events)
+    ir = GamecubeISO.open_image_file(in_path, args.backend, instrumentation=instrumentation)
 
     if args.defragment:
         system_file_size = ir.get_system_size()
         ir.table_of_contents.defragment(system_file_size)
 
+    if args.access_trace is not None:
+        report = ir.optimize_layout(AccessTrace.from_file(args.access_trace))
+        print(json.dumps(report.to_json_obj()))
+
     if args.action == 'extract':
         extract_files(out_path, ir)
             
     elif args.action == 'save':
-        ir.save_to_disk(out_path)
+        if args.memory_budget is not None:
+            with MemoryBudget(args.memory_budget << 20, out_path.parent) as memory_budget:
+                ir.save_to_disk(out_path, args.format, fill_junk=args.junk, memory_budget=memory_budget)
+                print(json.dumps(memory_budget.to_json_obj()))
+        else:
+            ir.save_to_disk(out_path, args.format, fill_junk=args.junk)
     
     elif args.action == 'patch':
-        patch(patch_path, in_path, out_path)
+        patch(patch_path, in_path, out_path, instrumentation)
+
+    elif args.action == 'diff':
+        other = GamecubeISO.open_image_file(args.compare_image, args.backend, instrumentation=instrumentation)
+        print(json.dumps(ir.compare(other).to_json_obj()))
+
+    elif args.action == 'scrub':
+        reclaimed_bytes = ir.scrub(out_path, args.sparse)
+        print(f"Zeroed {reclaimed_bytes} unused bytes.")
+
+    if isinstance(instrumentation, ProfilingInstrumentation):
+        instrumentation.print_stats()
@@ -0,0 +1 @@
+from .catalog import ImageCatalog, ScanResult, index_image
@@ -0,0 +1,43 @@
+import argparse
+from pathlib import Path
+
+from . import ImageCatalog
+
+def cmdline_args():
+    p = argparse.ArgumentParser(description="Index libraries of disc images into a SQLite catalog and query it.")
+    p.add_argument("-d", "--database", type=Path, default=Path("catalog.db"),
+                   help="Path of the catalog database (default: %(default)s)")
+    actions = p.add_subparsers(dest="action", required=True)
+
+    scan = actions.add_parser("scan", help="Index new and changed images in the given directories.")
+    scan.add_argument("directories", type=Path, nargs="+")
+    scan.add_argument("--hash", action="store_true", help="Also store a sha1 hash of every file.")
+    scan.add_argument("-j", "--processes", type=int, help="Number of worker processes (default: one per CPU)")
+
+    find = actions.add_parser("find", help="List the images that contain a file.")
+    find.add_argument("file_path", type=str)
+
+    dol = actions.add_parser("dol", help="List the images with a given main.dol sha1 hash.")
+    dol.add_argument("dol_hash", type=str)
+
+    game = actions.add_parser("game", help="List the images whose game ID starts with the given ID.")
+    game.add_argument("game_id", type=str)
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = cmdline_args()
+    with ImageCatalog(args.database) as catalog:
+        if args.action == "scan":
+            result = catalog.scan(args.directories, args.hash, args.processes)
+            print(f"Indexed {result.indexed}, unchanged {result.unchanged}, removed {result.removed}.")
+            for path, error in result.errors.items():
+                print(f"Could not index {path}: {error}")
+        else:
+            if args.action == "find":
+                image_paths = catalog.find_images_with_file(args.file_path)
+            elif args.action == "dol":
+                image_paths = catalog.find_images_by_dol_hash(args.dol_hash)
+            else:
+                image_paths = catalog.find_images_by_game_id(args.game_id)
+            for image_path in image_paths:
+                print(image_path)
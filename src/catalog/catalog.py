@@ -0,0 +1,252 @@
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+
+from .. import GamecubeISO
+
+
+IMAGE_EXTENSIONS = (".iso", ".gcm", ".ciso", ".gcz")
+IMAGE_COLUMNS = (
+    "id", "path", "size", "mtime_ns", "game_id", "title", "disk_id", "version", "dol_hash"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    game_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    disk_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    dol_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    image_id INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE INDEX IF NOT EXISTS files_image ON files (image_id);
+CREATE INDEX IF NOT EXISTS images_dol_hash ON images (dol_hash);
+CREATE INDEX IF NOT EXISTS images_game_id ON images (game_id);
+"""
+
+
+def index_image(path: str, hash_files: bool = False) -> dict:
+    """
+    Read the disc header, DOL and FST listing of an image into a dict that can be sent back from
+    a worker process. File hashes are sha1 and are only computed when hash_files is set.
+    """
+    iso = GamecubeISO.open_image_file(path, "file")
+    try:
+        disc_header = iso.disc_header
+        game_id = bytes(disc_header.file_contents.get_bytes_at_offset(0, 6))
+        files = []
+        for file_path, entry in iso.table_of_contents.get_fst_file_paths():
+            file_hash = None
+            if hash_files:
+                file_bytes = iso.file_contents.get_bytes_at_offset(
+                    entry.data_offset, entry.data_size
+                )
+                file_hash = hashlib.sha1(file_bytes).hexdigest()
+            files.append((file_path, entry.data_offset, entry.data_size, file_hash))
+
+        return {
+            "game_id": game_id.decode("ascii", "replace"),
+            "title": str(disc_header.game_name),
+            "disk_id": disc_header.disk_id,
+            "version": disc_header.version,
+            "dol_hash": hashlib.sha1(iso.dol.to_bytes()).hexdigest(),
+            "files": files,
+        }
+    finally:
+        iso.file_contents.close()
+
+
+def _index_image_worker(path: str, hash_files: bool) -> "tuple[str, dict | None, str | None]":
+    try:
+        return path, index_image(path, hash_files), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+class ScanResult:
+    """
+    Counts of what a scan did, and the images that couldn't be read with the reason why.
+    """
+
+    def __init__(self) -> None:
+        self.indexed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.errors: "dict[str, str]" = {}
+
+
+class ImageCatalog:
+    """
+    A SQLite catalog of the disc header fields and FST listings of a library of images.
+
+    Scans walk directories for images and index new or changed ones in a process pool, images
+    whose size and mtime match the catalog are skipped, and images that were removed from the
+    scanned directories are dropped. Queries then only touch the database.
+    """
+
+    def __init__(self, database_path: "Path | str") -> None:
+        self.database_path = Path(database_path)
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def find_image_files(directory: "Path | str") -> "list[Path]":
+        image_paths = []
+        for root, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    image_paths.append(Path(root, file_name).resolve())
+        return sorted(image_paths)
+
+    def scan(
+        self,
+        directories: "list[Path | str]",
+        hash_files: bool = False,
+        processes: int = None,
+    ) -> ScanResult:
+        """
+        Bring the catalog up to date with the images in the given directories.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        result = ScanResult()
+        known_images: "dict[str, tuple[int, int, int]]" = {
+            path: (image_id, size, mtime_ns)
+            for image_id, path, size, mtime_ns in self.connection.execute(
+                "SELECT id, path, size, mtime_ns FROM images"
+            )
+        }
+
+        changed_images: "dict[str, tuple[int, int]]" = {}
+        for directory in directories:
+            directory = Path(directory).resolve()
+            found_paths = set()
+            for image_path in self.find_image_files(directory):
+                found_paths.add(str(image_path))
+                stat = image_path.stat()
+                known_image = known_images.get(str(image_path))
+                if known_image is not None and known_image[1:] == (stat.st_size, stat.st_mtime_ns):
+                    result.unchanged += 1
+                else:
+                    changed_images[str(image_path)] = (stat.st_size, stat.st_mtime_ns)
+
+            with self.connection:
+                for path, (image_id, _, _) in known_images.items():
+                    if directory in Path(path).parents and path not in found_paths:
+                        self.connection.execute("DELETE FROM images WHERE id = ?", (image_id,))
+                        result.removed += 1
+
+        if len(changed_images) == 0:
+            return result
+
+        with ProcessPoolExecutor(processes) as executor:
+            image_paths = list(changed_images)
+            indexed_images = executor.map(
+                _index_image_worker,
+                image_paths,
+                [hash_files] * len(image_paths),
+                chunksize=max(1, len(image_paths) // ((processes or os.cpu_count() or 1) * 4)),
+            )
+            for path, image, error in indexed_images:
+                if error is not None:
+                    result.errors[path] = error
+                    continue
+                self._store_image(path, *changed_images[path], image)
+                result.indexed += 1
+        return result
+
+    def _store_image(self, path: str, size: int, mtime_ns: int, image: dict):
+        with self.connection:
+            self.connection.execute("DELETE FROM images WHERE path = ?", (path,))
+            columns = ", ".join(IMAGE_COLUMNS[1:])
+            cursor = self.connection.execute(
+                f"INSERT INTO images ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    size,
+                    mtime_ns,
+                    image["game_id"],
+                    image["title"],
+                    image["disk_id"],
+                    image["version"],
+                    image["dol_hash"],
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO files (image_id, path, offset, size, hash) VALUES (?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, *file) for file in image["files"]],
+            )
+
+    def find_images_with_file(self, file_path: str) -> "list[str]":
+        """
+        Get the images that have a file at the given path on the disc.
+        A leading files/ like in extracted trees is ignored.
+        """
+        if file_path.startswith("files/"):
+            file_path = file_path[len("files/") :]
+        rows = self.connection.execute(
+            "SELECT DISTINCT images.path FROM files JOIN images ON images.id = files.image_id"
+            " WHERE files.path = ? ORDER BY images.path",
+            (file_path.lstrip("/"),),
+        )
+        return [row[0] for row in rows]
+
+    def find_images_by_dol_hash(self, dol_hash: str) -> "list[str]":
+        rows = self.connection.execute(
+            "SELECT path FROM images WHERE dol_hash = ? ORDER BY path", (dol_hash.lower(),)
+        )
+        return [row[0] for row in rows]
+
+    def find_images_by_game_id(self, game_id: str) -> "list[str]":
+        """
+        Get the images whose game ID starts with the given one, so a 4 character ID matches the
+        game from every maker. Wildcards in the ID are matched literally.
+        """
+        pattern = game_id.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self.connection.execute(
+            "SELECT path FROM images WHERE game_id LIKE ? ESCAPE '\\' ORDER BY path", (f"{pattern}%",)
+        )
+        return [row[0] for row in rows]
+
+    def get_image(self, image_path: "Path | str") -> "dict | None":
+        """
+        Get the catalog entry of an image, with its file listing.
+        """
+        row = self.connection.execute(
+            f"SELECT {', '.join(IMAGE_COLUMNS)} FROM images WHERE path = ?",
+            (str(Path(image_path).resolve()),),
+        ).fetchone()
+        if row is None:
+            return None
+
+        image = dict(zip(IMAGE_COLUMNS, row))
+        image["files"] = [
+            {"path": path, "offset": offset, "size": size, "hash": file_hash}
+            for path, offset, size, file_hash in self.connection.execute(
+                "SELECT path, offset, size, hash FROM files WHERE image_id = ? ORDER BY rowid",
+                (image["id"],),
+            )
+        ]
+        return image
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> "ImageCatalog":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,5 +1,7 @@
-from .constants import *
-from .transform import *
-from .stream import *
-from .abstract_file import *
-from .abstract_file_archive import *
+from .constants import *
+from .transform import *
+from .stream import *
+from .instrumentation import Instrumentation, InstrumentationEvent, InstrumentationPhase, TqdmInstrumentation, JSONLinesInstrumentation, ProfilingInstrumentation
+from .abstract_file import *
+from .abstract_file_archive import *
+from .memory_budget import MemoryBudget
@@ -1,10 +1,9 @@
 import abc
 from enum import Enum
 import json
-import bsdiff4
-from typing import Iterable, Union
+from typing import Callable, Iterable, Union
 
-from . import Serializable, Stream
+from . import OverlayStream, Serializable, Stream
 
 
 class FileChangeType(Enum):
@@ -44,21 +43,39 @@ class AbstractFile(Serializable, abc.ABC):
         self.file_contents: Stream = file_contents
 
         self.changes: list[FileChange] = []
+        self._change_listeners: "list[Callable[[AbstractFile], None]]" = []
+
+    def add_change_listener(self, listener: "Callable[[AbstractFile], None]"):
+        """
+        Call listener with this file whenever a change is made to it or undone.
+        """
+        self._change_listeners.append(listener)
+
+    def _notify_changed(self):
+        for listener in self._change_listeners:
+            listener(self)
+
+    def is_dirty(self) -> bool:
+        return len(self.changes) > 0
 
     def read_bytes(self, offset: int, count: int) -> bytearray:
         return self.file_contents.get_bytes_at_offset(offset, count)
 
     def replace_bytes(self, offset: int, value: bytearray):
         self.changes.append(FileChange(FileChangeType.REPLACE, offset, value))
+        self._notify_changed()
 
     def insert_bytes(self, offset: int, value: bytearray):
         self.changes.append(FileChange(FileChangeType.INSERT, offset, value))
+        self._notify_changed()
 
     def delete_bytes(self, offset: int, count: int):
         self.changes.append(FileChange(FileChangeType.DELETE, offset, count))
+        self._notify_changed()
 
     def undo_change(self):
         self.changes.pop()
+        self._notify_changed()
 
     def get_file_size(self, with_changes: bool = True):
         stream_size = self.file_contents.stream_size
@@ -67,26 +84,52 @@ class AbstractFile(Serializable, abc.ABC):
                 if change.change_type == FileChangeType.INSERT:
                     stream_size += len(change.value)
                 elif change.change_type == FileChangeType.DELETE:
-                    stream_size -= len(change.value)
+                    stream_size -= change.value
         return stream_size
             
 
+    def _get_changed_contents(self) -> Stream:
+        """
+        Get the contents with any pending changes applied to a copy-on-write overlay,
+        so the contents themselves are only read once and never copied.
+        """
+        if len(self.changes) == 0:
+            return self.file_contents
+
+        byte_stream = OverlayStream(self.file_contents)
+        for change in self.changes:
+            if change.change_type == FileChangeType.INSERT:
+                byte_stream.insert_into_stream(change.offset, change.value)
+            elif change.change_type == FileChangeType.REPLACE:
+                byte_stream.write_bytes_at_offset(change.offset, change.value)
+            elif change.change_type == FileChangeType.DELETE:
+                byte_stream.delete_from_stream(change.offset, change.value)
+        return byte_stream
+
     def to_bytes(self) -> bytearray:
         """
         Serialize this file into bytes.
-        If we have pending changes, return a new stream copy with the changes applied.
         """
-        byte_stream = self.file_contents.copy()
-        if len(self.changes) > 0:
-            for change in self.changes:
-                if change.change_type == FileChangeType.INSERT:
-                    byte_stream.insert_into_stream(change.offset, change.value)
-                elif change.change_type == FileChangeType.REPLACE:
-                    byte_stream.write_bytes_at_offset(change.offset, change.value)
-                elif change.change_type == FileChangeType.DELETE:
-                    byte_stream.delete_from_stream(change.offset, change.value)
+        byte_stream = self._get_changed_contents()
+        return byte_stream.get_bytes_at_offset(0, byte_stream.stream_size)
 
-        return byte_stream
+    def write_to_stream(self, write_stream: Stream, offset: int, chunk_size: int = None) -> int:
+        """
+        Serialize this file into a stream at an offset and return the number of bytes written.
+        If a chunk size is given and the file doesn't have its own serialization, it's written
+        a chunk at a time so the whole file is never held in memory.
+        """
+        if chunk_size is None or type(self).to_bytes is not AbstractFile.to_bytes:
+            file_bytes = self.to_bytes()
+            write_stream.write_bytes_at_offset(offset, file_bytes)
+            return len(file_bytes)
+
+        byte_stream = self._get_changed_contents()
+        for chunk_offset in range(0, byte_stream.stream_size, chunk_size):
+            write_stream.write_bytes_at_offset(
+                offset + chunk_offset, byte_stream.get_bytes_at_offset(chunk_offset, chunk_size)
+            )
+        return byte_stream.stream_size
 
     def to_json_obj(self) -> dict:
         """
@@ -101,8 +144,11 @@ class AbstractFile(Serializable, abc.ABC):
         return self.file_name.rsplit(".")[-1]
     
     def build_patch_file(self) -> bytes:
-        if any(self.changes):
-            return bsdiff4.diff(self.file_contents, self.to_bytes())
+        import bsdiff4
+
+        if self.is_dirty():
+            original_bytes = self.file_contents.get_bytes_at_offset(0, self.file_contents.stream_size)
+            return bsdiff4.diff(bytes(original_bytes), bytes(self.to_bytes()))
         return None
 
 
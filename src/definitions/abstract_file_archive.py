@@ -1,10 +1,9 @@
 import abc
-import bsdiff4
 import json
 
 from src.definitions.stream import MemoryStream, Stream
 
-from . import AbstractFile
+from . import AbstractFile, Instrumentation
 
 
 class AbstractFileArchive(AbstractFile, abc.ABC):
@@ -19,6 +18,34 @@ class AbstractFileArchive(AbstractFile, abc.ABC):
         self.compression_method = compression_method
         self.encryption_method = encryption_method
         self.extracted_archive_files: "dict[str, AbstractFile]" = {}
+        self.changes = []
+        self._change_listeners = []
+        # names of files that were added, replaced, deleted or changed since the archive was read
+        self.dirty_files: "set[str]" = set()
+        self._replaced_files: "set[str]" = set()
+        # receives events for the work done on the archive, see Instrumentation
+        self.instrumentation = Instrumentation()
+
+    def _on_file_changed(self, file: AbstractFile):
+        if file.is_dirty():
+            self.dirty_files.add(file.file_name)
+        elif file.file_name not in self._replaced_files:
+            self.dirty_files.discard(file.file_name)
+        self._notify_changed()
+
+    def _track_file(self, file: AbstractFile):
+        file.add_change_listener(self._on_file_changed)
+
+    def mark_dirty(self, file_name: str):
+        """
+        Record that a file was added, replaced or deleted, so it's rebuilt even without pending changes.
+        """
+        self.dirty_files.add(file_name)
+        self._replaced_files.add(file_name)
+        self._notify_changed()
+
+    def is_dirty(self) -> bool:
+        return len(self.dirty_files) > 0
 
     @abc.abstractmethod
     def get_file_list(self) -> "list[str]":
@@ -49,35 +76,49 @@ class AbstractFileArchive(AbstractFile, abc.ABC):
     def add_new_file(self, file: AbstractFile, parent_directory: str = None):
         if file.file_name not in self.extracted_archive_files:
             self.extracted_archive_files[file.file_name] = file
+            self._track_file(file)
+            self.mark_dirty(file.file_name)
 
     @abc.abstractmethod
     def replace_file(self, file: AbstractFile):
         self.extracted_archive_files[file.file_name] = file
+        self._track_file(file)
+        self.mark_dirty(file.file_name)
 
     @abc.abstractmethod
     def delete_file(self, file: AbstractFile):
         if file.file_name in self.extracted_archive_files:
             del self.extracted_archive_files[file.file_name]
+        self.mark_dirty(file.file_name)
 
     def open_file(self, file_name: str) -> AbstractFile:
         if file_name not in self.extracted_archive_files:
-            self.extracted_archive_files[file_name] = self._extract_file(file_name)        
-        
+            with self.instrumentation.phase("extract") as phase:
+                file = self._extract_file(file_name)
+                phase.update(files=1, bytes_read=file.file_contents.stream_size)
+            self._track_file(file)
+            self.extracted_archive_files[file_name] = file
+
         return self.extracted_archive_files[file_name] 
     
     def open_files(self): 
         file_list = self.get_file_list()
-        self.extracted_archive_files = dict(*[(f, self._extract_file(f)) for f in file_list])
+        for file_name in file_list:
+            self.open_file(file_name)
         return self.extracted_archive_files
     
     def build_patch_file(self) -> bytes:
-        if any(self.extracted_archive_files):
-            for file in self.extracted_archive_files.values():
-                if any(file.changes):
-                    mem_stream = MemoryStream()
-                    self.build_archive(mem_stream)
-                    return bsdiff4.diff(self.file_contents, mem_stream.stream)
-        return bytes()
+        import bsdiff4
+
+        if self.is_dirty():
+            with self.instrumentation.phase("patch") as phase:
+                mem_stream = MemoryStream()
+                self.build_archive(mem_stream)
+                original_bytes = self.file_contents.get_bytes_at_offset(0, self.file_contents.stream_size)
+                patch_bytes = bsdiff4.diff(bytes(original_bytes), bytes(mem_stream.stream))
+                phase.update(files=1, bytes_read=len(original_bytes), bytes_written=len(patch_bytes))
+            return patch_bytes
+        return None
     
     def to_bytes(self) -> bytearray:
         raise NotImplementedError("Use build_archive instead")
@@ -0,0 +1,245 @@
+import json
+import threading
+import time
+from typing import IO
+
+
+class InstrumentationEvent:
+    """
+    Something that happened during a phase of work, like loading, extracting, building, patching
+    or saving an image. Kind is 'start' or 'end' for the phase itself, or 'progress' for work done
+    during it. Fields hold the counters of the phase, and its duration and throughput when it ends.
+    """
+
+    def __init__(self, kind: str, phase: str, depth: int, fields: dict) -> None:
+        self.kind = kind
+        self.phase = phase
+        self.depth = depth
+        self.time = time.time()
+        self.fields = fields
+
+    def to_json_obj(self) -> dict:
+        return {
+            "event": self.kind,
+            "phase": self.phase,
+            "depth": self.depth,
+            "time": self.time,
+            **self.fields,
+        }
+
+
+class InstrumentationPhase:
+    """
+    A running phase, used as a context manager. Work done during it is reported with update,
+    and the totals are reported when it ends.
+    """
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, total: int = None) -> None:
+        self.instrumentation = instrumentation
+        self.name = name
+        self.total = total
+        self.depth = 0
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.details = {}
+        self._start_time = 0.0
+
+    def _get_counters(self) -> dict:
+        return {
+            "files": self.files,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+    def annotate(self, **details):
+        """
+        Add fields to the event reported when the phase ends.
+        """
+        self.details.update(details)
+
+    def update(self, files: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+        self.files += files
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        self.instrumentation._emit(
+            InstrumentationEvent(
+                "progress",
+                self.name,
+                self.depth,
+                {
+                    "total": self.total,
+                    **self._get_counters(),
+                    "files_delta": files,
+                    "bytes_read_delta": bytes_read,
+                    "bytes_written_delta": bytes_written,
+                },
+            )
+        )
+
+    def __enter__(self) -> "InstrumentationPhase":
+        phases = self.instrumentation._get_phases()
+        self.depth = len(phases)
+        phases.append(self)
+        self.instrumentation._emit(
+            InstrumentationEvent("start", self.name, self.depth, {"total": self.total})
+        )
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start_time
+        self.instrumentation._get_phases().pop()
+        transferred = max(self.bytes_read, self.bytes_written)
+        self.instrumentation._emit(
+            InstrumentationEvent(
+                "end",
+                self.name,
+                self.depth,
+                {
+                    **self._get_counters(),
+                    "duration": duration,
+                    "throughput": transferred / duration if duration > 0 else None,
+                    "error": None if exc_type is None else exc_type.__name__,
+                    **self.details,
+                },
+            )
+        )
+
+
+class Instrumentation:
+    """
+    Receives the events of the phases of work done on an archive. This one ignores them, subclasses
+    handle them in on_event. Phases are started with phase and can be nested, each thread has
+    its own nesting.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def _get_phases(self) -> "list[InstrumentationPhase]":
+        if not hasattr(self._local, "phases"):
+            self._local.phases = []
+        return self._local.phases
+
+    def phase(self, name: str, total: int = None) -> InstrumentationPhase:
+        """
+        Start a phase, with the total number of files it works on if that's known.
+        """
+        return InstrumentationPhase(self, name, total)
+
+    def _emit(self, event: InstrumentationEvent):
+        self.on_event(event)
+
+    def on_event(self, event: InstrumentationEvent):
+        pass
+
+
+class TqdmInstrumentation(Instrumentation):
+    """
+    Shows a progress bar for each phase that works on a known number of files, and the name of each
+    top level phase as it starts.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._progress_bars = {}
+
+    def on_event(self, event: InstrumentationEvent):
+        from tqdm import tqdm
+
+        if event.kind == "start":
+            if event.fields["total"] is not None:
+                self._progress_bars[event.depth] = tqdm(total=event.fields["total"], desc=event.phase)
+            elif event.depth == 0:
+                tqdm.write(event.phase)
+        elif event.kind == "progress" and event.depth in self._progress_bars:
+            self._progress_bars[event.depth].update(event.fields["files_delta"])
+        elif event.kind == "end" and event.depth in self._progress_bars:
+            self._progress_bars.pop(event.depth).close()
+
+
+class JSONLinesInstrumentation(Instrumentation):
+    """
+    Writes each event as a line of JSON. Progress events are left out unless include_progress is set,
+    the end of each phase already has its totals.
+    """
+
+    def __init__(self, stream: IO[str], include_progress: bool = False) -> None:
+        super().__init__()
+        self.stream = stream
+        self.include_progress = include_progress
+
+    def on_event(self, event: InstrumentationEvent):
+        if event.kind != "progress" or self.include_progress:
+            self.stream.write(json.dumps(event.to_json_obj()) + "\n")
+
+
+class ProfilingInstrumentation(Instrumentation):
+    """
+    Profiles each phase with cProfile and measures the peak memory it allocates with tracemalloc,
+    above what was allocated when it started. A phase's profile leaves out the phases nested in it,
+    its peak memory includes them. Only phases on one thread at a time can be profiled.
+    Results are kept in profiles and peak_memory by phase name, repeated phases are combined.
+    Tracing allocations slows everything down, so this is for finding where time and memory go.
+    """
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        super().__init__()
+        self.trace_memory = trace_memory
+        self.profiles: "dict[str, object]" = {}
+        self.peak_memory: "dict[str, int]" = {}
+        self._profilers = []
+        self._started_tracing = False
+
+    def on_event(self, event: InstrumentationEvent):
+        import cProfile
+        import tracemalloc
+
+        if event.kind == "start":
+            if len(self._profilers) > 0:
+                self._profilers[-1][0].disable()
+            current = 0
+            if self.trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                current, peak = tracemalloc.get_traced_memory()
+                for entry in self._profilers:
+                    entry[1] = max(entry[1], peak)
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            # the profiler, the peak memory before nested phases reset it and the memory at the start
+            self._profilers.append([profiler, current, current])
+            profiler.enable()
+
+        elif event.kind == "end":
+            profiler, peak, start_memory = self._profilers.pop()
+            profiler.disable()
+            self._add_profile(event.phase, profiler)
+            if self.trace_memory:
+                peak = max(peak, tracemalloc.get_traced_memory()[1]) - start_memory
+                self.peak_memory[event.phase] = max(self.peak_memory.get(event.phase, 0), peak)
+                if len(self._profilers) == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            if len(self._profilers) > 0:
+                self._profilers[-1][0].enable()
+
+    def _add_profile(self, phase: str, profiler):
+        import pstats
+
+        if phase in self.profiles:
+            self.profiles[phase].add(profiler)
+        else:
+            self.profiles[phase] = pstats.Stats(profiler)
+
+    def print_stats(self, limit: int = 10):
+        """
+        Print the functions that took the most time in each phase.
+        """
+        for phase, stats in self.profiles.items():
+            peak = self.peak_memory.get(phase)
+            print(f"{phase}: peak memory {peak} bytes" if peak is not None else phase)
+            stats.sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,150 @@
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+from . import AbstractFile, FileStream, MemoryStream, Stream
+
+
+def _reset_peak_rss() -> bool:
+    # only Linux lets the high water mark be reset, elsewhere the peak is for the whole process
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> "int | None":
+    """
+    Get the most memory the process has had resident in bytes, or None if it can't be read.
+    """
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class MemoryBudget:
+    """
+    A cap on the file data a build holds in memory. Before a build writes any files, the contents
+    of changed files are spilled to temporary files, largest first, until what's left fits in the
+    budget along with the buffers used to copy. The build then copies and serializes files one at
+    a time, a chunk at a time, and writes the image through buffered writes instead of a mapping.
+
+    Spilled files read from the temporary files until the budget is closed, so close it, or use it
+    as a context manager, once the build is done. Closing it reads the spilled contents back into
+    memory, so the archive can still be saved again.
+    """
+
+    def __init__(self, limit: int, spill_directory: "Path | str" = None) -> None:
+        self.limit = limit
+        self.spill_directory = spill_directory
+        # a read and a write buffer of this size are held at once while copying
+        self.chunk_size = max(0x8000, min(0x400000, limit // 8))
+        self.spilled_files = 0
+        self.spilled_bytes = 0
+        self.peak_buffered = 0
+        self.peak_rss: "int | None" = None
+        self._peak_rss_reset = False
+        self._temp_dir: "tempfile.TemporaryDirectory | None" = None
+        self._spill_streams: "list[FileStream]" = []
+        # each spilled file with the stream it was spilled to, the in-memory contents aren't kept
+        self._spilled: "list[tuple[AbstractFile, FileStream]]" = []
+
+    @staticmethod
+    def get_buffered_size(file: AbstractFile) -> int:
+        """
+        Get how many bytes of a file are held in memory, its contents and any pending changes.
+        """
+        size = 0
+        if isinstance(file.file_contents, MemoryStream):
+            size += file.file_contents.stream_size
+        for change in file.changes:
+            if not isinstance(change.value, int):
+                size += len(change.value)
+        return size
+
+    def _spill(self, file: AbstractFile):
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.TemporaryDirectory(dir=self.spill_directory)
+        contents: Stream = file.file_contents
+        path = Path(self._temp_dir.name).joinpath(f"{len(self._spill_streams)}.bin")
+        with path.open("wb") as spill_file:
+            for offset in range(0, contents.stream_size, self.chunk_size):
+                spill_file.write(contents.get_bytes_at_offset(offset, self.chunk_size))
+
+        spill_stream = FileStream.from_file(path, cache_size=max(1, self.chunk_size // 0x8000))
+        self._spill_streams.append(spill_stream)
+        self._spilled.append((file, spill_stream))
+        file.file_contents = spill_stream
+        self.spilled_files += 1
+        self.spilled_bytes += spill_stream.stream_size
+
+    def enforce(self, files: "Iterable[AbstractFile]"):
+        """
+        Spill the contents of files to disk, largest first, until the rest fit in the budget.
+        """
+        buffered_files = [(self.get_buffered_size(f), f) for f in files]
+        buffered_size = sum(size for size, _ in buffered_files)
+        available = self.limit - 2 * self.chunk_size
+        for size, file in sorted(buffered_files, key=lambda f: f[0], reverse=True):
+            if buffered_size <= available:
+                break
+            if isinstance(file.file_contents, MemoryStream):
+                buffered_size -= file.file_contents.stream_size
+                self._spill(file)
+        self.peak_buffered = max(self.peak_buffered, buffered_size + 2 * self.chunk_size)
+
+    def start(self):
+        """
+        Start measuring the peak memory of a build.
+        """
+        self._peak_rss_reset = _reset_peak_rss()
+
+    def finish(self):
+        """
+        Record the peak memory of the build since it was started.
+        """
+        self.peak_rss = get_peak_rss()
+
+    def to_json_obj(self) -> dict:
+        return {
+            "limit": self.limit,
+            "chunk_size": self.chunk_size,
+            "spilled_files": self.spilled_files,
+            "spilled_bytes": self.spilled_bytes,
+            "peak_buffered": self.peak_buffered,
+            "peak_rss": self.peak_rss,
+            # without a reset the peak can be from before the build
+            "peak_rss_is_for_build": self._peak_rss_reset,
+        }
+
+    def close(self):
+        for file, spill_stream in self._spilled:
+            if file.file_contents is spill_stream:
+                file.file_contents = MemoryStream(
+                    spill_stream.get_bytes_at_offset(0, spill_stream.stream_size)
+                )
+        self._spilled = []
+        for stream in self._spill_streams:
+            stream.close()
+        self._spill_streams = []
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def __enter__(self) -> "MemoryBudget":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
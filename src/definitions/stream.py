@@ -1,19 +1,35 @@
 import abc
+import array
+import bisect
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
 from typing import Iterable, Union, BinaryIO, ByteString
 from mmap import ACCESS_WRITE, mmap
 from pathlib import Path
-from typing_extensions import Self
 from ..unicode import UnicodeString, UnicodeCharacter
 
 
 class Stream(abc.ABC):
+    """
+    A stream is a sized buffer of bytes that is read and written at explicit offsets.
+    Reads and writes are positional and never depend on a shared cursor, so any number of threads
+    can read from the same stream at once. Writes to ranges that aren't being read are also safe,
+    inserting and deleting bytes resizes the stream and must not run alongside other access.
+    """
+
     def __init__(self) -> None:
         self.stream: "Union[ByteString, BinaryIO]" = None
         self.stream_size = 0
 
     @abc.abstractmethod
-    def copy(self) -> Self:
-        """ """
+    def copy(self) -> "Stream":
+        """
+        Get a stream with the same contents that can be changed without changing this one.
+        Streams backed by an image return a copy-on-write overlay instead of reading the image.
+        """
 
     @abc.abstractmethod
     def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
@@ -25,6 +41,7 @@ class Stream(abc.ABC):
     def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
         """
         Replace bytes in the stream at a given offset with the value provided.
+        Returns the number of bytes written.
         """
 
     @abc.abstractmethod
@@ -41,6 +58,11 @@ class Stream(abc.ABC):
         moving the data at offset + byte_count to be at offset + 1
         """
 
+    def close(self):
+        """
+        Release any resources held by the stream.
+        """
+
     def get_byte_at_offset(self, offset: int) -> int:
         """
         Retrieve a single byte at a given offset.
@@ -63,15 +85,75 @@ class Stream(abc.ABC):
         """
         string = UnicodeString()
         current_offset = offset
-        char_byte = self.get_byte_at_offset(current_offset)
+        while True:
+            # names are short, so read a chunk at a time instead of a byte at a time
+            chunk = self.get_bytes_at_offset(current_offset, 0x40)
+            end = chunk.find(0)
+            name_bytes = chunk if end < 0 else chunk[:end]
+            string.chars.extend(UnicodeCharacter(char_byte) for char_byte in name_bytes)
+            if end >= 0 or len(chunk) == 0:
+                return string
+            current_offset += len(chunk)
 
-        while char_byte != 0:
-            string.add_character(UnicodeCharacter(char_byte))
+    @staticmethod
+    def _big_endian(fmt: str) -> str:
+        # the disc is big endian, so formats without a byte order are read as big endian
+        return fmt if fmt[:1] in "@=<>!" else ">" + fmt
 
-            current_offset += 1
-            char_byte = self.get_byte_at_offset(current_offset)
+    def read_struct(self, fmt: str, offset: int) -> tuple:
+        """
+        Unpack a struct at a given offset in one read.
+        Formats without a byte order prefix are big endian.
+        """
+        fmt = self._big_endian(fmt)
+        return struct.unpack(fmt, self.get_bytes_at_offset(offset, struct.calcsize(fmt)))
 
-        return string
+    def read_structs(self, fmt: str, offset: int, count: int) -> "list[tuple]":
+        """
+        Unpack a table of count structs that follow each other at a given offset in one read.
+        """
+        fmt = self._big_endian(fmt)
+        table = self.get_bytes_at_offset(offset, struct.calcsize(fmt) * count)
+        return list(struct.iter_unpack(fmt, table))
+
+    def read_array(self, dtype: str, offset: int, count: int):
+        """
+        Read count big endian numbers at a given offset in one read.
+        dtype is an array typecode such as 'I' or 'H', which returns an array.array,
+        or a NumPy dtype such as 'u4', which returns a NumPy array and needs NumPy installed.
+        """
+        if len(dtype) == 1 and dtype in array.typecodes:
+            values = array.array(dtype)
+            values.frombytes(self.get_bytes_at_offset(offset, values.itemsize * count))
+            if sys.byteorder == "little":
+                values.byteswap()
+            return values
+
+        import numpy
+
+        numpy_dtype = numpy.dtype(dtype).newbyteorder(">")
+        data = self.get_bytes_at_offset(offset, numpy_dtype.itemsize * count)
+        return numpy.frombuffer(bytes(data), numpy_dtype).astype(numpy_dtype.newbyteorder("="))
+
+    def write_struct(self, fmt: str, offset: int, *values) -> int:
+        """
+        Pack values into a struct and write it at a given offset in one write.
+        Formats without a byte order prefix are big endian.
+        """
+        return self.write_bytes_at_offset(offset, struct.pack(self._big_endian(fmt), *values))
+
+    def write_array(self, offset: int, values) -> int:
+        """
+        Write an array.array or NumPy array as big endian numbers at a given offset in one write.
+        """
+        if isinstance(values, array.array):
+            if sys.byteorder == "little":
+                values = array.array(values.typecode, values)
+                values.byteswap()
+            data = values.tobytes()
+        else:
+            data = values.astype(values.dtype.newbyteorder(">")).tobytes()
+        return self.write_bytes_at_offset(offset, data)
 
     def write_byte_at_offset(self, offset: int, value: int):
         self.write_bytes_at_offset(offset, [value])
@@ -87,7 +169,7 @@ class Stream(abc.ABC):
     def occurrence_of_bytes(self, marker: "Iterable[int]", start_offset: int = 0) -> "list[int]":
         marker_offsets = []
         marker_match_index = 0
-        for i in range(start_offset, len(self.stream)):
+        for i in range(start_offset, self.stream_size):
             check_byte = self.get_byte_at_offset(i)
             if check_byte == marker[marker_match_index]:
                 marker_match_index  += 1
@@ -122,22 +204,240 @@ class Stream(abc.ABC):
         return offset >= 0 and offset + size <= self.stream_size
 
 
+class OperationCancelled(Exception):
+    """
+    Raised from a stream when the operation using it was cancelled.
+    """
+
+
+class CancellableStream(Stream):
+    """
+    Wraps another stream and raises OperationCancelled from the next read or write once
+    the cancel event is set. This lets long running reads and writes be stopped from another thread.
+    """
+
+    def __init__(self, stream: Stream, cancel_event: threading.Event) -> None:
+        super().__init__()
+        self.stream: Stream = stream
+        self.stream_size = stream.stream_size
+        self.cancel_event = cancel_event
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise OperationCancelled()
+
+    def copy(self) -> Stream:
+        self._check_cancelled()
+        return self.stream.copy()
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        self._check_cancelled()
+        return self.stream.get_bytes_at_offset(offset, count)
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        self._check_cancelled()
+        result = self.stream.write_bytes_at_offset(offset, value)
+        self.stream_size = self.stream.stream_size
+        return result
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        self._check_cancelled()
+        self.stream.insert_into_stream(offset, data)
+        self.stream_size = self.stream.stream_size
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        self._check_cancelled()
+        self.stream.delete_from_stream(offset, byte_count)
+        self.stream_size = self.stream.stream_size
+
+
+class SubStream(Stream):
+    """
+    A window of another stream. Offsets are relative to the start of the window and reads and
+    writes go straight to the parent stream, so nested archives can be built in place in their
+    parent's output without a buffer of their own. Writes outside of the window raise a ValueError.
+    """
+
+    def __init__(self, stream: Stream, offset: int, size: int) -> None:
+        super().__init__()
+        self.stream: Stream = stream
+        self.offset = offset
+        self.stream_size = size
+
+    def copy(self) -> "MemoryStream":
+        return MemoryStream(self.get_bytes_at_offset(0, self.stream_size))
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        count = max(0, min(count, self.stream_size - offset))
+        return self.stream.get_bytes_at_offset(self.offset + offset, count)
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        if offset < 0 or offset + len(value) > self.stream_size:
+            raise ValueError(
+                f"Writing {len(value)} bytes at {offset} overruns a {self.stream_size} byte window."
+            )
+        return self.stream.write_bytes_at_offset(self.offset + offset, value)
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        raise NotImplementedError("A window of a stream can't be resized.")
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        raise NotImplementedError("A window of a stream can't be resized.")
+
+
+class OverlayStream(Stream):
+    """
+    A copy-on-write view of a base stream. The base is never written, the view is kept as a sorted
+    list of pieces that either point at a range of the base or hold written bytes, so writes,
+    inserts and deletes only cost the size of the change and unchanged ranges are read from the base.
+
+    Copying an overlay shares its pieces until either copy is changed, so copies are O(1). This makes
+    snapshots of an edit session cheap, and lets many variants of an image share one base.
+    The base is expected not to change while overlays of it are in use.
+    """
+
+    def __init__(self, base: Stream) -> None:
+        super().__init__()
+        self.stream: Stream = base
+        self.stream_size = base.stream_size
+        # (data, start, size) where data is None for a range of the base, or the written bytes
+        self._pieces: "list[tuple[bytes | None, int, int]]" = []
+        self._piece_offsets: "list[int]" = []
+        if base.stream_size > 0:
+            self._pieces.append((None, 0, base.stream_size))
+            self._piece_offsets.append(0)
+        self._shared = False
+
+    def copy(self) -> "OverlayStream":
+        overlay = OverlayStream.__new__(OverlayStream)
+        Stream.__init__(overlay)
+        overlay.stream = self.stream
+        overlay.stream_size = self.stream_size
+        overlay._pieces = self._pieces
+        overlay._piece_offsets = self._piece_offsets
+        overlay._shared = self._shared = True
+        return overlay
+
+    def get_changed_extents(self) -> "list[tuple[int, int]]":
+        """
+        Get the (offset, size) ranges of the view that don't come from the base, sorted by offset.
+        """
+        extents: "list[tuple[int, int]]" = []
+        for (data, _, size), offset in zip(self._pieces, self._piece_offsets):
+            if data is None:
+                continue
+            if len(extents) > 0 and sum(extents[-1]) == offset:
+                extents[-1] = (extents[-1][0], extents[-1][1] + size)
+            else:
+                extents.append((offset, size))
+        return extents
+
+    def _unshare(self):
+        if self._shared:
+            self._pieces = list(self._pieces)
+            self._piece_offsets = list(self._piece_offsets)
+            self._shared = False
+
+    def _update_offsets(self, index: int):
+        offset = 0
+        if index > 0:
+            offset = self._piece_offsets[index - 1] + self._pieces[index - 1][2]
+        del self._piece_offsets[index:]
+        for _, _, size in self._pieces[index:]:
+            self._piece_offsets.append(offset)
+            offset += size
+        self.stream_size = offset
+
+    def _split(self, offset: int) -> int:
+        """
+        Make sure a piece starts at offset and return its index.
+        """
+        index = bisect.bisect_right(self._piece_offsets, offset) - 1
+        if index < 0:
+            return 0
+        piece_offset = self._piece_offsets[index]
+        data, start, size = self._pieces[index]
+        if offset == piece_offset:
+            return index
+        if offset >= piece_offset + size:
+            return index + 1
+
+        head_size = offset - piece_offset
+        self._pieces[index : index + 1] = [
+            (data, start, head_size),
+            (data, start + head_size, size - head_size),
+        ]
+        self._piece_offsets.insert(index + 1, offset)
+        return index + 1
+
+    def _pad_to(self, offset: int):
+        if offset > self.stream_size:
+            self._pieces.append((bytes(offset - self.stream_size), 0, offset - self.stream_size))
+            self._update_offsets(len(self._pieces) - 1)
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        count = max(0, min(count, self.stream_size - offset))
+        data = bytearray()
+        index = max(0, bisect.bisect_right(self._piece_offsets, offset) - 1)
+        end_offset = offset + count
+        while offset < end_offset:
+            piece_data, start, size = self._pieces[index]
+            skip = offset - self._piece_offsets[index]
+            read_size = min(size - skip, end_offset - offset)
+            if piece_data is None:
+                data += self.stream.get_bytes_at_offset(start + skip, read_size)
+            else:
+                data += piece_data[start + skip : start + skip + read_size]
+            offset += read_size
+            index += 1
+        return data
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        value = bytes(value)
+        if len(value) == 0:
+            return 0
+        self._unshare()
+        self._pad_to(offset)
+        start_index = self._split(offset)
+        end_index = self._split(min(offset + len(value), self.stream_size))
+        self._pieces[start_index:end_index] = [(value, 0, len(value))]
+        self._update_offsets(start_index)
+        return len(value)
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        data = bytes(data)
+        self._unshare()
+        self._pad_to(offset)
+        index = self._split(offset)
+        self._pieces.insert(index, (data, 0, len(data)))
+        self._update_offsets(index)
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        self._unshare()
+        start_index = self._split(offset)
+        end_index = self._split(min(offset + byte_count, self.stream_size))
+        del self._pieces[start_index:end_index]
+        self._update_offsets(start_index)
+
+
 class MMapStream(Stream):
     def __init__(self, stream: mmap) -> None:
         super().__init__()
         self.stream: mmap = stream
         self.stream_size = stream.size()
 
-    def copy(self) -> Self:
-        pass
+    def copy(self) -> OverlayStream:
+        return OverlayStream(self)
 
     def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
-        self.stream.seek(offset)
-        return bytearray(self.stream.read(count))
+        # slicing doesn't move the mmap's file position, unlike seek + read
+        return bytearray(self.stream[offset : offset + count])
 
     def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
-        self.stream.seek(offset)
-        self.stream.write(value)
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+        self.stream[offset : offset + len(value)] = value
+        return len(value)
 
     def insert_into_stream(self, offset: int, data: bytearray):
         byte_count = len(data)
@@ -176,8 +476,8 @@ class MemoryStream(Stream):
         self.stream = stream
         self.stream_size = len(stream)
 
-    def copy(self) -> Self:
-        return bytearray(self.stream)
+    def copy(self) -> "MemoryStream":
+        return MemoryStream(bytearray(self.stream))
 
     def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
         return self.stream[offset : offset + count]
@@ -188,8 +488,10 @@ class MemoryStream(Stream):
         add_bytes = (offset + byte_count) - self.stream_size
         if add_bytes > 0:
             self.stream.extend([0] * add_bytes)
+            self.stream_size += add_bytes
 
         self.stream[offset : offset + byte_count] = value
+        return byte_count
 
     def insert_into_stream(self, offset: int, data: bytearray):
         stream_size_change = len(data)
@@ -204,3 +506,217 @@ class MemoryStream(Stream):
     def delete_from_stream(self, offset: int, byte_count: int):
         self.stream[offset:] = self.stream[offset + byte_count :]
         self.stream_size -= byte_count
+
+
+class FileStream(Stream):
+    """
+    A stream that reads and writes a file with positional reads and writes instead of mapping it.
+    This keeps the address space and page cache use of each open image small.
+
+    Reads go through an LRU cache of block aligned reads, large reads skip the cache.
+    Writes are buffered and written back once the buffer is full, or when the stream is flushed or closed.
+    The cache and write buffer are guarded by a lock, the reads themselves run without it.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        block_size: int = 0x8000,
+        cache_size: int = 256,
+        write_buffer_size: int = 0x400000,
+    ) -> None:
+        super().__init__()
+        self.stream: BinaryIO = stream
+        self.stream_size = os.fstat(stream.fileno()).st_size
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self.write_buffer_size = write_buffer_size
+        self.read_ahead = 0
+
+        self._block_cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._pending_writes: "list[tuple[int, bytearray]]" = []
+        self._pending_write_bytes = 0
+        self._cache_generation = 0
+        self._lock = threading.RLock()
+
+    def _pread(self, offset: int, count: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self.stream.fileno(), count, offset)
+        with self._lock:
+            self.stream.seek(offset)
+            return self.stream.read(count)
+
+    def _pwrite(self, offset: int, value: bytes):
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.stream.fileno(), value, offset)
+        else:
+            with self._lock:
+                self.stream.seek(offset)
+                self.stream.write(value)
+
+    def _read_block(self, block: int) -> bytes:
+        with self._lock:
+            if block in self._block_cache:
+                self._block_cache.move_to_end(block)
+                return self._block_cache[block]
+            cache_generation = self._cache_generation
+
+        # read ahead in one call and cache every block we got back
+        read_bytes = self._pread(block * self.block_size, (1 + self.read_ahead) * self.block_size)
+        with self._lock:
+            # skip caching if a flush changed the file while we were reading
+            if cache_generation == self._cache_generation:
+                for i in range(0, max(len(read_bytes), 1), self.block_size):
+                    cached_block = block + i // self.block_size
+                    self._block_cache[cached_block] = read_bytes[i : i + self.block_size]
+
+                while len(self._block_cache) > self.cache_size:
+                    self._block_cache.popitem(last=False)
+        return read_bytes[: self.block_size]
+
+    def advise(self, access_pattern: str):
+        """
+        Hint how the stream will be read, similar to madvise.
+        'sequential' reads ahead a number of blocks on each cache miss, 'random' and 'normal' don't.
+        """
+        if access_pattern == "sequential":
+            self.read_ahead = max(1, min(self.cache_size // 4, 0x100000 // self.block_size))
+        elif access_pattern in ("random", "normal"):
+            self.read_ahead = 0
+        else:
+            raise ValueError(f"Unknown access pattern: {access_pattern}")
+
+        if hasattr(os, "posix_fadvise"):
+            advice = {
+                "sequential": os.POSIX_FADV_SEQUENTIAL,
+                "random": os.POSIX_FADV_RANDOM,
+                "normal": os.POSIX_FADV_NORMAL,
+            }[access_pattern]
+            os.posix_fadvise(self.stream.fileno(), 0, 0, advice)
+
+    def copy(self) -> OverlayStream:
+        return OverlayStream(self)
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        # take the pending writes first so a flush while we read can't hide them
+        with self._lock:
+            pending_writes = list(self._pending_writes)
+
+        count = max(0, min(count, self.stream_size - offset))
+        block, block_offset = divmod(offset, self.block_size)
+        if block_offset + count <= self.block_size and len(pending_writes) == 0:
+            block_bytes = self._read_block(block)
+            if len(block_bytes) >= block_offset + count:
+                return bytearray(block_bytes[block_offset : block_offset + count])
+
+        if count >= self.block_size * 4:
+            data = bytearray(self._pread(offset, count))
+        else:
+            data = bytearray()
+            current_offset = offset
+            end_offset = offset + count
+            while current_offset < end_offset:
+                block, block_offset = divmod(current_offset, self.block_size)
+                size = min(self.block_size - block_offset, end_offset - current_offset)
+                block_bytes = self._read_block(block)[block_offset : block_offset + size]
+                data.extend(block_bytes)
+                if len(block_bytes) < size:
+                    data.extend(bytes(size - len(block_bytes)))
+                current_offset += size
+
+        # the file may be shorter than the stream if there are pending writes past its end
+        if len(data) < count:
+            data.extend(bytes(count - len(data)))
+
+        for write_offset, value in pending_writes:
+            start = max(write_offset, offset)
+            end = min(write_offset + len(value), offset + count)
+            if start < end:
+                data[start - offset : end - offset] = value[start - write_offset : end - write_offset]
+        return data
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        with self._lock:
+            if len(self._pending_writes) > 0:
+                last_offset, last_value = self._pending_writes[-1]
+                if last_offset + len(last_value) == offset:
+                    last_value.extend(value)
+                else:
+                    self._pending_writes.append((offset, bytearray(value)))
+            else:
+                self._pending_writes.append((offset, bytearray(value)))
+
+            self._pending_write_bytes += len(value)
+            self.stream_size = max(self.stream_size, offset + len(value))
+            if self._pending_write_bytes >= self.write_buffer_size:
+                self.flush()
+        return len(value)
+
+    def flush(self):
+        """
+        Write back any buffered writes and drop the cached blocks they overlap.
+        """
+        with self._lock:
+            self._cache_generation += 1
+            for offset, value in self._pending_writes:
+                self._pwrite(offset, value)
+                first_block = offset // self.block_size
+                last_block = (offset + len(value) - 1) // self.block_size
+                for block in list(self._block_cache.keys()):
+                    if first_block <= block <= last_block:
+                        del self._block_cache[block]
+
+            self._pending_writes = []
+            self._pending_write_bytes = 0
+
+    def _move(self, destination: int, source: int, count: int, chunk_size: int = 0x100000):
+        """
+        Move a range of bytes in the file, copying from the end when moving forward
+        so we don't overwrite data we haven't copied yet.
+        """
+        chunks = range(0, count, chunk_size)
+        if destination > source:
+            chunks = reversed(chunks)
+
+        for chunk_offset in chunks:
+            size = min(chunk_size, count - chunk_offset)
+            self._pwrite(destination + chunk_offset, self._pread(source + chunk_offset, size))
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        with self._lock:
+            self.flush()
+            self._block_cache.clear()
+
+            byte_count = len(data)
+            if self.stream_size < offset:
+                byte_count += offset - self.stream_size
+                data = bytes(offset - self.stream_size) + bytes(data)
+                offset = self.stream_size
+
+            self._move(offset + byte_count, offset, self.stream_size - offset)
+            self._pwrite(offset, bytes(data))
+            self.stream_size += byte_count
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        with self._lock:
+            self.flush()
+            self._block_cache.clear()
+
+            end_offset = offset + byte_count
+            self._move(offset, end_offset, self.stream_size - end_offset)
+            self.stream_size -= byte_count
+            os.ftruncate(self.stream.fileno(), self.stream_size)
+
+    def close(self):
+        if self.stream is not None and not self.stream.closed:
+            if self.stream.writable():
+                self.flush()
+            self.stream.close()
+
+    @staticmethod
+    def from_file(path: Path, writable: bool = False, **kwargs):
+        """
+        Open a file as a FileStream, any extra arguments are passed to the stream.
+        """
+        file = Path(path).open("r+b" if writable else "rb")
+        return FileStream(file, **kwargs)
@@ -6,6 +6,9 @@ from .disc_header import DiscHeader
 from .disc_header_information import DiscHeaderInformation
 from .app_loader import AppLoader
 from .rel import *
+from .ciso import CISOStream
+from .gcz import GCZStream
+from .fst_cache import FSTCache
 
 gamecube_file_types: "dict[str, type]" = {}
 
@@ -33,4 +36,19 @@ REGION = {
     0x4A: "JP",
 }
 
-from .iso import *
\ No newline at end of file
+from .layout import AccessTrace, LayoutOptimizer, LayoutReport
+from .junk import JunkGenerator
+from .diff import FileDiff, ImageComparer, ImageDiff
+from .iso import *
+from .virtual_image import VirtualImageView
+from .image_builder import DirectoryImageBuilder
+from .watcher import ImageWatcher
+
+
+def __getattr__(name: str):
+    # asyncio is slow to import and only needed by the async wrapper, so load it on first use
+    if name == "AsyncGamecubeISO":
+        from .async_iso import AsyncGamecubeISO
+
+        return AsyncGamecubeISO
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,19 @@
 from .. import MemoryStream, AbstractFile
 
+SizeOffset = 0x14
+TrailerSizeOffset = 0x18
+HeaderSize = 0x20
+
 
 class AppLoader(AbstractFile):
     def __init__(self, app_loader: MemoryStream) -> None:
         super().__init__("appldr.bin", app_loader)
+
+    def get_app_loader_size(self) -> int:
+        """
+        Get the size of the apploader code as given by its header.
+        This is usually smaller than the area we load, which runs up to the FST.
+        """
+        size = self.file_contents.get_int_at_offset(SizeOffset)
+        trailer_size = self.file_contents.get_int_at_offset(TrailerSizeOffset)
+        return min(HeaderSize + size + trailer_size, self.file_contents.stream_size)
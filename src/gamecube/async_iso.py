@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Callable, TypeVar
+
+from . import GamecubeISO
+from .. import AbstractFile, OperationCancelled
+
+T = TypeVar("T")
+
+
+class AsyncGamecubeISO:
+    """
+    An asyncio wrapper around GamecubeISO.
+    Blocking reads, writes and compression run on a bounded executor so the event loop stays free,
+    and a semaphore limits how many jobs each image can have in flight at once.
+    Cancelling a task stops the work at the next file, or for saves at the next read or write.
+    Closing the image stops the jobs the same way and waits for them before the image is closed.
+    """
+
+    def __init__(
+        self, iso: GamecubeISO, executor: Executor = None, max_concurrency: int = 4
+    ) -> None:
+        self.iso = iso
+        self.max_concurrency = max_concurrency
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_concurrency)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # jobs submitted to the executor and the cancel events of running saves, for close
+        self._jobs: "set[Future]" = set()
+        self._cancel_events: "set[threading.Event]" = set()
+
+    @classmethod
+    async def open(
+        cls,
+        path: "Path | str",
+        backend: str = "mmap",
+        executor: Executor = None,
+        max_concurrency: int = 4,
+    ) -> "AsyncGamecubeISO":
+        """
+        Open an image without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        iso = await loop.run_in_executor(executor, GamecubeISO.open_image_file, path, backend)
+        return cls(iso, executor, max_concurrency)
+
+    async def _run(self, function: "Callable[..., T]", *args) -> T:
+        async with self._semaphore:
+            job = self._executor.submit(function, *args)
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+            return await asyncio.wrap_future(job)
+
+    async def open_file(self, file_name: str) -> AbstractFile:
+        return await self._run(self.iso.open_file, file_name)
+
+    async def iter_files(self) -> "AsyncIterator[tuple[str, AbstractFile]]":
+        """
+        Iterate over the (path, file) pairs of every file in the FST.
+        A few files are read ahead of the consumer, but no more than the concurrency limit.
+        """
+        loop = asyncio.get_running_loop()
+        pending_files = deque()
+        try:
+            for file_path, entry in self.iso.table_of_contents.get_fst_file_paths():
+                task = loop.create_task(self._run(self.iso._extract_file_by_entry, entry))
+                pending_files.append((file_path, task))
+                if len(pending_files) >= self.max_concurrency:
+                    file_path, task = pending_files.popleft()
+                    yield file_path, await task
+
+            while len(pending_files) > 0:
+                file_path, task = pending_files.popleft()
+                yield file_path, await task
+        finally:
+            for _, task in pending_files:
+                task.cancel()
+
+    def __aiter__(self) -> "AsyncIterator[tuple[str, AbstractFile]]":
+        return self.iter_files()
+
+    async def extract_to(self, directory: "Path | str") -> int:
+        """
+        Extract every file in the FST into a directory, keeping the directory structure of the disc.
+        Returns the number of files extracted.
+        """
+        directory = Path(directory)
+
+        def extract_file(file_path: str, entry) -> None:
+            out_path = directory.joinpath(file_path)
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            with out_path.open("wb") as out_file:
+                out_file.write(self.iso._extract_file_by_entry(entry).to_bytes())
+
+        file_paths = self.iso.table_of_contents.get_fst_file_paths()
+        remaining_files = iter(file_paths)
+
+        async def extract_worker():
+            for file_path, entry in remaining_files:
+                await self._run(extract_file, file_path, entry)
+
+        # each worker has at most one file in flight, so the number of workers bounds the work queued
+        workers = [asyncio.ensure_future(extract_worker()) for _ in range(self.max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            raise
+        return len(file_paths)
+
+    async def save_to_disk(self, path: "Path | str", image_format: str = "iso"):
+        """
+        Build and save the image on the executor. If the task is cancelled the build is stopped
+        at its next read or write and the partial output is removed.
+        """
+        cancel_event = threading.Event()
+        self._cancel_events.add(cancel_event)
+        save_task = asyncio.ensure_future(
+            self._run(self.iso.save_to_disk, path, image_format, cancel_event)
+        )
+        try:
+            await asyncio.shield(save_task)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            # wait for the worker to stop so we don't remove the file while it is still writing
+            try:
+                await save_task
+            except BaseException:
+                pass
+            Path(path).unlink(missing_ok=True)
+            raise
+        except OperationCancelled:
+            # the image was closed during the save
+            Path(path).unlink(missing_ok=True)
+            raise
+        finally:
+            self._cancel_events.discard(cancel_event)
+
+    async def close(self):
+        """
+        Stop the saves in progress and the jobs that haven't started, wait for the jobs that are
+        still running to finish and close the image.
+        """
+        for cancel_event in self._cancel_events:
+            cancel_event.set()
+        jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+        # the stream can't be closed while a worker might still read from it
+        await asyncio.gather(*(asyncio.wrap_future(job) for job in jobs), return_exceptions=True)
+        if self._owns_executor:
+            self._executor.shutdown()
+        self.iso.file_contents.close()
+
+    async def __aenter__(self) -> "AsyncGamecubeISO":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -0,0 +1,167 @@
+from pathlib import Path
+
+from .. import OverlayStream, Stream
+
+
+class CISOStream(Stream):
+    """
+    CISO images split the disc into fixed size blocks and leave out every block that is all zeros.
+    The 0x8000 byte header holds the block size and a map with one byte per block,
+    the blocks that are present are stored in order right after the header.
+
+    This stream translates logical disc offsets through the block map so it can be used
+    anywhere a raw image stream is expected. Missing blocks read back as zeros.
+    """
+
+    MAGIC = b"CISO"
+    HEADER_SIZE = 0x8000
+    MAP_SIZE = HEADER_SIZE - 8
+    MIN_BLOCK_SIZE = 0x8000
+    UNUSED_BLOCK = -1
+
+    def __init__(self, image: Stream) -> None:
+        super().__init__()
+        if not CISOStream.is_ciso_image(image):
+            raise ValueError("Stream does not contain a CISO image.")
+
+        self.stream: Stream = image
+        self.block_size = int.from_bytes(image.get_bytes_at_offset(4, 4), "little")
+
+        block_map = image.get_bytes_at_offset(8, self.MAP_SIZE)
+        self.block_map: "list[int]" = []
+        last_used_block = -1
+        physical_block = 0
+        for block, used in enumerate(block_map):
+            if used == 1:
+                self.block_map.append(physical_block)
+                physical_block += 1
+                last_used_block = block
+            else:
+                self.block_map.append(self.UNUSED_BLOCK)
+
+        # the format doesn't record the disc size, trailing empty blocks are implied
+        self.stream_size = (last_used_block + 1) * self.block_size
+
+    @staticmethod
+    def is_ciso_image(image: Stream) -> bool:
+        return image.stream_size >= CISOStream.HEADER_SIZE and bytes(
+            image.get_bytes_at_offset(0, 4)
+        ) == CISOStream.MAGIC
+
+    def _get_block_runs(self, offset: int, count: int):
+        """
+        Split a logical range into runs of (logical offset, size, physical offset).
+        Consecutive blocks that are stored next to each other are merged into a single run,
+        missing blocks have a physical offset of -1.
+        """
+        end_offset = min(offset + count, self.stream_size)
+        runs = []
+        while offset < end_offset:
+            block, block_offset = divmod(offset, self.block_size)
+            size = min(self.block_size - block_offset, end_offset - offset)
+            physical_block = self.block_map[block]
+            if physical_block == self.UNUSED_BLOCK:
+                physical_offset = self.UNUSED_BLOCK
+            else:
+                physical_offset = (
+                    self.HEADER_SIZE + physical_block * self.block_size + block_offset
+                )
+
+            if len(runs) > 0:
+                last_offset, last_size, last_physical = runs[-1]
+                contiguous = (
+                    last_physical + last_size == physical_offset
+                    if last_physical != self.UNUSED_BLOCK
+                    else physical_offset == self.UNUSED_BLOCK
+                )
+                if contiguous:
+                    runs[-1] = (last_offset, last_size + size, last_physical)
+                    offset += size
+                    continue
+
+            runs.append((offset, size, physical_offset))
+            offset += size
+        return runs
+
+    def copy(self) -> OverlayStream:
+        return OverlayStream(self)
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        data = bytearray()
+        for _, size, physical_offset in self._get_block_runs(offset, count):
+            if physical_offset == self.UNUSED_BLOCK:
+                data.extend(bytes(size))
+            else:
+                data.extend(self.stream.get_bytes_at_offset(physical_offset, size))
+        return data
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        """
+        Writes are only possible to blocks that are stored in the image, filling in an empty block
+        would require moving every block that comes after it. Save the image again instead.
+        """
+        runs = self._get_block_runs(offset, len(value))
+        if any(physical_offset == self.UNUSED_BLOCK for _, _, physical_offset in runs):
+            raise NotImplementedError("Cannot write to a block that is not stored in the CISO image.")
+
+        for run_offset, size, physical_offset in runs:
+            value_offset = run_offset - offset
+            self.stream.write_bytes_at_offset(
+                physical_offset, value[value_offset : value_offset + size]
+            )
+        return len(value)
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        raise NotImplementedError("CISO images can't be resized in place.")
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        raise NotImplementedError("CISO images can't be resized in place.")
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    @staticmethod
+    def get_block_size(image_size: int) -> int:
+        """
+        Get the smallest power of two block size that lets the block map cover the whole image.
+        Smaller blocks let us skip more of the empty space on the disc.
+        """
+        block_size = CISOStream.MIN_BLOCK_SIZE
+        while block_size * CISOStream.MAP_SIZE < image_size:
+            block_size *= 2
+        return block_size
+
+    @staticmethod
+    def write_image(source: Stream, path: "Path | str", block_size: int = None) -> int:
+        """
+        Write the source stream to disk as a CISO image, leaving out all blocks that only contain zeros.
+        Returns the size of the written image.
+        """
+        if block_size is None:
+            block_size = CISOStream.get_block_size(source.stream_size)
+
+        block_count = (source.stream_size + block_size - 1) // block_size
+        if block_count > CISOStream.MAP_SIZE:
+            raise ValueError(f"Block size {block_size} is too small to map the whole image.")
+
+        block_map = bytearray(CISOStream.MAP_SIZE)
+        empty_block = bytes(block_size)
+        with Path(path).open("wb") as image_file:
+            image_file.seek(CISOStream.HEADER_SIZE)
+            for block in range(block_count):
+                block_bytes = source.get_bytes_at_offset(block * block_size, block_size)
+                if len(block_bytes) < block_size:
+                    block_bytes.extend(bytes(block_size - len(block_bytes)))
+
+                if block_bytes != empty_block:
+                    block_map[block] = 1
+                    image_file.write(block_bytes)
+
+            image_size = image_file.tell()
+            image_file.seek(0)
+            image_file.write(CISOStream.MAGIC)
+            image_file.write(block_size.to_bytes(4, "little"))
+            image_file.write(block_map)
+
+        return image_size
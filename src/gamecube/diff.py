@@ -0,0 +1,303 @@
+import os
+import threading
+
+from .. import AbstractFileArchive, MemoryStream, Stream
+from . import FSTFile
+
+
+class FileDiff:
+    """
+    A file that differs between two images. Kind is 'added' or 'removed' for a path only one image
+    has, 'resized' for a file whose size changed, 'modified' for a file of the same size with
+    different contents, with the offset of the first byte that differs, or 'moved' for a file
+    with the same contents at another offset. Offsets and sizes are None for the image without it.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        path: str,
+        old_offset: int = None,
+        old_size: int = None,
+        new_offset: int = None,
+        new_size: int = None,
+        first_difference: int = None,
+    ) -> None:
+        self.kind = kind
+        self.path = path
+        self.old_offset = old_offset
+        self.old_size = old_size
+        self.new_offset = new_offset
+        self.new_size = new_size
+        self.first_difference = first_difference
+
+    def to_json_obj(self) -> dict:
+        return {
+            "kind": self.kind,
+            "path": self.path,
+            "old_offset": self.old_offset,
+            "old_size": self.old_size,
+            "new_offset": self.new_offset,
+            "new_size": self.new_size,
+            "first_difference": self.first_difference,
+        }
+
+
+class ImageDiff:
+    """
+    The differences between two images, as the files that differ in FST order and the names of
+    the system files that differ, out of boot.bin, bi2.bin, apploader.img, main.dol and fst.bin.
+    The diff isn't complete if it stopped at the first difference, then files may be missing.
+    """
+
+    def __init__(self) -> None:
+        self.files: "list[FileDiff]" = []
+        self.system_files: "list[str]" = []
+        self.compared_files = 0
+        self.skipped_files = 0
+        self.bytes_read = 0
+        self.complete = True
+
+    def get_files(self, kind: str) -> "list[FileDiff]":
+        return [f for f in self.files if f.kind == kind]
+
+    def is_identical(self) -> bool:
+        return self.complete and len(self.files) == 0 and len(self.system_files) == 0
+
+    def to_json_obj(self) -> dict:
+        return {
+            "identical": self.is_identical(),
+            "complete": self.complete,
+            "system_files": self.system_files,
+            **{kind: [f.to_json_obj() for f in self.get_files(kind)] for kind in ImageComparer.KINDS},
+            "compared_files": self.compared_files,
+            "skipped_files": self.skipped_files,
+            "bytes_read": self.bytes_read,
+        }
+
+
+class ImageComparer:
+    """
+    Compares two images file by file. The FSTs are matched by path, files that were added, removed
+    or resized are reported from the FSTs alone, and the rest are compared a chunk at a time on a
+    thread pool, stopping at the first chunk that differs. Files with pending changes are always
+    compared, as the image would save them. Files that both images read from the same extent of
+    the same image file without pending changes are the same and aren't read at all, so comparing
+    an opened image with the changes made to it only reads the changed files.
+    """
+
+    KINDS = ("added", "removed", "moved", "resized", "modified")
+
+    def __init__(
+        self, old_image, new_image, threads: int = None, chunk_size: int = 0x100000
+    ) -> None:
+        self.old_image = old_image
+        self.new_image = new_image
+        self.threads = threads if threads is not None else min(8, os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self._stop = threading.Event()
+
+    def _shares_source(self) -> bool:
+        old_image, new_image = self.old_image, self.new_image
+        if old_image.file_contents is new_image.file_contents:
+            return True
+        if old_image.image_path is None or new_image.image_path is None:
+            return False
+        try:
+            return os.path.samefile(old_image.image_path, new_image.image_path)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _get_changed_contents(image, entry: FSTFile) -> "Stream | None":
+        file_name = str(entry.filename)
+        file = image.extracted_archive_files.get(file_name)
+        if file_name not in image.dirty_files or file is None:
+            return None
+        if isinstance(file, AbstractFileArchive):
+            file_contents = MemoryStream()
+            file.build_archive(file_contents)
+            return file_contents
+        return MemoryStream(file.to_bytes())
+
+    def _get_source(self, image, entry: FSTFile) -> "tuple[Stream, int, int]":
+        """
+        Get the stream a file is read from, its offset in the stream and its size.
+        """
+        changed_contents = self._get_changed_contents(image, entry)
+        if changed_contents is not None:
+            return changed_contents, 0, changed_contents.stream_size
+        return image.file_contents, entry.old_offset, entry.old_size
+
+    @staticmethod
+    def _find_difference(old_bytes: bytearray, new_bytes: bytearray) -> int:
+        # narrow down the first difference with slice comparisons, which run at memcmp speed
+        start, end = 0, min(len(old_bytes), len(new_bytes))
+        while end - start > 64:
+            middle = (start + end) // 2
+            if old_bytes[start:middle] != new_bytes[start:middle]:
+                end = middle
+            else:
+                start = middle
+        for i in range(start, end):
+            if old_bytes[i] != new_bytes[i]:
+                return i
+        return end
+
+    def _compare_sources(
+        self, old_source: "tuple[Stream, int, int]", new_source: "tuple[Stream, int, int]"
+    ) -> "tuple[int | None, int]":
+        """
+        Get the offset of the first byte that differs, or None if the contents are the same,
+        along with the number of bytes read.
+        """
+        old_stream, old_offset, size = old_source
+        new_stream, new_offset, _ = new_source
+        bytes_read = 0
+        for offset in range(0, size, self.chunk_size):
+            if self._stop.is_set():
+                break
+            count = min(self.chunk_size, size - offset)
+            old_bytes = old_stream.get_bytes_at_offset(old_offset + offset, count)
+            new_bytes = new_stream.get_bytes_at_offset(new_offset + offset, count)
+            bytes_read += len(old_bytes) + len(new_bytes)
+            if old_bytes != new_bytes:
+                return offset + self._find_difference(old_bytes, new_bytes), bytes_read
+        return None, bytes_read
+
+    def _compare_file(
+        self, path: str, old_entry: FSTFile, new_entry: FSTFile
+    ) -> "tuple[FileDiff | None, int]":
+        file_diff = FileDiff(
+            "modified", path, old_entry.data_offset, None, new_entry.data_offset, None
+        )
+        old_source = self._get_source(self.old_image, old_entry)
+        new_source = self._get_source(self.new_image, new_entry)
+        file_diff.old_size, file_diff.new_size = old_source[2], new_source[2]
+        if file_diff.old_size != file_diff.new_size:
+            file_diff.kind = "resized"
+            return file_diff, 0
+
+        first_difference, bytes_read = self._compare_sources(old_source, new_source)
+        if first_difference is None and self._stop.is_set():
+            # the comparison was cut short, so the file can't be reported as the same
+            return None, bytes_read
+        if first_difference is not None:
+            file_diff.first_difference = first_difference
+        elif file_diff.old_offset != file_diff.new_offset:
+            file_diff.kind = "moved"
+        else:
+            return None, bytes_read
+        return file_diff, bytes_read
+
+    def _is_changed(self, old_entry: FSTFile, new_entry: FSTFile) -> bool:
+        return (
+            str(old_entry.filename) in self.old_image.dirty_files
+            or str(new_entry.filename) in self.new_image.dirty_files
+        )
+
+    def _compare_system_files(self, diff: ImageDiff, shares_source: bool):
+        old_image, new_image = self.old_image, self.new_image
+        if shares_source and not old_image.is_system_dirty() and not new_image.is_system_dirty():
+            return
+        system_files = {
+            "boot.bin": lambda image: image.disc_header.to_bytes(),
+            "bi2.bin": lambda image: image.disc_header_information.to_bytes(),
+            "apploader.img": lambda image: image.app_loader.to_bytes(),
+            "main.dol": lambda image: image.dol.to_bytes(),
+            "fst.bin": lambda image: image.table_of_contents.to_bytes(),
+        }
+        for name, get_bytes in system_files.items():
+            if get_bytes(old_image) != get_bytes(new_image):
+                diff.system_files.append(name)
+
+    def compare(self, stop_at_first_difference: bool = False) -> ImageDiff:
+        """
+        Compare the images. If stop_at_first_difference is set, files stop being compared once
+        one difference is found, for when all that matters is whether the images are the same.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        diff = ImageDiff()
+        self._stop.clear()
+        shares_source = self._shares_source()
+        self._compare_system_files(diff, shares_source)
+
+        old_files = dict(self.old_image.table_of_contents.get_fst_file_paths())
+        new_files = dict(self.new_image.table_of_contents.get_fst_file_paths())
+
+        file_diffs: "dict[str, FileDiff]" = {}
+        for path, entry in old_files.items():
+            if path not in new_files:
+                file_diffs[path] = FileDiff("removed", path, entry.data_offset, entry.data_size)
+        for path, entry in new_files.items():
+            if path not in old_files:
+                file_diffs[path] = FileDiff(
+                    "added", path, new_offset=entry.data_offset, new_size=entry.data_size
+                )
+
+        compared_paths = []
+        for path, old_entry in old_files.items():
+            new_entry = new_files.get(path)
+            if new_entry is None:
+                continue
+            if self._is_changed(old_entry, new_entry):
+                compared_paths.append(path)
+            elif old_entry.old_size != new_entry.old_size:
+                file_diffs[path] = FileDiff(
+                    "resized",
+                    path,
+                    old_entry.data_offset,
+                    old_entry.old_size,
+                    new_entry.data_offset,
+                    new_entry.old_size,
+                )
+            elif shares_source and old_entry.old_offset == new_entry.old_offset:
+                # both images read the file from the same bytes of the same image file
+                diff.skipped_files += 1
+                if old_entry.data_offset != new_entry.data_offset:
+                    file_diffs[path] = FileDiff(
+                        "moved",
+                        path,
+                        old_entry.data_offset,
+                        old_entry.data_size,
+                        new_entry.data_offset,
+                        new_entry.data_size,
+                    )
+            else:
+                compared_paths.append(path)
+        # files are compared in the order they're laid out, so reads sweep the image
+        compared_paths.sort(key=lambda p: old_files[p].old_offset)
+        found_difference = len(file_diffs) > 0 or len(diff.system_files) > 0
+        if stop_at_first_difference and found_difference and len(compared_paths) > 0:
+            compared_paths = []
+            diff.complete = False
+
+        instrumentation = self.new_image.instrumentation
+        with instrumentation.phase("compare", total=len(compared_paths)) as phase:
+
+            def compare_file(path: str):
+                if self._stop.is_set():
+                    return None, 0
+                file_diff, bytes_read = self._compare_file(path, old_files[path], new_files[path])
+                if file_diff is not None and stop_at_first_difference:
+                    self._stop.set()
+                return file_diff, bytes_read
+
+            with ThreadPoolExecutor(self.threads) as executor:
+                for path, (file_diff, bytes_read) in zip(
+                    compared_paths, executor.map(compare_file, compared_paths)
+                ):
+                    phase.update(files=1, bytes_read=bytes_read)
+                    diff.bytes_read += bytes_read
+                    if file_diff is not None:
+                        file_diffs[path] = file_diff
+            diff.compared_files = len(compared_paths)
+            if self._stop.is_set():
+                diff.complete = False
+            phase.annotate(differences=len(file_diffs))
+
+        # files are reported in the FST order of the old image, then added files in that of the new one
+        order = {path: i for i, path in enumerate(list(old_files) + list(new_files))}
+        diff.files = sorted(file_diffs.values(), key=lambda f: order[f.path])
+        return diff
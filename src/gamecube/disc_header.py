@@ -10,22 +10,28 @@ DOLOffset = 0x0420
 FSTOffset = 0x0424
 SizeOfFSTOffset = 0x0428
 MaxSizeOfFSTOffset = 0x042C
+# the game code, country code, maker, disc number and version
+GameIDFormat = ">2sB2sBB"
+# the DOL offset, FST offset, FST size and maximum FST size
+LayoutFormat = ">IIII"
 
 
 class DiscHeader(AbstractFile):
     def __init__(self, app_header: Stream) -> None:
         super().__init__("boot.bin", app_header)
-        self.game_code = app_header.get_bytes_at_offset(GamecodeOffset, 2)
-        self.country_code = app_header.get_byte_at_offset(CountyCodeOffset)
-        self.maker_id = app_header.get_bytes_at_offset(MakerOffset, 2)
-        self.disk_id = app_header.get_byte_at_offset(DiskIDOffset)
-        self.version = app_header.get_byte_at_offset(VersionOffset)
+        game_code, country_code, maker_id, disk_id, version = app_header.read_struct(
+            GameIDFormat, GamecodeOffset
+        )
+        self.game_code = bytearray(game_code)
+        self.country_code = country_code
+        self.maker_id = bytearray(maker_id)
+        self.disk_id = disk_id
+        self.version = version
         self.game_name = app_header.get_string_at_offset(GameNameOffset)
 
-        self.dol_offset = app_header.get_int_at_offset(DOLOffset)
-        self.fst_offset = app_header.get_int_at_offset(FSTOffset)
-        self.fst_size = app_header.get_int_at_offset(SizeOfFSTOffset)
-        self.fst_max_size = app_header.get_int_at_offset(MaxSizeOfFSTOffset)
+        self.dol_offset, self.fst_offset, self.fst_size, self.fst_max_size = app_header.read_struct(
+            LayoutFormat, DOLOffset
+        )
 
     def to_json_obj(self) -> dict:
         return {
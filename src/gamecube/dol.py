@@ -40,6 +40,8 @@ DataSizeStartOffset = 0xAC
 BSSAddressOffset = 0xD8
 BSSSizeOffset = 0xDC
 EntryPointOffset = 0xE0
+# the section offsets, load addresses and sizes followed by the BSS address, BSS size and entry point
+DOLHeaderFormat = ">7I11I7I11I7I11IIII"
 
 
 class DOL(AbstractFile):
@@ -54,26 +56,18 @@ class DOL(AbstractFile):
         self.text_sections: "list[DOLTextSection]" = []
         self.data_sections: "list[DOLDataSection]" = []
 
-        self.bss_address = header_bytes.get_int_at_offset(BSSAddressOffset)
-        self.bss_size = header_bytes.get_int_at_offset(BSSSizeOffset)
-        self.entry_point = header_bytes.get_int_at_offset(EntryPointOffset)
+        header = header_bytes.read_struct(DOLHeaderFormat, 0)
+        text_offsets, data_offsets = header[0:7], header[7:18]
+        text_addresses, data_addresses = header[18:25], header[25:36]
+        text_sizes, data_sizes = header[36:43], header[43:54]
+        self.bss_address, self.bss_size, self.entry_point = header[54:57]
 
         for i in range(7):
-            offset = header_bytes.get_int_at_offset(TextSectionStartOffset + (i * 4))
-            load_address = header_bytes.get_int_at_offset(
-                TextAddressStartOffset + (i * 4)
-            )
-            size = header_bytes.get_int_at_offset(TextSizeStartOffset + (i * 4))
-            section = DOLTextSection(i, offset, load_address, size)
+            section = DOLTextSection(i, text_offsets[i], text_addresses[i], text_sizes[i])
             self.text_sections.append(section)
 
         for i in range(11):
-            offset = header_bytes.get_int_at_offset(DataSectionStartOffset + (i * 4))
-            load_address = header_bytes.get_int_at_offset(
-                DataAddressStartOffset + (i * 4)
-            )
-            size = header_bytes.get_int_at_offset(DataSizeStartOffset + (i * 4))
-            section = DOLDataSection(i, offset, load_address, size)
+            section = DOLDataSection(i, data_offsets[i], data_addresses[i], data_sizes[i])
             self.data_sections.append(section)
 
     def get_dol_size(self):
@@ -108,32 +102,21 @@ class DOL(AbstractFile):
         }
 
     def to_bytes(self) -> bytearray:
-        dol_file = MemoryStream(bytearray([0] * self.get_dol_size()))
-        for i in range(7):
-            section = self.text_sections[i]
-            dol_file.write_int_at_offset(
-                TextSectionStartOffset + (i * 4), section.offset
-            )
-            dol_file.write_int_at_offset(
-                TextAddressStartOffset + (i * 4), section.load_address
-            )
-            dol_file.write_int_at_offset(TextSizeStartOffset + (i * 4), section.size)
-            dol_file.write_bytes_at_offset(section.offset, section.contents)
-
-        for i in range(11):
-            section = self.data_sections[i]
-            dol_file.write_int_at_offset(
-                DataSectionStartOffset + (i * 4), section.offset
-            )
-            dol_file.write_int_at_offset(
-                DataAddressStartOffset + (i * 4), section.load_address
-            )
-            dol_file.write_int_at_offset(DataSizeStartOffset + (i * 4), section.size)
+        dol_file = MemoryStream(bytearray(self.get_dol_size()))
+        sections = self.text_sections + self.data_sections
+        for section in sections:
             dol_file.write_bytes_at_offset(section.offset, section.contents)
 
-        dol_file.write_int_at_offset(BSSAddressOffset, self.bss_address)
-        dol_file.write_int_at_offset(BSSSizeOffset, self.bss_size)
-        dol_file.write_int_at_offset(EntryPointOffset, self.entry_point)
+        dol_file.write_struct(
+            DOLHeaderFormat,
+            0,
+            *[section.offset for section in sections],
+            *[section.load_address for section in sections],
+            *[section.size for section in sections],
+            self.bss_address,
+            self.bss_size,
+            self.entry_point,
+        )
 
         if len(self.changes) > 0:
             for change in self.changes:
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import struct
+from pathlib import Path
+
+from . import TableOfContents
+
+
+class CachedLayout:
+    """
+    The parsed FST entries of an image, as stored in the cache.
+    """
+
+    def __init__(self, entries: "list[tuple[bool, int, int, int, bytes]]") -> None:
+        self.entries = entries
+
+
+class FSTCache:
+    """
+    An on-disk cache of parsed FSTs, so images that are opened again neither read nor walk their
+    FST. Each image gets one file in the cache directory, named after its path.
+
+    Entries are keyed by the size and mtime of the image and a hash of its disc header, which are
+    all known after reading the header, so checking an entry reads nothing else from the image.
+    The file holds a fixed header, then one record per FST entry, then the entry names.
+    """
+
+    MAGIC = b"GFST"
+    VERSION = 2
+    HEADER_FORMAT = ">4sHQQ20sI"
+    ENTRY_FORMAT = ">BIIIH"
+
+    def __init__(self, directory: "Path | str") -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _get_cache_path(self, image_path: Path) -> Path:
+        path_hash = hashlib.sha1(str(image_path.resolve()).encode()).hexdigest()
+        return self.directory.joinpath(f"{path_hash}.fst")
+
+    def _get_key(self, image_path: Path, disc_header: bytes) -> "tuple[int, int, bytes]":
+        stat = image_path.stat()
+        return stat.st_size, stat.st_mtime_ns, hashlib.sha1(disc_header).digest()
+
+    def load(self, image_path: "Path | str", disc_header: bytes) -> "CachedLayout | None":
+        """
+        Get the cached layout of an image, or None if it isn't cached or the image changed.
+        """
+        image_path = Path(image_path)
+        try:
+            cache_bytes = self._get_cache_path(image_path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+        header_size = struct.calcsize(self.HEADER_FORMAT)
+        if len(cache_bytes) < header_size:
+            return None
+        magic, version, size, mtime_ns, header_hash, entry_count = struct.unpack_from(
+            self.HEADER_FORMAT, cache_bytes
+        )
+        if magic != self.MAGIC or version != self.VERSION:
+            return None
+        if (size, mtime_ns, header_hash) != self._get_key(image_path, disc_header):
+            return None
+
+        offset = header_size
+
+        entry_size = struct.calcsize(self.ENTRY_FORMAT)
+        if len(cache_bytes) < offset + entry_count * entry_size:
+            return None
+        records = struct.iter_unpack(
+            self.ENTRY_FORMAT, cache_bytes[offset : offset + entry_count * entry_size]
+        )
+        offset += entry_count * entry_size
+
+        entries = []
+        for is_directory, name_offset, a, b, name_size in records:
+            name = cache_bytes[offset : offset + name_size]
+            entries.append((bool(is_directory), name_offset, a, b, name))
+            offset += name_size
+        return CachedLayout(entries)
+
+    def store(self, image_path: "Path | str", disc_header: bytes, table_of_contents: TableOfContents):
+        """
+        Cache the parsed FST of an image, replacing any older entry.
+        """
+        image_path = Path(image_path)
+        entries = table_of_contents.get_entries()
+        size, mtime_ns, header_hash = self._get_key(image_path, disc_header)
+
+        cache_bytes = bytearray(
+            struct.pack(
+                self.HEADER_FORMAT,
+                self.MAGIC,
+                self.VERSION,
+                size,
+                mtime_ns,
+                header_hash,
+                len(entries),
+            )
+        )
+        for is_directory, name_offset, a, b, name in entries:
+            entry_bytes = struct.pack(self.ENTRY_FORMAT, is_directory, name_offset, a, b, len(name))
+            cache_bytes += entry_bytes
+        for entry in entries:
+            cache_bytes += entry[4]
+
+        # write to a temporary file first so readers never see a partial entry
+        cache_path = self._get_cache_path(image_path)
+        temporary_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        temporary_path.write_bytes(cache_bytes)
+        os.replace(temporary_path, cache_path)
@@ -0,0 +1,210 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from .. import OverlayStream, Stream
+
+
+class GCZStream(Stream):
+    """
+    GCZ images split the disc into fixed size blocks and compress each one with zlib.
+    The header is followed by a table of block offsets and a table of adler32 hashes,
+    then the compressed blocks. Blocks that don't compress are stored as is and flagged
+    with the high bit of their offset.
+
+    Reads only inflate the blocks that overlap the requested range and keep the most recently
+    used blocks in a small cache. Writes are kept in memory and applied when the image is saved
+    again with write_image. The cache is guarded by a lock, blocks are inflated without it so
+    several threads can read at once.
+    """
+
+    MAGIC = 0xB10BC001
+    HEADER_SIZE = 0x20
+    UNCOMPRESSED_FLAG = 0x8000000000000000
+    DEFAULT_BLOCK_SIZE = 0x4000
+    GAMECUBE_SUB_TYPE = 0
+
+    def __init__(self, image: Stream, cache_size: int = 16) -> None:
+        super().__init__()
+        if not GCZStream.is_gcz_image(image):
+            raise ValueError("Stream does not contain a GCZ image.")
+
+        self.stream: Stream = image
+        header = image.get_bytes_at_offset(0, self.HEADER_SIZE)
+        self.sub_type = int.from_bytes(header[4:8], "little")
+        self.compressed_data_size = int.from_bytes(header[8:16], "little")
+        self.stream_size = int.from_bytes(header[16:24], "little")
+        self.block_size = int.from_bytes(header[24:28], "little")
+        self.block_count = int.from_bytes(header[28:32], "little")
+
+        pointer_table = image.get_bytes_at_offset(self.HEADER_SIZE, self.block_count * 8)
+        self.block_pointers: "list[int]" = [
+            int.from_bytes(pointer_table[i : i + 8], "little")
+            for i in range(0, len(pointer_table), 8)
+        ]
+        self.data_offset = self.HEADER_SIZE + self.block_count * 12
+
+        self.cache_size = cache_size
+        self._block_cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._dirty_blocks: "dict[int, bytearray]" = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def is_gcz_image(image: Stream) -> bool:
+        return image.stream_size >= GCZStream.HEADER_SIZE and (
+            int.from_bytes(image.get_bytes_at_offset(0, 4), "little") == GCZStream.MAGIC
+        )
+
+    def _read_block(self, block: int) -> bytes:
+        """
+        Get the inflated contents of a block, checking pending writes and the cache before
+        going to the image.
+        """
+        with self._lock:
+            if block in self._dirty_blocks:
+                return self._dirty_blocks[block]
+
+            if block in self._block_cache:
+                self._block_cache.move_to_end(block)
+                return self._block_cache[block]
+
+        pointer = self.block_pointers[block]
+        start_offset = pointer & ~self.UNCOMPRESSED_FLAG
+        if block + 1 < self.block_count:
+            end_offset = self.block_pointers[block + 1] & ~self.UNCOMPRESSED_FLAG
+        else:
+            end_offset = self.compressed_data_size
+
+        block_bytes = bytes(
+            self.stream.get_bytes_at_offset(
+                self.data_offset + start_offset, end_offset - start_offset
+            )
+        )
+        if not pointer & self.UNCOMPRESSED_FLAG:
+            block_bytes = zlib.decompress(block_bytes)
+
+        with self._lock:
+            if block in self._dirty_blocks:
+                return self._dirty_blocks[block]
+
+            self._block_cache[block] = block_bytes
+            if len(self._block_cache) > self.cache_size:
+                self._block_cache.popitem(last=False)
+        return block_bytes
+
+    def copy(self) -> OverlayStream:
+        return OverlayStream(self)
+
+    def get_bytes_at_offset(self, offset: int, count: int) -> bytearray:
+        end_offset = min(offset + count, self.stream_size)
+        data = bytearray()
+        while offset < end_offset:
+            block, block_offset = divmod(offset, self.block_size)
+            size = min(self.block_size - block_offset, end_offset - offset)
+            data.extend(self._read_block(block)[block_offset : block_offset + size])
+            offset += size
+        return data
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        if offset + len(value) > self.stream_size:
+            raise NotImplementedError("GCZ images can't be resized in place.")
+
+        value_offset = 0
+        while value_offset < len(value):
+            block, block_offset = divmod(offset + value_offset, self.block_size)
+            size = min(self.block_size - block_offset, len(value) - value_offset)
+            with self._lock:
+                if block not in self._dirty_blocks:
+                    self._dirty_blocks[block] = bytearray(self._read_block(block))
+                    self._block_cache.pop(block, None)
+
+                self._dirty_blocks[block][block_offset : block_offset + size] = value[
+                    value_offset : value_offset + size
+                ]
+            value_offset += size
+        return len(value)
+
+    def insert_into_stream(self, offset: int, data: bytearray):
+        raise NotImplementedError("GCZ images can't be resized in place.")
+
+    def delete_from_stream(self, offset: int, byte_count: int):
+        raise NotImplementedError("GCZ images can't be resized in place.")
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    @staticmethod
+    def _compress_block(block_bytes: bytes, compression_level: int) -> "tuple[bytes, bool]":
+        compressed_bytes = zlib.compress(block_bytes, compression_level)
+        if len(compressed_bytes) >= len(block_bytes):
+            return block_bytes, False
+        return compressed_bytes, True
+
+    @staticmethod
+    def write_image(
+        source: Stream,
+        path: "Path | str",
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        compression_level: int = 9,
+        threads: int = None,
+    ) -> int:
+        """
+        Write the source stream to disk as a GCZ image and return the size of the written image.
+        Blocks are read in order and compressed on a thread pool, zlib releases the GIL while it
+        works so this scales with the number of threads. Only a few blocks per thread are
+        in flight at any time.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if threads is None:
+            threads = os.cpu_count() or 1
+
+        block_count = (source.stream_size + block_size - 1) // block_size
+        data_offset = GCZStream.HEADER_SIZE + block_count * 12
+        block_pointers = bytearray()
+        block_hashes = bytearray()
+
+        with Path(path).open("wb") as image_file, ThreadPoolExecutor(threads) as executor:
+            image_file.seek(data_offset)
+            max_pending = threads * 4
+            pending_blocks = deque()
+            compressed_data_size = 0
+
+            def write_next_block():
+                nonlocal compressed_data_size
+                block_bytes, compressed = pending_blocks.popleft().result()
+                pointer = compressed_data_size
+                if not compressed:
+                    pointer |= GCZStream.UNCOMPRESSED_FLAG
+
+                block_pointers.extend(pointer.to_bytes(8, "little"))
+                block_hashes.extend(zlib.adler32(block_bytes).to_bytes(4, "little"))
+                image_file.write(block_bytes)
+                compressed_data_size += len(block_bytes)
+
+            for block in range(block_count):
+                block_bytes = bytes(source.get_bytes_at_offset(block * block_size, block_size))
+                pending_blocks.append(
+                    executor.submit(GCZStream._compress_block, block_bytes, compression_level)
+                )
+                if len(pending_blocks) >= max_pending:
+                    write_next_block()
+
+            while len(pending_blocks) > 0:
+                write_next_block()
+
+            image_size = image_file.tell()
+            image_file.seek(0)
+            image_file.write(GCZStream.MAGIC.to_bytes(4, "little"))
+            image_file.write(GCZStream.GAMECUBE_SUB_TYPE.to_bytes(4, "little"))
+            image_file.write(compressed_data_size.to_bytes(8, "little"))
+            image_file.write(source.stream_size.to_bytes(8, "little"))
+            image_file.write(block_size.to_bytes(4, "little"))
+            image_file.write(block_count.to_bytes(4, "little"))
+            image_file.write(block_pointers)
+            image_file.write(block_hashes)
+
+        return image_size
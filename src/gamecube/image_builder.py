@@ -0,0 +1,194 @@
+import os
+import struct
+from collections import deque
+from pathlib import Path
+
+from . import GamecubeISO, TableOfContents
+from .disc_header import DOLOffset
+from .. import MemoryStream, Stream
+
+
+class DirectoryEntry:
+    """
+    A file or directory found while scanning the source tree, in the order it goes into the FST.
+    """
+
+    def __init__(self, name: str, path: Path, parent_index: int, is_directory: bool) -> None:
+        self.name = name
+        self.path = path
+        self.parent_index = parent_index
+        self.is_directory = is_directory
+        self.next_index = 0
+        self.data_offset = 0
+        self.data_size = 0
+
+
+class DirectoryImageBuilder:
+    """
+    Packs a directory tree into a new image. The tree is either a plain directory of game files,
+    in which case the system files come from an existing image, or the sys/ and files/ layout
+    Dolphin extracts to, where sys/ holds boot.bin, bi2.bin, apploader.img and main.dol.
+
+    The FST and system area are generated from scratch in one pass over the tree, then the files
+    are streamed into the output in offset order. Files are read on a thread pool while a single
+    writer appends them with large sequential writes, only a few chunks per reader are held in memory.
+    """
+
+    SYSTEM_DIRECTORY = "sys"
+    FILES_DIRECTORY = "files"
+    APP_LOADER_NAMES = ("apploader.img", "appldr.bin")
+    CHUNK_SIZE = 0x400000
+
+    def __init__(self, directory: "Path | str", system_image: GamecubeISO = None) -> None:
+        self.directory = Path(directory)
+        system_directory = self.directory.joinpath(self.SYSTEM_DIRECTORY)
+        files_directory = self.directory.joinpath(self.FILES_DIRECTORY)
+
+        if system_directory.is_dir() and files_directory.is_dir():
+            self.files_directory = files_directory
+            self._load_system_directory(system_directory)
+        elif system_image is not None:
+            self.files_directory = self.directory
+            self._load_system_image(system_image)
+        else:
+            raise ValueError(
+                f"{self.directory} has no sys/ and files/ directories, a system image is required."
+            )
+
+        self.entries: "list[DirectoryEntry]" = []
+        self._scan_directory(self.files_directory, 0)
+        self._layout()
+
+    def _load_system_directory(self, system_directory: Path):
+        self.boot_bytes = bytearray(system_directory.joinpath("boot.bin").read_bytes())
+        self.bi2_bytes = system_directory.joinpath("bi2.bin").read_bytes()
+        self.dol_bytes = system_directory.joinpath("main.dol").read_bytes()
+        for app_loader_name in self.APP_LOADER_NAMES:
+            app_loader_path = system_directory.joinpath(app_loader_name)
+            if app_loader_path.exists():
+                self.app_loader_bytes = app_loader_path.read_bytes()
+                break
+        else:
+            raise ValueError(f"No apploader found in {system_directory}.")
+
+    def _load_system_image(self, system_image: GamecubeISO):
+        self.boot_bytes = bytearray(system_image.disc_header.to_bytes())
+        self.bi2_bytes = bytes(system_image.disc_header_information.to_bytes())
+        app_loader_size = system_image.app_loader.get_app_loader_size()
+        self.app_loader_bytes = bytes(system_image.app_loader.to_bytes()[:app_loader_size])
+        self.dol_bytes = bytes(system_image.dol.to_bytes())
+
+    def _scan_directory(self, directory: Path, parent_index: int):
+        """
+        Add the contents of a directory to the entry list. Names are sorted case insensitively
+        like the FSTs on retail discs, and directories record the index after their last child.
+        """
+        for child in sorted(directory.iterdir(), key=lambda p: (p.name.lower(), p.name)):
+            entry = DirectoryEntry(child.name, child, parent_index, child.is_dir())
+            self.entries.append(entry)
+            if entry.is_directory:
+                self._scan_directory(child, len(self.entries))
+                entry.next_index = len(self.entries) + 1
+            else:
+                entry.data_size = child.stat().st_size
+
+    def _layout(self):
+        """
+        Place the system files, FST and game files and patch the disc header to match.
+        """
+        dol_offset = GamecubeISO.AppLoaderStartOffset + len(self.app_loader_bytes)
+        dol_offset += Stream.align_bytes(dol_offset)
+        fst_offset = dol_offset + len(self.dol_bytes)
+        fst_offset += Stream.align_bytes(fst_offset)
+
+        string_table = bytearray()
+        name_offsets = []
+        for entry in self.entries:
+            name_offsets.append(len(string_table))
+            string_table += entry.name.encode("shift_jis") + b"\0"
+        fst_size = (len(self.entries) + 1) * TableOfContents.TOC_ENTRY_SIZE + len(string_table)
+
+        data_offset = fst_offset + fst_size
+        for entry in self.entries:
+            if not entry.is_directory:
+                data_offset += Stream.align_bytes(data_offset)
+                entry.data_offset = data_offset
+                data_offset += entry.data_size
+        self.image_size = data_offset + Stream.align_bytes(data_offset)
+
+        fst_bytes = bytearray(struct.pack(">BxxxII", 1, 0, len(self.entries) + 1))
+        for entry, name_offset in zip(self.entries, name_offsets):
+            if entry.is_directory:
+                fields = (1 << 24 | name_offset, entry.parent_index, entry.next_index)
+            else:
+                fields = (name_offset, entry.data_offset, entry.data_size)
+            fst_bytes += struct.pack(">III", *fields)
+        fst_bytes += string_table
+        self.fst_bytes = fst_bytes
+
+        self.dol_offset = dol_offset
+        self.fst_offset = fst_offset
+        # the DOL offset is followed by the FST offset, size and maximum size
+        header_fields = struct.pack(">IIII", dol_offset, fst_offset, fst_size, fst_size)
+        self.boot_bytes[DOLOffset : DOLOffset + len(header_fields)] = header_fields
+
+    def get_system_area(self) -> bytearray:
+        """
+        Get the bytes of the image up to the end of the FST.
+        """
+        system_area = MemoryStream(bytearray(self.fst_offset + len(self.fst_bytes)))
+        system_area.write_bytes_at_offset(0, self.boot_bytes)
+        system_area.write_bytes_at_offset(GamecubeISO.DiscHeaderSize, self.bi2_bytes)
+        system_area.write_bytes_at_offset(GamecubeISO.AppLoaderStartOffset, self.app_loader_bytes)
+        system_area.write_bytes_at_offset(self.dol_offset, self.dol_bytes)
+        system_area.write_bytes_at_offset(self.fst_offset, self.fst_bytes)
+        return system_area.stream
+
+    def _read_chunk(self, path: Path, offset: int, size: int) -> bytes:
+        with path.open("rb") as source_file:
+            source_file.seek(offset)
+            return source_file.read(size)
+
+    def build(self, path: "Path | str", threads: int = None) -> int:
+        """
+        Write the image to path and return its size.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if threads is None:
+            threads = min(8, os.cpu_count() or 1)
+
+        with Path(path).open("wb") as image_file, ThreadPoolExecutor(threads) as executor:
+            system_area = self.get_system_area()
+            image_file.write(system_area)
+            current_offset = len(system_area)
+
+            max_pending = threads * 4
+            pending_chunks = deque()
+
+            def write_next_chunk():
+                nonlocal current_offset
+                offset, size, future = pending_chunks.popleft()
+                chunk = future.result()
+                if len(chunk) != size:
+                    raise ValueError("A file changed size while the image was being built.")
+                image_file.write(bytes(offset - current_offset))
+                image_file.write(chunk)
+                current_offset = offset + size
+
+            for entry in self.entries:
+                if entry.is_directory:
+                    continue
+                for chunk_offset in range(0, entry.data_size, self.CHUNK_SIZE):
+                    size = min(self.CHUNK_SIZE, entry.data_size - chunk_offset)
+                    future = executor.submit(self._read_chunk, entry.path, chunk_offset, size)
+                    pending_chunks.append((entry.data_offset + chunk_offset, size, future))
+                    if len(pending_chunks) >= max_pending:
+                        write_next_chunk()
+
+            while len(pending_chunks) > 0:
+                write_next_chunk()
+
+            image_file.write(bytes(self.image_size - current_offset))
+
+        return self.image_size
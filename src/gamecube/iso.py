@@ -1,13 +1,18 @@
-import bsdiff4
 from mmap import ACCESS_READ, ACCESS_WRITE, mmap
 from pathlib import Path
-from typing_extensions import Self
-from zipfile import ZipFile
-from io import BytesIO
+import struct
+from typing import TYPE_CHECKING
+import threading
 
-from . import GamecubeFileFactory, DiscHeader, DiscHeaderInformation, DOL, AppLoader, TableOfContents, FSTFile
-from .. import AbstractFileArchive, AbstractFile, NotImplementedFile, Stream, MemoryStream, MMapStream, SystemCodes
-from tqdm import tqdm
+from . import GamecubeFileFactory, DiscHeader, DiscHeaderInformation, DOL, AppLoader, TableOfContents, FSTDirectory, FSTFile, CISOStream, GCZStream, FSTCache
+from .disc_header import SizeOfFSTOffset
+from .junk import JunkGenerator
+from .diff import ImageComparer, ImageDiff
+from .layout import AccessTrace, LayoutOptimizer, LayoutReport, estimate_seek_distance
+from .. import AbstractFileArchive, AbstractFile, NotImplementedFile, Stream, MemoryStream, MMapStream, FileStream, CancellableStream, SubStream, SystemCodes, MemoryBudget, Instrumentation
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
 
 
 class GamecubeISO(AbstractFileArchive):
@@ -21,38 +26,156 @@ class GamecubeISO(AbstractFileArchive):
     def __init__(self, filename: str, file_contents: Stream):
 
         super().__init__(filename, file_contents)
+        self._load_lock = threading.Lock()
+        self.image_path: Path = None
+        self.fst_cache: FSTCache = None
         self.load_system_header(file_contents)
 
     def load_system_header(self, header_contents: Stream):
+        """
+        Read the disc header. The rest of the system files are only read and parsed the first
+        time they're used, so opening an image to look at its header stays cheap.
+        """
         disc_header = header_contents.get_bytes_at_offset(0, self.DiscHeaderSize)
         self.disc_header = DiscHeader(MemoryStream(disc_header))
 
-        disc_header_information = header_contents.get_bytes_at_offset(
+        self._system_contents = header_contents
+        self._disc_header_information: DiscHeaderInformation = None
+        self._app_loader: AppLoader = None
+        self._table_of_contents: TableOfContents = None
+        self._dol: DOL = None
+        self._cached_layout = None
+        self._system_files_replaced = False
+
+    def _load_disc_header_information(self) -> DiscHeaderInformation:
+        disc_header_information = self._system_contents.get_bytes_at_offset(
             self.DiscHeaderSize, self.DiscHeaderInformationSize
         )
-        self.disc_header_information = DiscHeaderInformation(
-            MemoryStream(disc_header_information)
-        )
+        return DiscHeaderInformation(MemoryStream(disc_header_information))
 
-        app_loader = header_contents.get_bytes_at_offset(
+    def _load_app_loader(self) -> AppLoader:
+        app_loader = self._system_contents.get_bytes_at_offset(
             self.AppLoaderStartOffset,
             self.disc_header.fst_offset - self.AppLoaderStartOffset,
         )
-        self.app_loader = AppLoader(MemoryStream(app_loader))
-
-        fst_bin = header_contents.get_bytes_at_offset(
-            self.disc_header.fst_offset, self.disc_header.fst_size
+        return AppLoader(MemoryStream(app_loader))
+
+    def _can_use_fst_cache(self) -> bool:
+        # the cache describes the image file, not system files replaced since it was opened
+        return (
+            self.fst_cache is not None
+            and self.image_path is not None
+            and self._system_contents is self.file_contents
         )
-        self.table_of_contents = TableOfContents(MemoryStream(fst_bin))
 
-        dol_header = header_contents.get_bytes_at_offset(self.disc_header.dol_offset, 0xFF)
-        self.dol = DOL(MemoryStream(dol_header))
-        dol_payload = header_contents.get_bytes_at_offset(
-            self.disc_header.dol_offset, self.dol.get_dol_size()
-        )
-        self.dol.load_section_contents(MemoryStream(dol_payload))
+    def _get_cached_layout(self):
+        if self._cached_layout is None and self._can_use_fst_cache():
+            disc_header = bytes(self.disc_header.file_contents.stream)
+            self._cached_layout = self.fst_cache.load(self.image_path, disc_header)
+        return self._cached_layout
+
+    def _load_table_of_contents(self) -> TableOfContents:
+        with self.instrumentation.phase("load_fst") as phase:
+            cached_layout = self._get_cached_layout()
+            phase.annotate(cached=cached_layout is not None)
+            if cached_layout is not None:
+                # nothing is read or built until the FST is used, the tree is built from the cached
+                # entries and the bytes of the FST are read from the image if they're needed
+                fst_bin = SubStream(
+                    self._system_contents, self.disc_header.fst_offset, self.disc_header.fst_size
+                )
+                return TableOfContents.from_entries(fst_bin, cached_layout.entries)
+
+            fst_bin = self._system_contents.get_bytes_at_offset(
+                self.disc_header.fst_offset, self.disc_header.fst_size
+            )
+            phase.update(files=1, bytes_read=len(fst_bin))
+            table_of_contents = TableOfContents(MemoryStream(fst_bin))
+            if self._can_use_fst_cache():
+                disc_header = bytes(self.disc_header.file_contents.stream)
+                self.fst_cache.store(self.image_path, disc_header, table_of_contents)
+            return table_of_contents
+
+    def _load_dol(self) -> DOL:
+        with self.instrumentation.phase("load_dol") as phase:
+            dol_header = self._system_contents.get_bytes_at_offset(self.disc_header.dol_offset, 0xFF)
+            dol = DOL(MemoryStream(dol_header))
+            dol_payload = self._system_contents.get_bytes_at_offset(
+                self.disc_header.dol_offset, dol.get_dol_size()
+            )
+            dol.load_section_contents(MemoryStream(dol_payload))
+            phase.update(files=1, bytes_read=len(dol_payload))
+            return dol
+
+    def _get_system_file(self, attribute: str, load) -> AbstractFile:
+        """
+        Get a lazily loaded system file, loading it under a lock so concurrent readers share one copy.
+        """
+        system_file = getattr(self, attribute)
+        if system_file is None:
+            with self._load_lock:
+                system_file = getattr(self, attribute)
+                if system_file is None:
+                    system_file = load()
+                    setattr(self, attribute, system_file)
+        return system_file
+
+    @property
+    def disc_header_information(self) -> DiscHeaderInformation:
+        return self._get_system_file("_disc_header_information", self._load_disc_header_information)
+
+    @disc_header_information.setter
+    def disc_header_information(self, value: DiscHeaderInformation):
+        self._disc_header_information = value
+        self._system_files_replaced = True
+
+    @property
+    def app_loader(self) -> AppLoader:
+        return self._get_system_file("_app_loader", self._load_app_loader)
+
+    @app_loader.setter
+    def app_loader(self, value: AppLoader):
+        self._app_loader = value
+        self._system_files_replaced = True
+
+    @property
+    def table_of_contents(self) -> TableOfContents:
+        return self._get_system_file("_table_of_contents", self._load_table_of_contents)
+
+    @table_of_contents.setter
+    def table_of_contents(self, value: TableOfContents):
+        self._table_of_contents = value
+        self._system_files_replaced = True
+
+    @property
+    def dol(self) -> DOL:
+        return self._get_system_file("_dol", self._load_dol)
+
+    @dol.setter
+    def dol(self, value: DOL):
+        self._dol = value
+        self._system_files_replaced = True
+
+    def is_system_dirty(self, include_fst: bool = True) -> bool:
+        """
+        Check whether the system files, and the FST unless include_fst is False,
+        differ from the ones read from the image.
+        """
+        if self._system_contents is not self.file_contents or self._system_files_replaced:
+            return True
+        system_files = [self.disc_header, self._disc_header_information, self._app_loader, self._dol]
+        if include_fst and self._table_of_contents is not None:
+            if self._table_of_contents.version != 0:
+                return True
+            system_files.append(self._table_of_contents)
+        return any(f is not None and f.is_dirty() for f in system_files)
+
+    def is_dirty(self) -> bool:
+        """
+        Check whether building the image would give anything other than the source image.
+        """
+        return super().is_dirty() or self.is_system_dirty()
 
-    
     def get_file_list(self) -> "list[str]":
         files = self.table_of_contents.get_fst_file_list()
         return [f.filename for f in files]
@@ -82,38 +205,30 @@ class GamecubeISO(AbstractFileArchive):
         return dict(*[(f.filename, self._extract_file_by_entry(f)) for f in files])
 
 
-    def add_new_file(self, file: AbstractFile, parent_directory: str = None):
-        # update FST
-        # add file to list of pending files
-
-        fst_directory = self.table_of_contents.root_directory
-        if parent_directory is not None:
-            fst_directories = self.table_of_contents.get_fst_directory_list()
-            for dir in fst_directories:
-                if dir.filename == parent_directory:
-                    fst_directory = dir
-                    break
+    def batch(self) -> "ImageBatch":
+        """
+        Start a batch of file adds, replaces, removes and moves that is committed with a single
+        renumbering and layout of the FST. Use it as a context manager to commit when the block exits.
+        """
+        return ImageBatch(self)
 
-        self.table_of_contents.add_file(
-            file.file_name,
-            file.file_contents.stream_size,
-            fst_directory,
-        )
-        super().add_new_file(file, parent_directory)
+    def add_new_file(self, file: AbstractFile, parent_directory: str = None):
+        with self.batch() as batch:
+            batch.add_file(file, parent_directory)
 
     def replace_file(self, file: AbstractFile):
         if file.file_name == "system.bin":
+            # system.bin doesn't hold the FST, so the one in use is kept instead of being read from it
+            table_of_contents = self.table_of_contents
             self.load_system_header(file.file_contents)
-        else:            
-            existing_fst = self.table_of_contents.search_file_by_name(file.file_name)
-            if existing_fst is not None:
-                existing_fst.data_size = file.file_contents.stream_size
-                self.table_of_contents.update_fst_offsets()
-                super().replace_file(file)
+            self._table_of_contents = table_of_contents
+        elif self.table_of_contents.search_file_by_name(file.file_name) is not None:
+            with self.batch() as batch:
+                batch.replace_file(file)
 
     def delete_file(self, file: AbstractFile):
-        self.table_of_contents.remove_file(file)
-        super().delete_file(file)
+        with self.batch() as batch:
+            batch.remove_file(file.file_name)
 
     def get_system_size(self):
         image_size = 0
@@ -125,131 +240,614 @@ class GamecubeISO(AbstractFileArchive):
         return image_size + Stream.align_bytes(image_size)
 
     def get_archive_size(self):
-        fst_list = self.table_of_contents.get_fst_file_list()
-        fst_list.sort(key=lambda f: f.data_offset)
-        file_size = fst_list[-1].data_offset + fst_list[-1].data_size
+        last_file = self.table_of_contents.get_files_by_offset()[-1]
+        file_size = last_file.data_offset + last_file.data_size
         return file_size + Stream.align_bytes(file_size)
     
+    def get_used_extents(self, source: bool = True) -> "list[tuple[int, int]]":
+        """
+        Get the (offset, size) ranges of the source image that hold system files or FST referenced data,
+        or of the image as it would be built if source is False.
+        Overlapping and adjacent ranges are merged and the list is sorted by offset.
+        """
+        dol_size = self.dol.get_dol_size()
+        for section in self.dol.text_sections + self.dol.data_sections:
+            dol_size = max(dol_size, section.offset + section.size)
+
+        extents = [
+            (0, self.AppLoaderStartOffset + self.app_loader.get_app_loader_size()),
+            (self.disc_header.dol_offset, dol_size),
+        ]
+        if source:
+            extents.append((self.disc_header.fst_offset, self.disc_header.fst_size))
+            extents.extend(
+                (f.old_offset, f.old_size) for f in self.table_of_contents.get_fst_file_list()
+            )
+        else:
+            extents.append((self.disc_header.fst_offset, self.table_of_contents.file_size))
+            extents.extend(
+                (f.data_offset, f.data_size) for f in self.table_of_contents.get_fst_file_list()
+            )
+        extents.sort()
+
+        merged_extents: "list[tuple[int, int]]" = []
+        for offset, size in extents:
+            if size <= 0:
+                continue
+            if len(merged_extents) > 0:
+                last_offset, last_size = merged_extents[-1]
+                if offset <= last_offset + last_size:
+                    end_offset = max(last_offset + last_size, offset + size)
+                    merged_extents[-1] = (last_offset, end_offset - last_offset)
+                    continue
+            merged_extents.append((offset, size))
+        return merged_extents
+
     def write_system_files(self, write_stream: Stream):
-        with tqdm(total=5) as pbar:
+        with self.instrumentation.phase("system_files", total=4) as phase:
             disc_header_bytes = self.disc_header.to_bytes()
             write_stream.write_bytes_at_offset(0, disc_header_bytes)
-            pbar.update(1)
+            phase.update(files=1, bytes_written=len(disc_header_bytes))
 
             disc_header_info_bytes = self.disc_header_information.to_bytes()
             write_stream.write_bytes_at_offset(
                 len(disc_header_bytes), disc_header_info_bytes
             )
-            pbar.update(1)
+            phase.update(files=1, bytes_written=len(disc_header_info_bytes))
 
             app_loader_bytes = self.app_loader.to_bytes()
             write_stream.write_bytes_at_offset(
                 self.AppLoaderStartOffset, app_loader_bytes
             )
-            pbar.update(1)
+            phase.update(files=1, bytes_written=len(app_loader_bytes))
 
             dol_bytes = self.dol.to_bytes()
             write_stream.write_bytes_at_offset(self.disc_header.dol_offset, dol_bytes)
-            pbar.update(1)
-
-
-    def build_archive(self, write_stream: Stream):
-        fst_list = self.table_of_contents.get_fst_file_list()
-        fst_list.sort(key=lambda fst: fst.data_offset)
-
-        # write system files
-        print("Serializing system files")
-        self.write_system_files(write_stream)
+            phase.update(files=1, bytes_written=len(dol_bytes))
+
+    def update_file_layout(self) -> bool:
+        """
+        Resize the FST entries of changed files to their new sizes. If any no longer fit in their
+        space on the disc, the files are laid out again in their current order, keeping any planned
+        layout, and True is returned.
+        Files that were only opened can't have grown, so only the dirty files are checked.
+        """
+        if len(self.dirty_files) == 0:
+            return False
 
-        print("Scanning extracted files for changes.")
         changed_size = False
-        for file in fst_list:
+        for file in self.table_of_contents.get_fst_file_list():
             file_name = str(file.filename)
-            if file_name in self.extracted_archive_files:
-                new_file = self.extracted_archive_files[str(file.filename)]
-                size = new_file.file_contents.stream_size
-                if size > file.data_size:
-                    file.data_size = size + Stream.align_bytes(size)
-                    changed_size = True
-        
-        if changed_size:
-            print("Files were altered. Defragmenting to ensure we can fit the changes into the image.")
-            self.table_of_contents.defragment(self.get_system_size())
-            self.table_of_contents.update_fst_offsets()
-
-        
-        # write FST last incase we just updated the offsets
-        fst_bytes = self.table_of_contents.to_bytes()
-        fst_bytes.extend([0] * Stream.align_bytes(len(fst_bytes)))
-        write_stream.write_bytes_at_offset(self.disc_header.fst_offset, fst_bytes)
-
-
-        print("Serializing game files")
-        for child in tqdm(fst_list):
-            file_name = str(child.filename)
-            file_contents = self.extracted_archive_files[file_name] if file_name in self.extracted_archive_files else self._extract_file_by_entry(child)
-
-            if isinstance(file_contents, AbstractFileArchive):
-                file_write_stream = MemoryStream([0] * file_contents.get_file_size())
-                file_contents.build_archive(file_write_stream)
-                write_stream.write_bytes_at_offset(child.data_offset, file_write_stream.stream)
-            else:
-                write_stream.write_bytes_at_offset(
-                    child.data_offset, file_contents.to_bytes()
-                )
+            if file_name in self.dirty_files and file_name in self.extracted_archive_files:
+                new_file = self.extracted_archive_files[file_name]
+                if isinstance(new_file, AbstractFileArchive):
+                    size = new_file.get_archive_size()
+                else:
+                    size = new_file.get_file_size()
+                if size != file.data_size:
+                    # files that shrank stay where they are, files that grew need the files repacked
+                    changed_size |= size > file.data_size
+                    file.data_size = size
 
-    def save_to_disk(self, path: "Path | str"):
-        with Path(path).open("wb+") as image_file:
-            # allocate space
-            buffer = bytes([0] * 2048)
-            file_size = self.get_archive_size()
-            for i in range((file_size // 2048)):
-                image_file.write(buffer)
-
-            image_file.flush()
-            with mmap(image_file.fileno(), 0, access=ACCESS_WRITE) as mmap_stream:
-                output_stream = MMapStream(mmap_stream)
-                self.build_archive(output_stream)
+        if changed_size:
+            self.table_of_contents.layout_files(self.disc_header.fst_offset)
+            self.table_of_contents.invalidate()
+        return changed_size
+
+    def optimize_layout(self, trace: AccessTrace, end_offset: int = None) -> LayoutReport:
+        """
+        Reorder where file data is on the disc so the files in the trace are read in one sweep,
+        after the files it doesn't read. If an end offset is given, like the size of a full disc,
+        the files that are read are moved against it where the drive reads fastest.
+        The new layout is written when the image is saved.
+        """
+        table_of_contents = self.table_of_contents
+        optimizer = LayoutOptimizer(table_of_contents, trace)
+        reserved = [
+            (self.disc_header.fst_offset, table_of_contents.file_size),
+            (self.disc_header.dol_offset, self.dol.get_dol_size()),
+        ]
+        start_offset = table_of_contents.get_files_by_offset()[0].data_offset
+        offsets = optimizer.plan(start_offset, reserved, end_offset)
+
+        seek_distance_before = estimate_seek_distance(optimizer.accessed_files)
+        seek_distance_after = estimate_seek_distance(optimizer.accessed_files, offsets)
+        moved_files = sum(
+            1 for f in table_of_contents.get_fst_file_list() if offsets[f] != f.data_offset
+        )
+        if moved_files > 0:
+            table_of_contents.apply_layout(offsets)
+        return LayoutReport(
+            seek_distance_before, seek_distance_after, moved_files, optimizer.unresolved
+        )
 
-    def build_patch_file(self) -> "dict[str, bytes]":
-        zipfile = BytesIO()
-        with ZipFile(zipfile, 'w') as out_file:
-            out_file.writestr("SYSCODE", [SystemCodes.Gamecube])
-            for file_name, file in self.extracted_archive_files.items():
-                patch_file = file.build_patch_file()
-                if patch_file is not None:
-                    out_file.writestr(f"{file_name}.patch", patch_file)
-
-            new_header_file = MemoryStream()
-            self.write_system_files(new_header_file)
-
-            old_header_file = MemoryStream()
-            disc_header_bytes = self.disc_header.file_contents
-            old_header_file.write_bytes_at_offset(0, disc_header_bytes)
-
-            disc_header_info_bytes = self.disc_header_information.file_contents
-            old_header_file.write_bytes_at_offset(
-                len(disc_header_bytes), disc_header_info_bytes
+    def compare(
+        self, other: "GamecubeISO", threads: int = None, stop_at_first_difference: bool = False
+    ) -> ImageDiff:
+        """
+        Find the files and system files that differ in another image, this one being the old image.
+        Files are compared on a pool of threads, min(8, number of CPUs) by default, and files both
+        images read unchanged from the same image file aren't read at all.
+        If stop_at_first_difference is set, comparing stops once any difference is found.
+        """
+        return ImageComparer(self, other, threads).compare(stop_at_first_difference)
+
+    def build_archive(
+        self, write_stream: Stream, fill_junk: bool = False, memory_budget: MemoryBudget = None
+    ):
+        """
+        Write the image to a stream. Gaps between files are left as they are in the stream, unless
+        fill_junk is set, then they're filled with the junk data a disc with this game ID would have
+        so an image that wasn't changed is rebuilt exactly.
+        If a memory budget is given, changed files are spilled to disk to fit in it and every file
+        is written a chunk at a time.
+        """
+        with self.instrumentation.phase("build") as phase:
+            # files are copied and written a chunk at a time
+            chunk_size = 0x400000
+            if memory_budget is not None:
+                memory_budget.start()
+                memory_budget.enforce(self.extracted_archive_files.values())
+                chunk_size = memory_budget.chunk_size
+
+            self.write_system_files(write_stream)
+
+            with self.instrumentation.phase("layout") as layout_phase:
+                # files that grew are moved to fit
+                layout_phase.annotate(repacked=self.update_file_layout())
+
+            # write FST last incase we just updated the offsets
+            with self.instrumentation.phase("fst") as fst_phase:
+                fst_bytes = self.table_of_contents.to_bytes()
+                fst_bytes.extend([0] * Stream.align_bytes(len(fst_bytes)))
+                write_stream.write_bytes_at_offset(self.disc_header.fst_offset, fst_bytes)
+                fst_phase.update(files=1, bytes_written=len(fst_bytes))
+
+            self._write_game_files(write_stream, chunk_size)
+
+            if fill_junk:
+                with self.instrumentation.phase("junk") as junk_phase:
+                    image_size = max(self.get_archive_size(), write_stream.stream_size)
+                    junk_size = JunkGenerator.from_disc_header(self.disc_header).fill_gaps(
+                        write_stream,
+                        self.get_used_extents(source=False),
+                        image_size,
+                        chunk_size,
+                    )
+                    junk_phase.update(bytes_written=junk_size)
+
+            if memory_budget is not None:
+                memory_budget.finish()
+                phase.annotate(memory_budget=memory_budget.to_json_obj())
+
+    def _write_game_files(self, write_stream: Stream, chunk_size: int):
+        files_by_offset = self.table_of_contents.get_files_by_offset()
+        with self.instrumentation.phase("files", total=len(files_by_offset)) as phase:
+            for child in files_by_offset:
+                file_name = str(child.filename)
+                if file_name not in self.dirty_files or file_name not in self.extracted_archive_files:
+                    # unchanged files are copied as they are, without being parsed and serialized
+                    for offset in range(0, child.old_size, chunk_size):
+                        write_stream.write_bytes_at_offset(
+                            child.data_offset + offset,
+                            self.file_contents.get_bytes_at_offset(
+                                child.old_offset + offset, min(chunk_size, child.old_size - offset)
+                            ),
+                        )
+                    phase.update(files=1, bytes_read=child.old_size, bytes_written=child.old_size)
+                    continue
+
+                file_contents = self.extracted_archive_files[file_name]
+                if isinstance(file_contents, AbstractFileArchive):
+                    # nested archives are built in place in their window of the image
+                    file_write_stream = SubStream(write_stream, child.data_offset, child.data_size)
+                    file_contents.build_archive(file_write_stream)
+                    written = child.data_size
+                else:
+                    written = file_contents.write_to_stream(write_stream, child.data_offset, chunk_size)
+                phase.update(files=1, bytes_written=written)
+
+    def save_to_disk(
+        self,
+        path: "Path | str",
+        image_format: str = "iso",
+        cancel_event: threading.Event = None,
+        fill_junk: bool = False,
+        memory_budget: MemoryBudget = None,
+    ):
+        """
+        Build the image and write it to disk.
+        The image format can be 'iso' for a raw image, 'ciso' to leave out empty blocks
+        or 'gcz' to compress each block of the image.
+        If a cancel event is given, setting it from another thread stops the save with OperationCancelled.
+        If fill_junk is set, gaps between files are filled with junk data like on a disc instead of zeros,
+        and the image is at least as big as the source image.
+        If a memory budget is given, the build keeps the file data it holds in memory under it, see MemoryBudget.
+        If nothing has changed since the image was opened, the source image is copied instead of rebuilt.
+        """
+        with self.instrumentation.phase("save") as phase:
+            rebuilt = self.is_dirty()
+            self._save_image(
+                path, image_format, cancel_event, fill_junk, memory_budget, rebuilt
             )
+            phase.annotate(image_format=image_format, rebuilt=rebuilt)
+            phase.update(files=1, bytes_written=Path(path).stat().st_size)
+
+    def _save_image(
+        self,
+        path: "Path | str",
+        image_format: str,
+        cancel_event: threading.Event,
+        fill_junk: bool,
+        memory_budget: MemoryBudget,
+        rebuilt: bool,
+    ):
+        if not rebuilt:
+            self._save_source_image(Path(path), image_format, cancel_event)
+        elif image_format == "iso":
+            with Path(path).open("wb+") as image_file:
+                self._build_image_file(image_file, cancel_event, fill_junk, memory_budget)
+        elif image_format in ("ciso", "gcz"):
+            # compressed formats are written from a raw build so the image is only built once
+            import tempfile
+
+            with tempfile.TemporaryFile(dir=Path(path).parent) as image_file:
+                self._build_image_file(image_file, cancel_event, fill_junk, memory_budget)
+                if memory_budget is not None:
+                    self._write_compressed_image(
+                        FileStream(image_file, cache_size=1), path, image_format, cancel_event
+                    )
+                    return
+                with mmap(image_file.fileno(), 0, access=ACCESS_READ) as mmap_stream:
+                    self._write_compressed_image(
+                        MMapStream(mmap_stream), path, image_format, cancel_event
+                    )
+        else:
+            raise ValueError(f"Unknown image format: {image_format}")
 
-            app_loader_bytes = self.app_loader.file_contents
-            old_header_file.write_bytes_at_offset(
-                self.AppLoaderStartOffset, app_loader_bytes
+    @staticmethod
+    def _write_compressed_image(
+        raw_stream: Stream, path: "Path | str", image_format: str, cancel_event: threading.Event = None
+    ):
+        if cancel_event is not None:
+            raw_stream = CancellableStream(raw_stream, cancel_event)
+        if image_format == "ciso":
+            CISOStream.write_image(raw_stream, path)
+        else:
+            GCZStream.write_image(raw_stream, path)
+
+    def _save_source_image(
+        self, path: Path, image_format: str, cancel_event: threading.Event = None
+    ):
+        source_stream: Stream = self.file_contents
+        is_raw_image = self.image_path is not None and isinstance(
+            source_stream, (MMapStream, FileStream)
+        )
+        if image_format == "iso" and is_raw_image:
+            if path.exists() and path.samefile(self.image_path):
+                return
+            if cancel_event is None:
+                import shutil
+
+                shutil.copyfile(self.image_path, path)
+                return
+
+        if cancel_event is not None:
+            source_stream = CancellableStream(source_stream, cancel_event)
+        if image_format == "iso":
+            chunk_size = 0x400000
+            with path.open("wb") as image_file:
+                for offset in range(0, source_stream.stream_size, chunk_size):
+                    image_file.write(source_stream.get_bytes_at_offset(offset, chunk_size))
+        elif image_format == "ciso":
+            CISOStream.write_image(source_stream, path)
+        elif image_format == "gcz":
+            GCZStream.write_image(source_stream, path)
+        else:
+            raise ValueError(f"Unknown image format: {image_format}")
+
+    def _build_image_file(
+        self,
+        image_file,
+        cancel_event: threading.Event = None,
+        fill_junk: bool = False,
+        memory_budget: MemoryBudget = None,
+    ):
+        # allocate space, after resizing the changed files so the image is big enough for them
+        self.update_file_layout()
+        buffer = bytes([0] * 2048)
+        file_size = self.get_archive_size()
+        if fill_junk:
+            file_size = max(file_size, self.file_contents.stream_size)
+        for i in range((file_size // 2048)):
+            image_file.write(buffer)
+
+        image_file.flush()
+        if memory_budget is not None:
+            # pages of a mapping count towards resident memory, buffered writes don't
+            file_stream = FileStream(
+                image_file, cache_size=1, write_buffer_size=memory_budget.chunk_size
             )
+            output_stream: Stream = file_stream
+            if cancel_event is not None:
+                output_stream = CancellableStream(output_stream, cancel_event)
+            self.build_archive(output_stream, fill_junk, memory_budget)
+            file_stream.flush()
+            return
+
+        with mmap(image_file.fileno(), 0, access=ACCESS_WRITE) as mmap_stream:
+            output_stream: Stream = MMapStream(mmap_stream)
+            if cancel_event is not None:
+                output_stream = CancellableStream(output_stream, cancel_event)
+            self.build_archive(output_stream, fill_junk)
+
+    def scrub(self, path: "Path | str", sparse: bool = False, chunk_size: int = 0x400000) -> int:
+        """
+        Write a copy of the source image where every byte that isn't part of the system files or
+        referenced by the FST is zeroed. The junk data that normally fills these areas doesn't
+        compress, zeros do. If sparse is set the zeroed areas are skipped instead of written,
+        so file systems that support it leave holes in the file.
+
+        The image is written in a single pass in offset order. Returns the number of bytes zeroed.
+        """
+        image_size = self.file_contents.stream_size
+        used_extents = self.get_used_extents()
+        empty_chunk = bytes(chunk_size)
+        reclaimed_bytes = 0
+
+        with Path(path).open("wb") as image_file:
+            def write_gap(size: int):
+                if sparse:
+                    image_file.seek(size, 1)
+                    return
+                while size > 0:
+                    write_size = min(size, chunk_size)
+                    image_file.write(empty_chunk[:write_size])
+                    size -= write_size
+
+            current_offset = 0
+            for offset, size in used_extents:
+                if offset >= image_size:
+                    break
+                size = min(size, image_size - offset)
 
-            dol_bytes = self.dol.file_contents
-            old_header_file.write_bytes_at_offset(
-                self.disc_header.dol_offset, dol_bytes
-            )
+                write_gap(offset - current_offset)
+                reclaimed_bytes += offset - current_offset
+
+                end_offset = offset + size
+                while offset < end_offset:
+                    read_size = min(chunk_size, end_offset - offset)
+                    image_file.write(self.file_contents.get_bytes_at_offset(offset, read_size))
+                    offset += read_size
+                current_offset = end_offset
+
+            write_gap(image_size - current_offset)
+            reclaimed_bytes += image_size - current_offset
+            image_file.truncate(image_size)
 
-            patch_header = bsdiff4.diff(old_header_file, new_header_file)
-            out_file.writestr("system.bin.patch", patch_header)
+        return reclaimed_bytes
 
+    def build_patch_file(self) -> bytes:
+        """
+        Build a patch archive holding a bsdiff patch for each changed file, diffed against its
+        contents in the source image. Files that weren't changed aren't read.
+        """
+        import bsdiff4
+        from io import BytesIO
+        from zipfile import ZipFile
+
+        zipfile = BytesIO()
+        with self.instrumentation.phase("patch", total=len(self.dirty_files)) as phase:
+            with ZipFile(zipfile, 'w') as out_file:
+                out_file.writestr("SYSCODE", bytes([SystemCodes.Gamecube.value]))
+                for file_name in sorted(self.dirty_files):
+                    file = self.extracted_archive_files.get(file_name)
+                    entry = self.table_of_contents.search_file_by_name(file_name)
+                    if file is None or entry is None:
+                        continue
+
+                    original_bytes = self.file_contents.get_bytes_at_offset(
+                        entry.old_offset, entry.old_size
+                    )
+                    if isinstance(file, AbstractFileArchive):
+                        new_file = MemoryStream()
+                        file.build_archive(new_file)
+                        new_bytes = new_file.stream
+                    else:
+                        new_bytes = file.to_bytes()
+                    file_patch = bsdiff4.diff(bytes(original_bytes), bytes(new_bytes))
+                    out_file.writestr(f"{file_name}.patch", file_patch)
+                    phase.update(
+                        files=1, bytes_read=len(original_bytes), bytes_written=len(file_patch)
+                    )
+
+                if self.is_system_dirty(include_fst=False):
+                    # patches are applied to the system files as the unpatched image serializes them
+                    old_header_file = MemoryStream()
+                    GamecubeISO(self.file_name, self.file_contents).write_system_files(old_header_file)
+
+                    new_header_file = MemoryStream()
+                    self.write_system_files(new_header_file)
+
+                    patch_header = bsdiff4.diff(
+                        bytes(old_header_file.stream), bytes(new_header_file.stream)
+                    )
+                    out_file.writestr("system.bin.patch", patch_header)
 
         return zipfile.getvalue()
 
     @staticmethod
-    def open_image_file(path: "Path | str") -> Self:
-        with path.open("rb") as in_file:
-            mmap_stream = mmap(in_file.fileno(), 0, access=ACCESS_READ)
-            return GamecubeISO(path.name, MMapStream(mmap_stream))
\ No newline at end of file
+    def _open_image_stream(path: Path, backend: str) -> Stream:
+        if backend == "mmap":
+            with path.open("rb") as in_file:
+                mmap_stream = mmap(in_file.fileno(), 0, access=ACCESS_READ)
+            image_stream: Stream = MMapStream(mmap_stream)
+        elif backend == "file":
+            image_stream = FileStream.from_file(path)
+        else:
+            raise ValueError(f"Unknown stream backend: {backend}")
+
+        try:
+            if CISOStream.is_ciso_image(image_stream):
+                image_stream = CISOStream(image_stream)
+            elif GCZStream.is_gcz_image(image_stream):
+                image_stream = GCZStream(image_stream)
+        except Exception:
+            image_stream.close()
+            raise
+        return image_stream
+
+    @staticmethod
+    def open_image_file(
+        path: "Path | str",
+        backend: str = "mmap",
+        fst_cache: FSTCache = None,
+        instrumentation: Instrumentation = None,
+    ) -> "Self":
+        """
+        Open a raw, CISO or GCZ image, the format is detected from the file contents.
+        The backend can be 'mmap' to map the whole image into memory, or 'file' to use positional
+        reads through a small block cache, which is lighter when many images are open at once.
+        If an FST cache is given, the parsed FST is taken from it when the image
+        hasn't changed since it was cached, and stored in it otherwise.
+        If instrumentation is given, it receives the events of loading the image and all work done on it.
+        """
+        path = Path(path)
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        with instrumentation.phase("load") as phase:
+            image_stream = GamecubeISO._open_image_stream(path, backend)
+            try:
+                iso = GamecubeISO(path.name, image_stream)
+            except Exception:
+                # the image couldn't be read, so nothing else will close the stream
+                image_stream.close()
+                raise
+            iso.image_path = path
+            iso.fst_cache = fst_cache
+            iso.instrumentation = instrumentation
+            phase.update(files=1, bytes_read=GamecubeISO.DiscHeaderSize)
+        return iso
+
+    @staticmethod
+    def probe_image_file(path: "Path | str") -> DiscHeader:
+        """
+        Read only the disc header of an image, for getting its game code and title without
+        opening the rest of it.
+        """
+        image_stream = GamecubeISO._open_image_stream(Path(path), "file")
+        try:
+            disc_header = image_stream.get_bytes_at_offset(0, GamecubeISO.DiscHeaderSize)
+        finally:
+            image_stream.close()
+        return DiscHeader(MemoryStream(disc_header))
+
+
+class ImageBatch:
+    """
+    A batch of file changes to a GamecubeISO. Files are named like in open_file, and the changes to
+    the FST are renumbered and laid out once when the batch is committed, along with the disc header
+    if the size of the FST changed. Files are only added to the image when the batch is committed.
+    If the block the batch is used in raises, the FST changes queued so far are rolled back.
+    """
+
+    def __init__(self, iso: GamecubeISO) -> None:
+        self.iso = iso
+        self.fst_batch = iso.table_of_contents.batch()
+        self._entries: "dict[str, FSTFile]" = None
+        self._added_files: "list[AbstractFile]" = []
+        self._replaced_files: "list[AbstractFile]" = []
+        self._removed_files: "list[str]" = []
+        self._renamed_files: "list[tuple[str, str]]" = []
+
+    def _get_entries(self) -> "dict[str, FSTFile]":
+        if self._entries is None:
+            # names are looked up in a map taken once, the tree changes as the batch is queued
+            self._entries = self.iso.table_of_contents.get_files_by_name()
+        return self._entries
+
+    def _get_entry(self, file_name: str) -> FSTFile:
+        entry = self._get_entries().get(file_name)
+        if entry is None:
+            raise ValueError(f"No file named {file_name} in the image.")
+        return entry
+
+    def _get_directory(self, directory_name: "str | None") -> FSTDirectory:
+        table_of_contents = self.iso.table_of_contents
+        if directory_name is None:
+            return table_of_contents.root_directory
+        for directory in table_of_contents.get_fst_directory_list():
+            if str(directory.filename) == directory_name:
+                return directory
+        raise ValueError(f"No directory named {directory_name} in the image.")
+
+    def add_file(self, file: AbstractFile, parent_directory: str = None):
+        if file.file_name in self._get_entries():
+            return
+        directory = self._get_directory(parent_directory)
+        entry = self.fst_batch.add_file(
+            file.file_name, file.file_contents.stream_size, directory
+        )
+        self._get_entries()[file.file_name] = entry
+        self._added_files.append(file)
+
+    def replace_file(self, file: AbstractFile):
+        entry = self._get_entry(file.file_name)
+        self.fst_batch.resize_file(entry, file.file_contents.stream_size)
+        self._replaced_files.append(file)
+
+    def remove_file(self, file_name: str):
+        entry = self._get_entry(file_name)
+        self.fst_batch.remove_file(entry)
+        del self._get_entries()[file_name]
+        self._removed_files.append(file_name)
+
+    def move_file(self, file_name: str, parent_directory: str = None, new_name: str = None):
+        """
+        Move a file to the end of another directory, or the root if none is given, and rename it
+        if a new name is given.
+        """
+        entry = self._get_entry(file_name)
+        self.fst_batch.move_file(entry, self._get_directory(parent_directory), new_name)
+        if new_name is not None and new_name != file_name:
+            entries = self._get_entries()
+            entries[new_name] = entries.pop(file_name)
+            self._renamed_files.append((file_name, new_name))
+
+    def commit(self):
+        iso = self.iso
+        disc_header = iso.disc_header
+        self.fst_batch.commit(disc_header.fst_offset)
+
+        fst_size = iso.table_of_contents.file_size
+        if fst_size != disc_header.fst_size:
+            disc_header.fst_size = fst_size
+            disc_header.fst_max_size = max(fst_size, disc_header.fst_max_size)
+            disc_header.replace_bytes(
+                SizeOfFSTOffset, struct.pack(">II", fst_size, disc_header.fst_max_size)
+            )
+
+        for old_name, new_name in self._renamed_files:
+            if old_name in iso.extracted_archive_files:
+                file = iso.extracted_archive_files.pop(old_name)
+                file.file_name = new_name
+                iso.extracted_archive_files[new_name] = file
+            if old_name in iso.dirty_files:
+                iso.dirty_files.discard(old_name)
+                iso.mark_dirty(new_name)
+        for file in self._added_files:
+            AbstractFileArchive.add_new_file(iso, file)
+        for file in self._replaced_files:
+            AbstractFileArchive.replace_file(iso, file)
+        for file_name in self._removed_files:
+            iso.extracted_archive_files.pop(file_name, None)
+            iso.mark_dirty(file_name)
+
+    def __enter__(self) -> "ImageBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.fst_batch.rollback()
@@ -0,0 +1,182 @@
+import struct
+
+from .. import Stream
+from . import DiscHeader
+
+_MASK = 0xFFFFFFFF
+
+
+class JunkGenerator:
+    """
+    Generates the pseudo-random data that Nintendo's mastering tools fill unused space on a disc with.
+    It comes from a lagged Fibonacci generator that is reseeded at the start of every 32 KiB block
+    of the disc from the game ID, disc number and block number, so any range can be generated
+    without generating what comes before it.
+
+    The state is 521 words. Each block is generated from 17 seed words, which are expanded to the
+    full state and stepped 4 times before anything is output. After that the state is output and
+    stepped until the block is full. A step XORs every word with the word 32 before it, so
+    32 words are stepped at a time, as one integer in Python or as rows of blocks with NumPy.
+    """
+
+    BLOCK_SIZE = 0x8000
+    SEED_SIZE = 17
+    LFG_K = 521
+    LFG_J = 32
+    # the bytes before junk are aligned to this, the gap up to it is left zeroed
+    ALIGNMENT = 4
+
+    def __init__(self, game_id: bytes, disc_number: int, use_numpy: bool = None) -> None:
+        """
+        Make a generator for the disc with the given 4 byte game ID and disc number.
+        If use_numpy isn't given NumPy is used if it's installed.
+        """
+        if use_numpy is None:
+            import importlib.util
+
+            use_numpy = importlib.util.find_spec("numpy") is not None
+        self.use_numpy = use_numpy
+        self._lcg_steps = None
+        self.seed = (
+            int.from_bytes(
+                bytes(
+                    [
+                        game_id[2],
+                        game_id[1],
+                        (game_id[3] + game_id[2]) & 0xFF,
+                        (game_id[0] + game_id[1]) & 0xFF,
+                    ]
+                ),
+                "big",
+            )
+            ^ disc_number
+        )
+
+    @classmethod
+    def from_disc_header(cls, disc_header: DiscHeader, use_numpy: bool = None) -> "JunkGenerator":
+        return cls(bytes(disc_header.read_bytes(0, 4)), disc_header.disk_id, use_numpy)
+
+    def _get_block_seed(self, block: int) -> int:
+        return ((self.seed * 0x260BCD5) ^ (block * 0x1EF29123)) & _MASK
+
+    def _generate_block(self, block: int) -> bytes:
+        n = self._get_block_seed(block)
+        buffer = []
+        for _ in range(self.SEED_SIZE):
+            word = 0
+            for _ in range(self.LFG_J):
+                n = (n * 0x5D588B65 + 1) & _MASK
+                word = (word >> 1) | (n & 0x80000000)
+            buffer.append(word)
+        buffer[16] ^= (buffer[0] >> 9) ^ ((buffer[16] << 23) & _MASK)
+
+        for i in range(self.SEED_SIZE, self.LFG_K):
+            buffer.append(((buffer[i - 17] << 23) & _MASK) ^ (buffer[i - 16] >> 9) ^ buffer[i - 1])
+        # the generator outputs bits 18-25 of each word as its second byte instead of bits 16-23
+        buffer = [(x & 0xFF00FFFF) | ((x >> 2) & 0x00FF0000) for x in buffer]
+
+        # each chunk holds 32 words, the last one holds the 9 words left over
+        state = struct.pack(f">{self.LFG_K}I", *buffer)
+        chunks = [int.from_bytes(state[i : i + 128], "big") for i in range(0, len(state), 128)]
+        for _ in range(4):
+            self._step(chunks)
+
+        output = []
+        for _ in range(-(-self.BLOCK_SIZE // len(state))):
+            output.extend(chunk.to_bytes(128, "big") for chunk in chunks[:-1])
+            output.append(chunks[-1].to_bytes(36, "big"))
+            self._step(chunks)
+        return b"".join(output)[: self.BLOCK_SIZE]
+
+    @staticmethod
+    def _step(chunks: "list[int]"):
+        # words 489-520, the last 23 words of chunk 15 and all of chunk 16
+        chunks[0] ^= ((chunks[15] & ((1 << 736) - 1)) << 288) | chunks[16]
+        for i in range(1, 16):
+            chunks[i] ^= chunks[i - 1]
+        chunks[16] ^= chunks[15] >> 736
+
+    def _generate_blocks_numpy(self, first_block: int, block_count: int) -> bytes:
+        import numpy
+
+        # the n-th value of the seed LCG is a_n * n_0 + c_n, so every block is seeded at once
+        if self._lcg_steps is None:
+            steps = self.SEED_SIZE * self.LFG_J
+            self._lcg_steps = numpy.empty((2, steps), numpy.uint32)
+            a, c = 1, 0
+            for i in range(steps):
+                a, c = (a * 0x5D588B65) & _MASK, (c * 0x5D588B65 + 1) & _MASK
+                self._lcg_steps[:, i] = a, c
+        lcg = self._lcg_steps
+        blocks = numpy.arange(first_block, first_block + block_count, dtype=numpy.uint32)
+        seeds = numpy.uint32((self.seed * 0x260BCD5) & _MASK) ^ (blocks * numpy.uint32(0x1EF29123))
+        top_bits = ((seeds[:, None] * lcg[0] + lcg[1]) >> 31).reshape(
+            block_count, self.SEED_SIZE, self.LFG_J
+        )
+        seed_words = (top_bits << numpy.arange(self.LFG_J, dtype=numpy.uint32)).sum(
+            axis=2, dtype=numpy.uint32
+        )
+
+        # one row per word and one column per block
+        buffer = numpy.empty((self.LFG_K, block_count), numpy.uint32)
+        buffer[: self.SEED_SIZE] = seed_words.T
+        buffer[16] ^= (buffer[0] >> 9) ^ (buffer[16] << 23)
+        for i in range(self.SEED_SIZE, self.LFG_K):
+            buffer[i] = (buffer[i - 17] << 23) ^ (buffer[i - 16] >> 9) ^ buffer[i - 1]
+        buffer = (buffer & 0xFF00FFFF) | ((buffer >> 2) & 0x00FF0000)
+
+        def step():
+            buffer[: self.LFG_J] ^= buffer[self.LFG_K - self.LFG_J :]
+            for i in range(self.LFG_J, self.LFG_K, self.LFG_J):
+                end = min(i + self.LFG_J, self.LFG_K)
+                buffer[i:end] ^= buffer[i - self.LFG_J : end - self.LFG_J]
+
+        for _ in range(4):
+            step()
+        round_count = -(-self.BLOCK_SIZE // (self.LFG_K * 4))
+        rounds = numpy.empty((round_count, self.LFG_K, block_count), numpy.uint32)
+        for i in range(len(rounds)):
+            rounds[i] = buffer
+            step()
+        words = rounds.transpose(2, 0, 1).reshape(block_count, -1)[:, : self.BLOCK_SIZE // 4]
+        return words.astype(">u4").tobytes()
+
+    def get_bytes(self, offset: int, count: int) -> bytes:
+        """
+        Get the junk data for a range of the disc.
+        """
+        if count <= 0:
+            return b""
+        first_block = offset // self.BLOCK_SIZE
+        block_count = -(-(offset + count) // self.BLOCK_SIZE) - first_block
+        if self.use_numpy:
+            data = self._generate_blocks_numpy(first_block, block_count)
+        else:
+            data = b"".join(self._generate_block(first_block + i) for i in range(block_count))
+        start = offset - first_block * self.BLOCK_SIZE
+        return data[start : start + count]
+
+    def fill_gaps(
+        self,
+        write_stream: Stream,
+        used_extents: "list[tuple[int, int]]",
+        size: int,
+        chunk_size: int = 0x400000,
+    ) -> int:
+        """
+        Write junk data to every part of the stream up to size that isn't in the sorted (offset, size)
+        ranges. Junk after a range starts at the next aligned offset, like on a disc.
+        Returns the number of junk bytes written.
+        """
+        written = 0
+        current_offset = 0
+        for offset, extent_size in list(used_extents) + [(size, 0)]:
+            offset = min(offset, size)
+            gap_offset = current_offset + Stream.align_bytes(current_offset, self.ALIGNMENT)
+            while gap_offset < offset:
+                write_size = min(chunk_size, offset - gap_offset)
+                write_stream.write_bytes_at_offset(gap_offset, self.get_bytes(gap_offset, write_size))
+                gap_offset += write_size
+                written += write_size
+            current_offset = max(current_offset, offset + extent_size)
+        return written
@@ -0,0 +1,168 @@
+from pathlib import Path
+from typing import Iterable
+
+from .. import Stream
+from . import FSTFile, TableOfContents
+
+
+class AccessTrace:
+    """
+    The files a game read, in the order it read them. Each access is a file name, a path from the
+    root of the disc, or an offset on the disc that falls inside the file that was read.
+    """
+
+    def __init__(self, accesses: "Iterable[str | int]") -> None:
+        self.accesses = list(accesses)
+
+    @classmethod
+    def from_file(cls, path: "Path | str") -> "AccessTrace":
+        """
+        Read a trace with one access per line. Lines that are blank or start with '#' are skipped,
+        and lines starting with '0x' are read as offsets.
+        """
+        accesses = []
+        for line in Path(path).read_text().splitlines():
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            accesses.append(int(line, 16) if line.lower().startswith("0x") else line)
+        return cls(accesses)
+
+    def resolve(self, table_of_contents: TableOfContents) -> "tuple[list[FSTFile], list[str | int]]":
+        """
+        Get the file read by each access, along with the accesses that don't match any file.
+        Offsets are matched against where the files are laid out now.
+        """
+        from bisect import bisect_right
+
+        files_by_name = table_of_contents.get_files_by_name()
+        files_by_path = dict(table_of_contents.get_fst_file_paths())
+        files_by_offset = table_of_contents.get_files_by_offset()
+        offsets = [f.data_offset for f in files_by_offset]
+
+        files, unresolved = [], []
+        for access in self.accesses:
+            file = None
+            if isinstance(access, int):
+                index = bisect_right(offsets, access) - 1
+                if index >= 0 and access < offsets[index] + files_by_offset[index].data_size:
+                    file = files_by_offset[index]
+            else:
+                path = access.replace("\\", "/").strip("/")
+                file = files_by_path.get(path) or files_by_name.get(path)
+            if file is None:
+                unresolved.append(access)
+            else:
+                files.append(file)
+        return files, unresolved
+
+
+def estimate_seek_distance(
+    files: "list[FSTFile]", offsets: "dict[FSTFile, int]" = None
+) -> int:
+    """
+    Estimate how far the drive has to seek to read the files in order, as the sum of the distances
+    from the end of each file to the start of the next one. If offsets are given, files are read
+    from the offset stored under their entry instead of where they are now.
+    """
+    distance = 0
+    previous_end = None
+    for file in files:
+        offset = file.data_offset if offsets is None else offsets.get(file, file.data_offset)
+        if previous_end is not None:
+            distance += abs(offset - previous_end)
+        previous_end = offset + file.data_size
+    return distance
+
+
+class LayoutReport:
+    """
+    What applying a layout did, with the seek distances estimated for the trace it came from.
+    """
+
+    def __init__(
+        self,
+        seek_distance_before: int,
+        seek_distance_after: int,
+        moved_files: int,
+        unresolved: "list[str | int]",
+    ) -> None:
+        self.seek_distance_before = seek_distance_before
+        self.seek_distance_after = seek_distance_after
+        self.moved_files = moved_files
+        self.unresolved = unresolved
+
+    def to_json_obj(self) -> dict:
+        return {
+            "seek_distance_before": self.seek_distance_before,
+            "seek_distance_after": self.seek_distance_after,
+            "moved_files": self.moved_files,
+            "unresolved": [hex(a) if isinstance(a, int) else a for a in self.unresolved],
+        }
+
+
+class LayoutOptimizer:
+    """
+    Plans where file data goes on the disc from an access trace. Files the trace never reads keep
+    their order and are packed from the start of the data area. Files it reads are packed after
+    them in the order they're first read, so files loaded together are read in one sweep.
+    The drive reads the outer edge of the disc fastest, so if an end offset is given the files
+    that are read are packed against it instead of directly after the rest.
+    """
+
+    def __init__(self, table_of_contents: TableOfContents, trace: AccessTrace) -> None:
+        self.table_of_contents = table_of_contents
+        self.accessed_files, self.unresolved = trace.resolve(table_of_contents)
+
+    def get_file_order(self) -> "tuple[list[FSTFile], list[FSTFile]]":
+        """
+        Get the files the trace doesn't read in offset order, and the ones it reads in the order
+        they're first read.
+        """
+        hot_files = list(dict.fromkeys(self.accessed_files))
+        hot_file_set = set(hot_files)
+        cold_files = [f for f in self.table_of_contents.get_files_by_offset() if f not in hot_file_set]
+        return cold_files, hot_files
+
+    @staticmethod
+    def _place(
+        files: "list[FSTFile]",
+        offset: int,
+        reserved: "list[tuple[int, int]]",
+        offsets: "dict[FSTFile, int]",
+    ) -> int:
+        for file in files:
+            offset += Stream.align_bytes(offset)
+            for reserved_offset, reserved_size in sorted(reserved):
+                if offset < reserved_offset + reserved_size and reserved_offset < offset + file.data_size:
+                    offset = reserved_offset + reserved_size
+                    offset += Stream.align_bytes(offset)
+            offsets[file] = offset
+            offset += file.data_size
+        return offset
+
+    def plan(
+        self,
+        start_offset: int,
+        reserved: "list[tuple[int, int]]" = (),
+        end_offset: int = None,
+    ) -> "dict[FSTFile, int]":
+        """
+        Get the new offset of every file, keyed by its entry. Files are laid out from the
+        start offset, aligned, and kept clear of the reserved (offset, size) ranges.
+        """
+        cold_files, hot_files = self.get_file_order()
+        offsets = {}
+        cold_end = self._place(cold_files, start_offset, reserved, offsets)
+
+        hot_start = cold_end
+        if end_offset is not None:
+            hot_size = sum(f.data_size + Stream.align_bytes(f.data_size) for f in hot_files)
+            outer_start = (end_offset - hot_size) // 2048 * 2048
+            outer_clear = all(
+                offset + size <= outer_start or offset >= end_offset for offset, size in reserved
+            )
+            if outer_start > cold_end and outer_clear:
+                hot_start = outer_start
+        self._place(hot_files, hot_start, reserved, offsets)
+        return offsets
@@ -1,3 +1,7 @@
+import array
+import threading
+from typing import Callable, Iterator
+
 from . import ( 
     FSTDirectory,
     FSTRootDirectory,
@@ -9,7 +13,7 @@ from .. import (
     MemoryStream,
     Stream,
 )
-from ..unicode import UnicodeString
+from ..unicode import UnicodeCharacter, UnicodeString
 
 
 class TableOfContents(AbstractFile):
@@ -27,69 +31,141 @@ class TableOfContents(AbstractFile):
         Both will have a name and a unique index.
         """
         super().__init__("fst.bin", fst_bin)
-        number_of_entries = fst_bin.get_int_at_offset(self.TOC_NUMBER_OF_ENTRIES_OFFSET)
-        self.root_directory = FSTRootDirectory(number_of_entries)
+        (number_of_entries,) = fst_bin.read_struct("I", self.TOC_NUMBER_OF_ENTRIES_OFFSET)
+        self._root_directory = FSTRootDirectory(number_of_entries)
+        self._pending_entries: "list[tuple[bool, int, int, int, bytes]] | None" = None
+        self._tree_lock = threading.Lock()
         self.string_table_offset = self.root_directory.next_offset * self.TOC_ENTRY_SIZE
         self.file_size = fst_bin.stream_size
         self._made_space = False
-
-        self._load_fst(fst_bin, self.root_directory)
-
-    def _load_fst(self, fst_bin: Stream, root: FSTDirectory, start_index=1):
+        # bumped by every change to the layout, so owners can tell if the FST needs rewriting
+        self.version = 0
+        # files that weren't on the source disc, in the order they were added
+        self.added_files: "list[FSTFile]" = []
+        # where applied layouts or a defragment put files from the source disc, by their entry
+        self.planned_offsets: "dict[FSTFile, int]" = {}
+        # flattened views of the tree, rebuilt when the version changes
+        self._cache: "dict[str, object]" = {}
+        self._cache_version = 0
+
+        self._add_entries(self._read_entries(fst_bin))
+
+    @classmethod
+    def from_entries(
+        cls, fst_bin: Stream, entries: "list[tuple[bool, int, int, int, bytes]]"
+    ) -> "TableOfContents":
+        """
+        Build the directory tree from already decoded (is_directory, name_offset, a, b, name) entries
+        in FST order, where a and b are the parent and next entry of directories, or the offset and
+        size of files. This skips walking fst_bin, which is only kept as the file contents.
+        The tree is only built the first time it's used, until then the entries and the total
+        size of the files are answered from the entries as given.
         """
-        Walk the table of contents and load the directory tree.
-        This function recursively calls itself to load sub-directories.
+        toc = cls.__new__(cls)
+        AbstractFile.__init__(toc, "fst.bin", fst_bin)
+        toc._root_directory = FSTRootDirectory(len(entries) + 1)
+        toc._pending_entries = entries
+        toc._tree_lock = threading.Lock()
+        toc.string_table_offset = toc._root_directory.next_offset * cls.TOC_ENTRY_SIZE
+        toc.file_size = fst_bin.stream_size
+        toc._made_space = False
+        toc.version = 0
+        toc.added_files = []
+        toc.planned_offsets = {}
+        toc._cache = {}
+        toc._cache_version = 0
+        return toc
+
+    @property
+    def root_directory(self) -> FSTRootDirectory:
+        if self._pending_entries is not None:
+            with self._tree_lock:
+                if self._pending_entries is not None:
+                    self._add_entries(self._pending_entries)
+                    self._pending_entries = None
+        return self._root_directory
+
+    @root_directory.setter
+    def root_directory(self, value: FSTRootDirectory):
+        self._root_directory = value
+
+    def _add_entries(self, entries: "list[tuple[bool, int, int, int, bytes]]"):
         """
-        index = start_index
-        while index < root.next_offset:
-            entry_offset = index * self.TOC_ENTRY_SIZE
-            is_directory = fst_bin.get_byte_at_offset(entry_offset) != 0
+        Build the directory tree from entries in the form from_entries takes.
+        """
+        directories: "list[FSTDirectory]" = [self._root_directory]
+        for index, (is_directory, name_offset, a, b, name) in enumerate(entries, 1):
+            while len(directories) > 1 and index >= directories[-1].next_offset:
+                directories.pop()
 
-            name_offset = fst_bin.get_int_at_offset(entry_offset) & 0x00FFFFFF
+            if is_directory:
+                entry = FSTDirectory(index, name_offset, a, b)
+            else:
+                entry = FSTFile(index, name_offset, a, b)
 
+            filename = UnicodeString()
+            filename.chars = [UnicodeCharacter(char_byte) for char_byte in name]
+            entry.set_name(filename)
+            directories[-1].add_child(entry)
             if is_directory:
-                parent_entry = fst_bin.get_int_at_offset(entry_offset + 4)
-                end_dir_entry = fst_bin.get_int_at_offset(entry_offset + 8)
-                file_entry = FSTDirectory(
-                    index, name_offset, parent_entry, end_dir_entry
-                )
+                directories.append(entry)
 
-                self._load_fst(fst_bin, file_entry, index + 1)
-                index = end_dir_entry
+    def get_entries(self) -> "list[tuple[bool, int, int, int, bytes]]":
+        """
+        Get the entries of the FST in the form from_entries takes.
+        """
+        pending_entries = self._pending_entries
+        if pending_entries is not None:
+            return list(pending_entries)
+        entries = []
+        for entry in self.get_fst_list()[1:]:
+            name = bytes(entry.filename.to_bytes()[:-1])
+            if isinstance(entry, FSTDirectory):
+                entries.append((True, entry.name_offset, entry.parent_entry, entry.next_offset, name))
             else:
-                file_offset = fst_bin.get_int_at_offset(entry_offset + 4)
-                file_size = fst_bin.get_int_at_offset(entry_offset + 8)
-
-                file_entry = FSTFile(index, name_offset, file_offset, file_size)
-                index += 1
+                entries.append((False, entry.name_offset, entry.data_offset, entry.data_size, name))
+        return entries
 
-            file_name_string = fst_bin.get_string_at_offset(
-                self.string_table_offset + name_offset
+    def _read_entries(self, fst_bin: Stream) -> "list[tuple[bool, int, int, int, bytes]]":
+        """
+        Decode every entry of the table of contents with one read of the table and one of the
+        string table, rather than a read per field and per name.
+        """
+        table = fst_bin.read_structs("III", 0, self.root_directory.next_offset)
+        string_table = bytes(
+            fst_bin.get_bytes_at_offset(
+                self.string_table_offset, fst_bin.stream_size - self.string_table_offset
             )
-            file_entry.set_name(file_name_string)
+        )
 
-            root.add_child(file_entry)
+        entries = []
+        for type_and_name_offset, a, b in table[1:]:
+            name_offset = type_and_name_offset & 0x00FFFFFF
+            name_end = string_table.find(b"\0", name_offset)
+            if name_end < 0:
+                name_end = len(string_table)
+            is_directory = type_and_name_offset >> 24 != 0
+            entries.append((is_directory, name_offset, a, b, string_table[name_offset:name_end]))
+        return entries
 
     def get_game_file_size(self):
-        fst_list = self.get_fst_file_list()
-        return sum([f.data_size for f in fst_list])
+        pending_entries = self._pending_entries
+        if pending_entries is not None:
+            return sum(b for is_directory, _, _, b, _ in pending_entries if not is_directory)
+        return sum(f.data_size for f in self._get_cached("files", self._build_file_list))
 
     def search_file_by_name(
         self, file_name: str, root: FSTDirectory = None
     ) -> "FSTFile | None":
         """
-        Walk the filesystem to search for a file with a given name.
+        Search for the first file in FST order with a given name.
+        Searches of the whole tree are answered from a cached map of names.
         """
-        if root == None:
-            root = self.root_directory
-        for child in root._children:
-            if isinstance(child, FSTDirectory):
-                candidate = self.search_file_by_name(file_name, child)
-                if candidate is not None:
-                    return candidate
-            elif str(child.filename) == file_name:
-                return child
-
+        if root is None:
+            return self._get_cached("names", self._build_name_map).get(file_name)
+        for entry in self.iter_fst_entries(root):
+            if isinstance(entry, FSTFile) and str(entry.filename) == file_name:
+                return entry
         return None
 
     def search_directory_by_name(
@@ -114,96 +190,97 @@ class TableOfContents(AbstractFile):
         file_name: "UnicodeString | str",
         file_size: int,
         parent_directory: FSTDirectory = None,
-    ):
+    ) -> FSTFile:
         """
-        Given a filename and its size, find available space for in the FST and create an entry for it.
+        Given a filename and its size, create an entry for it at the end of a directory
+        and place its data after the last file on the disc.
         """
-        filename = UnicodeString(file_name)
-        if parent_directory is None:
-            parent_directory = self.root_directory
-
-        # overrun_bytes = file_size + self.get_game_file_size() - self.GC_ISO_MAX_SIZE
-        # if overrun_bytes > 0:
-        #     print("WARNING: This file will make the image bigger than a standard ISO. This *may* work in an emulator but is likely to cause a crash.")
-        #     print("Either remove the file, compress the file, or reduce the quality until it'll fit.")
-        #     print(f"File overran by {overrun_bytes} bytes")
-
-        fst_list = self.get_fst_file_list()
-        fst_list.sort(key=lambda f: f.data_offset)
-        last_fst_entry = fst_list[-1]
-
-        target_offset = -1
-        target_name_offset = -1
-        target_index = parent_directory.next_offset + 1
-
-        # look for file space at the end first, if defragmented, we will surely find space
-        if last_fst_entry.data_offset + last_fst_entry.data_size < self.GC_ISO_MAX_SIZE:
-            target_offset = last_fst_entry.data_offset + last_fst_entry.data_size
-
-        # no space found, look for gaps between files
-        if target_offset < 0:
-            for i in range(len(fst_list) - 1):
-                curr_file = fst_list[i]
-                next_file = fst_list[i + 1]
-                gap = curr_file.data_offset + curr_file.data_size - next_file.data_offset
-                if gap > file_size:
-                    target_offset = curr_file.data_offset + curr_file.data_size
-                    break
-
-        if target_offset < 0:
-            print("No space found, could not add file to image.")
-            return
-        
-        fst_list.sort(key=lambda f: f.name_offset)
-        last_fst_entry = fst_list[-1]
-        target_name_offset = last_fst_entry.name_offset + len(last_fst_entry.filename.to_bytes())
-                
-        fst_entry = FSTFile(target_index, target_name_offset, target_offset, file_size)
-        fst_entry.filename = filename
-
-        fst_list = self.get_fst_list()
-        fst_list.sort(key=lambda f: f.file_entry)
-        for i in range(target_index, len(fst_list)):
-            entry = fst_list[i]
-            entry.file_entry += 1
-            if isinstance(entry, FSTDirectory):
-                entry.next_offset += 1
-
-        parent_directory.next_offset += 1
-        if parent_directory.file_entry != 0:
-            self.root_directory.next_offset += 1
-
-        parent_directory.add_child(fst_entry)
+        with self.batch() as batch:
+            return batch.add_file(file_name, file_size, parent_directory)
 
     def remove_file(self, fst_entry: FSTEntry):
-        fst_list = self.get_fst_list()
-        fst_list.sort(key=lambda f: f.file_entry)
-        for i in range(fst_entry.file_entry, len(fst_list)):
-            entry = fst_list[i]
-            entry.file_entry -= 1
-            if isinstance(entry, FSTDirectory):
-                entry.next_offset -= 1
+        with self.batch() as batch:
+            batch.remove_file(fst_entry)
 
-        parent_directory = self.root_directory
-        for f in fst_list:
-            if isinstance(f, FSTDirectory) and f.file_entry > 0 and f.file_entry < fst_entry.file_entry and f.next_offset > fst_entry.file_entry:
-                parent_directory = f
-                break
+    def batch(self) -> "FSTBatch":
+        """
+        Start a batch of adds, removes, resizes and moves. Changes to the tree are made as each one is
+        queued, and the entries are renumbered and laid out once when the batch is committed.
+        Use it as a context manager to commit when the block exits without an error.
+        """
+        return FSTBatch(self)
 
-        parent_directory.next_offset -= 1
-        if parent_directory.file_entry != 0:
-            self.root_directory.next_offset -= 1
+    def renumber(self):
+        """
+        Give every entry its index in tree order, every directory its parent and end indices,
+        and every name its offset in a string table written in tree order.
+        """
+        entry_count, string_table_size = self._renumber_directory(self.root_directory, 1, 0)
+        self.root_directory.next_offset = entry_count
+        self.string_table_offset = entry_count * self.TOC_ENTRY_SIZE
+        self.file_size = self.string_table_offset + string_table_size
+
+    def _renumber_directory(
+        self, directory: FSTDirectory, index: int, name_offset: int
+    ) -> "tuple[int, int]":
+        for child in directory.get_file_entries():
+            child.file_entry = index
+            child.name_offset = name_offset
+            name_offset += len(child.filename.to_bytes())
+            index += 1
+            if isinstance(child, FSTDirectory):
+                child.parent_entry = 0 if directory is self.root_directory else directory.file_entry
+                index, name_offset = self._renumber_directory(child, index, name_offset)
+                child.next_offset = index
+        return index, name_offset
 
+    def layout_files(self, fst_offset: int = None):
+        """
+        Lay out the files from where they were on the source disc, or where an applied layout or a
+        defragment put them, in one pass in that order, moving files forward just far enough that
+        none overlap.
+        Files added since come last, in the order they were added. Since this only depends on the
+        source layout and the current entries, laying out after every change gives the same result
+        as laying out once after all of them. If the offset of the FST on the disc is given, files
+        after it are kept clear of its new size.
+        """
+        added_files = set(self.added_files)
+        planned_offsets = self.planned_offsets
+        fst_list = [f for f in self.get_fst_file_list() if f not in added_files]
+        fst_list.sort(key=lambda f: planned_offsets.get(f, f.old_offset))
+
+        end_offset = 0
+        for entry in fst_list + self.added_files:
+            offset = planned_offsets.get(entry, entry.old_offset)
+            if entry in added_files:
+                offset = end_offset + Stream.align_bytes(end_offset)
+            if fst_offset is not None and offset >= fst_offset:
+                end_offset = max(end_offset, fst_offset + self.file_size)
+            if offset < end_offset:
+                offset = end_offset + Stream.align_bytes(end_offset)
+            entry.data_offset = offset
+            end_offset = max(end_offset, offset + entry.data_size)
+
+    def apply_layout(self, offsets: "dict[FSTFile, int]"):
+        """
+        Move the files to the offsets stored under their entries, and lay them out from there on
+        later changes. Files that weren't given an offset stay where they are.
+        """
+        added_files = set(self.added_files)
+        for entry in self.get_fst_file_list():
+            offset = offsets.get(entry)
+            if offset is not None:
+                entry.data_offset = offset
+                if entry not in added_files:
+                    self.planned_offsets[entry] = offset
+        self.invalidate()
 
     def update_fst_offsets(self):
         """
         Traverse the FST file list and fix any overlapping data offsets detected.
         """
-        fst_list = self.get_fst_list()
         self.string_table_offset = len(self.root_directory) * self.TOC_ENTRY_SIZE
-
-        fst_list: "list[FSTFile]" = list(self.get_fst_file_list())
-        fst_list.sort(key=lambda fst: fst.data_offset)
+        fst_list = self.get_files_by_offset()
 
         for i in range(len(fst_list) - 1):
             current_file = fst_list[i]
@@ -219,47 +296,135 @@ class TableOfContents(AbstractFile):
                     - next_file.data_offset
                 )
                 next_file.data_offset += shift_amount
+        self._plan_current_layout()
+        self.invalidate()
 
     def defragment(self, start_offset=-1):
         """
         Repack the filesystem to move all files directly adjacent to each other and free space at the end of the file.
         """
-        fst_file_list: "list[FSTFile]" = self.get_fst_file_list()
-        fst_file_list.sort(key=lambda fst: fst.data_offset)
+        fst_file_list = self.get_files_by_offset()
         data_offset = start_offset if start_offset > 0 else fst_file_list[0].data_offset
 
         for entry in fst_file_list:
             entry.data_offset = data_offset
             data_offset += entry.data_size + Stream.align_bytes(entry.data_size)
+        self._plan_current_layout()
+        self.invalidate()
 
-    def get_fst_list(self, start_directory: FSTDirectory = None) -> "list[FSTEntry]":
+    def _plan_current_layout(self):
+        # later changes are laid out from where the files are now instead of from the source disc,
+        # and files that were added are part of that layout rather than placed after it
+        for entry in self.get_fst_file_list():
+            self.planned_offsets[entry] = entry.data_offset
+        self.added_files = []
+
+    def invalidate(self):
+        """
+        Mark the tree or the layout as changed. Anything that changes entries without going through
+        a batch, defragment or update_fst_offsets has to call this so cached lists are rebuilt.
+        """
+        self.version += 1
+
+    def _get_cached(self, key: str, build: "Callable[[], object]"):
+        """
+        Get a value derived from the tree, building it if the tree changed since it was cached.
+        """
+        if self._cache_version != self.version:
+            self._cache = {}
+            self._cache_version = self.version
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def _build_file_list(self) -> "tuple[FSTFile, ...]":
+        return tuple(
+            e for e in self._get_cached("entries", self._build_entry_list) if isinstance(e, FSTFile)
+        )
+
+    def _build_entry_list(self) -> "tuple[FSTEntry, ...]":
+        return tuple(self.iter_fst_entries())
+
+    def _build_name_map(self) -> "dict[str, FSTFile]":
+        names = {}
+        for entry in self._get_cached("files", self._build_file_list):
+            names.setdefault(str(entry.filename), entry)
+        return names
+
+    def iter_fst_entries(self, start_directory: FSTDirectory = None) -> "Iterator[FSTEntry]":
         """
-        Get an in order list containing each file and directory
+        Walk each file and directory in FST order without building a list.
         """
         if start_directory is None:
             start_directory = self.root_directory
 
-        fst_list = [start_directory]
-        for child in start_directory.get_file_entries():
-            if isinstance(child, FSTDirectory):
-                fst_list = fst_list + self.get_fst_list(child)
+        yield start_directory
+        children = [iter(start_directory.get_file_entries())]
+        while len(children) > 0:
+            for child in children[-1]:
+                yield child
+                if isinstance(child, FSTDirectory):
+                    children.append(iter(child.get_file_entries()))
+                    break
             else:
-                fst_list.append(child)
-        return fst_list
+                children.pop()
+
+    def get_fst_list(self, start_directory: FSTDirectory = None) -> "list[FSTEntry]":
+        """
+        Get an in order list containing each file and directory.
+        The list of the whole tree is cached until the tree changes, callers get their own copy.
+        """
+        if start_directory is None:
+            return list(self._get_cached("entries", self._build_entry_list))
+        return list(self.iter_fst_entries(start_directory))
 
     def get_fst_file_list(
         self, start_directory: FSTDirectory = None
     ) -> "list[FSTFile]":
-        return list(
-            filter(
-                lambda fst: isinstance(fst, FSTFile), self.get_fst_list(start_directory)
-            )
+        if start_directory is None:
+            return list(self._get_cached("files", self._build_file_list))
+        return [e for e in self.iter_fst_entries(start_directory) if isinstance(e, FSTFile)]
+
+    def get_files_by_name(self) -> "dict[str, FSTFile]":
+        """
+        Get a map of file names to the first file in FST order with that name.
+        """
+        return dict(self._get_cached("names", self._build_name_map))
+
+    def get_files_by_offset(self) -> "tuple[FSTFile, ...]":
+        """
+        Get every file sorted by where its data is on the disc, cached until the layout changes.
+        """
+        return self._get_cached(
+            "by_offset",
+            lambda: tuple(
+                sorted(self._get_cached("files", self._build_file_list), key=lambda f: f.data_offset)
+            ),
         )
 
+    def get_fst_file_paths(
+        self, start_directory: FSTDirectory = None, parent_path: str = ""
+    ) -> "list[tuple[str, FSTFile]]":
+        """
+        Get the path of each file in the FST along with its entry, in FST order.
+        Paths are relative to the root of the disc and separated by '/'.
+        """
+        if start_directory is None:
+            start_directory = self.root_directory
+
+        file_paths = []
+        for child in start_directory.get_file_entries():
+            child_path = f"{parent_path}{child.filename}"
+            if isinstance(child, FSTDirectory):
+                file_paths.extend(self.get_fst_file_paths(child, child_path + "/"))
+            else:
+                file_paths.append((child_path, child))
+        return file_paths
+
     def get_fst_directory_list(self, start_directory: FSTDirectory = None):
         return filter(
             lambda fst: isinstance(fst, FSTDirectory),
-            self.get_fst_list(start_directory),
+            self.iter_fst_entries(start_directory),
         )
 
     def to_json_obj(self) -> dict:
@@ -268,20 +433,170 @@ class TableOfContents(AbstractFile):
     def to_bytes(self) -> bytearray:
         fst_list = self.get_fst_list()
 
-        # current name offset is now the total size of the string table
+        # the entry table is packed in one write, followed by the names in entry order
+        table = array.array("I")
+        names = []
+        for entry in fst_list:
+            if isinstance(entry, FSTDirectory):
+                table.extend((1 << 24 | entry.name_offset, entry.parent_entry, entry.next_offset))
+            else:
+                table.extend((entry.name_offset, entry.data_offset, entry.data_size))
+            if not isinstance(entry, FSTRootDirectory):
+                names.append(entry.filename.to_bytes())
+
         fst_bin = MemoryStream()
+        fst_bin.write_array(0, table)
+        fst_bin.write_bytes_at_offset(fst_bin.stream_size, b"".join(names))
+        return fst_bin.stream
 
-        fst_list = self.get_fst_list()
-        current_offset = 0
-        for entry in fst_list:
-            entry_bytes = entry.to_bytes()
-            fst_bin.insert_into_stream(current_offset, entry_bytes)
-            current_offset += self.TOC_ENTRY_SIZE
 
-        for entry in fst_list:
-            if isinstance(entry, FSTRootDirectory):
-                continue
-            fst_bin.insert_into_stream(current_offset, entry.filename.to_bytes())
-            current_offset += len(entry.filename.to_bytes())
+class FSTBatch:
+    """
+    A batch of changes to a TableOfContents that renumbers and lays out the entries once when it is
+    committed, instead of once per change. The result is the same as making the changes one at a time.
+
+    New files are added at the end of their directory and placed after the last file on the disc.
+    Files that grow push the files after them forward, files that shrink or move stay where they are.
+
+    Changes are made to the tree as they're queued, along with a step that undoes each of them.
+    If the block the batch is used in raises, the changes are rolled back instead of committed.
+    """
+
+    def __init__(self, table_of_contents: TableOfContents) -> None:
+        self.table_of_contents = table_of_contents
+        self._parents: "dict[FSTEntry, FSTDirectory]" = None
+        self._undo_steps = []
+        self.committed = False
+
+    def _get_parent(self, fst_entry: FSTEntry) -> FSTDirectory:
+        if self._parents is None:
+            # map every entry to its directory once, so each remove or move doesn't walk the tree
+            self._parents = {}
+            directories = [self.table_of_contents.root_directory]
+            while len(directories) > 0:
+                directory = directories.pop()
+                for child in directory.get_file_entries():
+                    self._parents[child] = directory
+                    if isinstance(child, FSTDirectory):
+                        directories.append(child)
+        return self._parents[fst_entry]
+
+    def _set_parent(self, fst_entry: FSTEntry, directory: FSTDirectory):
+        directory.add_child(fst_entry)
+        self.table_of_contents.invalidate()
+        if self._parents is not None:
+            self._parents[fst_entry] = directory
 
-        return fst_bin.stream
+    def add_file(
+        self,
+        file_name: "UnicodeString | str",
+        file_size: int,
+        parent_directory: FSTDirectory = None,
+    ) -> FSTFile:
+        if parent_directory is None:
+            parent_directory = self.table_of_contents.root_directory
+
+        fst_entry = FSTFile(0, 0, 0, file_size)
+        fst_entry.set_name(UnicodeString(file_name))
+        self._set_parent(fst_entry, parent_directory)
+        self.table_of_contents.added_files.append(fst_entry)
+        self._undo_steps.append(lambda: self._undo_add(fst_entry, parent_directory))
+        return fst_entry
+
+    def _undo_add(self, fst_entry: FSTFile, parent_directory: FSTDirectory):
+        parent_directory._children.remove(fst_entry)
+        self.table_of_contents.added_files.remove(fst_entry)
+        if self._parents is not None:
+            self._parents.pop(fst_entry, None)
+
+    def _detach(self, fst_entry: FSTEntry) -> "tuple[FSTDirectory, int]":
+        # take an entry out of its directory, returning where it was so it can be put back
+        parent = self._get_parent(fst_entry)
+        index = parent._children.index(fst_entry)
+        del parent._children[index]
+        self.table_of_contents.invalidate()
+        return parent, index
+
+    def _reattach(self, fst_entry: FSTEntry, parent: FSTDirectory, index: int):
+        parent._children.insert(index, fst_entry)
+        if self._parents is not None:
+            self._parents[fst_entry] = parent
+
+    def remove_file(self, fst_entry: FSTEntry):
+        parent, index = self._detach(fst_entry)
+        added_files = self.table_of_contents.added_files
+        added_index = added_files.index(fst_entry) if fst_entry in added_files else None
+        if added_index is not None:
+            del added_files[added_index]
+        planned_offset = self.table_of_contents.planned_offsets.pop(fst_entry, None)
+
+        def undo():
+            self._reattach(fst_entry, parent, index)
+            if added_index is not None:
+                added_files.insert(added_index, fst_entry)
+            if planned_offset is not None:
+                self.table_of_contents.planned_offsets[fst_entry] = planned_offset
+
+        self._undo_steps.append(undo)
+
+    def resize_file(self, fst_entry: FSTFile, file_size: int):
+        old_size = fst_entry.data_size
+        fst_entry.data_size = file_size
+        self.table_of_contents.invalidate()
+
+        def undo():
+            fst_entry.data_size = old_size
+
+        self._undo_steps.append(undo)
+
+    def move_file(
+        self,
+        fst_entry: FSTEntry,
+        parent_directory: FSTDirectory,
+        file_name: "UnicodeString | str" = None,
+    ):
+        """
+        Move an entry to the end of another directory, renaming it if a name is given.
+        """
+        old_parent, old_index = self._detach(fst_entry)
+        old_name = fst_entry.filename
+        if file_name is not None:
+            fst_entry.set_name(UnicodeString(file_name))
+        self._set_parent(fst_entry, parent_directory)
+
+        def undo():
+            parent_directory._children.remove(fst_entry)
+            fst_entry.set_name(old_name)
+            self._reattach(fst_entry, old_parent, old_index)
+
+        self._undo_steps.append(undo)
+
+    def commit(self, fst_offset: int = None):
+        """
+        Renumber the entries and lay out the files once for every change in the batch.
+        If the offset of the FST on the disc is given, no file is placed over the resized FST.
+        """
+        if self.committed:
+            return
+        self.table_of_contents.renumber()
+        self.table_of_contents.layout_files(fst_offset)
+        self.table_of_contents.invalidate()
+        self._undo_steps = []
+        self.committed = True
+
+    def rollback(self):
+        """
+        Undo every change queued since the batch started, leaving the tree as it was.
+        """
+        while len(self._undo_steps) > 0:
+            self._undo_steps.pop()()
+        self.table_of_contents.invalidate()
+
+    def __enter__(self) -> "FSTBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
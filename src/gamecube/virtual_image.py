@@ -0,0 +1,166 @@
+import bisect
+import io
+
+from . import GamecubeISO
+from .. import AbstractFileArchive, MemoryStream, Stream
+
+
+class ImageExtent:
+    """
+    A range of the output image and where its bytes come from.
+    Extents either hold their bytes in memory or point at a range of the source image.
+    """
+
+    def __init__(self, offset: int, size: int, data: bytes = None, source_offset: int = -1) -> None:
+        self.offset = offset
+        self.size = size
+        self.data = data
+        self.source_offset = source_offset
+
+    def slice(self, offset: int, size: int) -> "ImageExtent":
+        """
+        Get the part of this extent that starts at offset and is size bytes long.
+        """
+        skip = offset - self.offset
+        if self.data is not None:
+            return ImageExtent(offset, size, self.data[skip : skip + size])
+        return ImageExtent(offset, size, source_offset=self.source_offset + skip)
+
+
+class VirtualImageView(io.RawIOBase):
+    """
+    A read only view of the image a GamecubeISO would build, including any pending changes,
+    without building it. Reads are answered from the system files and FST serialized in memory,
+    changed files held in memory, unchanged files in the source image, and zeros for everything else.
+    An image with no changes is viewed as the source image itself, the same as saving it copies it.
+
+    This can be hashed, streamed or served in place of a built image. read_at is positional
+    and can be called from several threads, the file-like read and seek share a position.
+    """
+
+    def __init__(self, iso: GamecubeISO) -> None:
+        super().__init__()
+        self.iso = iso
+        self.source: Stream = iso.file_contents
+        self._position = 0
+
+        # these are added in the order build_archive writes them, later extents win
+        self._extents: "list[ImageExtent]" = []
+        self._extent_offsets: "list[int]" = []
+
+        if not iso.is_dirty():
+            # saving an unchanged image copies the source, so the view is the source
+            self.size = self.source.stream_size
+            self._add_extent(ImageExtent(0, self.size, source_offset=0))
+            return
+
+        iso.update_file_layout()
+        self.size = iso.get_archive_size()
+
+        system_files = MemoryStream()
+        iso.write_system_files(system_files)
+        self._add_extent(ImageExtent(0, system_files.stream_size, bytes(system_files.stream)))
+
+        fst_bytes = iso.table_of_contents.to_bytes()
+        fst_bytes = bytes(fst_bytes) + bytes(Stream.align_bytes(len(fst_bytes)))
+        self._add_extent(ImageExtent(iso.disc_header.fst_offset, len(fst_bytes), fst_bytes))
+
+        for entry in iso.table_of_contents.get_fst_file_list():
+            file_name = str(entry.filename)
+            if file_name not in iso.dirty_files or file_name not in iso.extracted_archive_files:
+                extent = ImageExtent(
+                    entry.data_offset, entry.old_size, source_offset=entry.old_offset
+                )
+            else:
+                file = iso.extracted_archive_files[file_name]
+                if isinstance(file, AbstractFileArchive):
+                    file_stream = MemoryStream()
+                    file.build_archive(file_stream)
+                    file_bytes = bytes(file_stream.stream)
+                else:
+                    file_bytes = bytes(file.to_bytes())
+                extent = ImageExtent(entry.data_offset, len(file_bytes), file_bytes)
+            self._add_extent(extent)
+
+    def _add_extent(self, extent: ImageExtent):
+        """
+        Insert an extent into the sorted extent list, trimming or splitting any extents it overlaps.
+        """
+        if extent.size <= 0:
+            return
+
+        end_offset = extent.offset + extent.size
+        index = bisect.bisect_right(self._extent_offsets, extent.offset)
+        if index > 0:
+            index -= 1
+
+        replaced_extents = []
+        last_index = index
+        while last_index < len(self._extents) and self._extents[last_index].offset < end_offset:
+            existing = self._extents[last_index]
+            existing_end = existing.offset + existing.size
+            if existing_end <= extent.offset:
+                replaced_extents.append(existing)
+            else:
+                if existing.offset < extent.offset:
+                    head_size = extent.offset - existing.offset
+                    replaced_extents.append(existing.slice(existing.offset, head_size))
+                if existing_end > end_offset:
+                    replaced_extents.append(existing.slice(end_offset, existing_end - end_offset))
+            last_index += 1
+
+        replaced_extents.append(extent)
+        replaced_extents.sort(key=lambda e: e.offset)
+        self._extents[index:last_index] = replaced_extents
+        self._extent_offsets[index:last_index] = [e.offset for e in replaced_extents]
+
+    def read_at(self, offset: int, count: int) -> bytes:
+        """
+        Read count bytes of the image starting at offset, without moving the file position.
+        """
+        end_offset = min(offset + count, self.size)
+        if offset >= end_offset:
+            return bytes()
+
+        data = bytearray(end_offset - offset)
+        index = max(bisect.bisect_right(self._extent_offsets, offset) - 1, 0)
+        while index < len(self._extents) and self._extents[index].offset < end_offset:
+            extent = self._extents[index]
+            start = max(extent.offset, offset)
+            end = min(extent.offset + extent.size, end_offset)
+            if start < end:
+                skip = start - extent.offset
+                if extent.data is not None:
+                    data[start - offset : end - offset] = extent.data[skip : skip + end - start]
+                else:
+                    data[start - offset : end - offset] = self.source.get_bytes_at_offset(
+                        extent.source_offset + skip, end - start
+                    )
+            index += 1
+        return bytes(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.read_at(self._position, len(buffer))
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
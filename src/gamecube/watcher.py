@@ -0,0 +1,202 @@
+import os
+import select
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from . import GamecubeISO, DirectoryImageBuilder, FSTFile
+from .. import FileStream, Stream
+
+
+class ImageWatcher:
+    """
+    Keeps an image built from a directory tree up to date while the tree is edited.
+
+    The output image stays open as a GamecubeISO backed by a writable FileStream. Changed files
+    are found by comparing the mtime and size of every file in the tree. A file that still fits in
+    its space on the disc is written over its old contents, a file that grew is moved to the end of
+    the image, and the FST is rewritten in place either way. Adding, removing or renaming files and
+    changing the system files changes the layout of the FST, so those trigger a full rebuild.
+
+    Changes are waited for with inotify when the inotify_simple package is installed,
+    otherwise the tree is polled.
+    """
+
+    def __init__(
+        self,
+        directory: "Path | str",
+        image_path: "Path | str",
+        system_image: GamecubeISO = None,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self.directory = Path(directory)
+        self.image_path = Path(image_path)
+        self.system_image = system_image
+        self.poll_interval = poll_interval
+        self.iso: GamecubeISO = None
+        self._inotify = None
+        self._watched_directories: "set[Path]" = set()
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Build the whole image again and reopen it.
+        """
+        self.close_image()
+        builder = DirectoryImageBuilder(self.directory, self.system_image)
+        builder.build(self.image_path)
+
+        self.files_directory = builder.files_directory
+        self.iso = GamecubeISO(self.image_path.name, FileStream.from_file(self.image_path, True))
+        self._entries: "dict[str, FSTFile]" = dict(self.iso.table_of_contents.get_fst_file_paths())
+        self._file_states = self.scan()
+
+    def scan(self) -> "dict[str, tuple[int, int]]":
+        """
+        Get the (mtime, size) of every file in the tree, keyed by its path relative to the tree.
+        """
+        file_states = {}
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = Path(root, file_name)
+                if path == self.image_path:
+                    continue
+                stat = path.stat()
+                file_states[path.relative_to(self.directory).as_posix()] = (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                )
+        return file_states
+
+    def _get_fst_path(self, relative_path: str) -> "str | None":
+        """
+        Get the path of a file on the disc from its path in the tree, or None if it's not a game file.
+        """
+        path = self.directory.joinpath(relative_path)
+        if self.files_directory not in path.parents:
+            return None
+        return path.relative_to(self.files_directory).as_posix()
+
+    def update(self) -> "list[str]":
+        """
+        Apply any changes made to the tree since the last update and return the changed paths.
+        """
+        file_states = self.scan()
+        changed_paths = [
+            path for path, state in file_states.items() if self._file_states.get(path) != state
+        ]
+        if file_states.keys() != self._file_states.keys():
+            changed_paths.extend(path for path in self._file_states if path not in file_states)
+            self.rebuild()
+            return changed_paths
+
+        fst_paths = [self._get_fst_path(path) for path in changed_paths]
+        if any(fst_path not in self._entries for fst_path in fst_paths):
+            self.rebuild()
+            return changed_paths
+
+        for fst_path in fst_paths:
+            self.patch_file(fst_path)
+        if len(changed_paths) > 0:
+            self.write_fst()
+        self._file_states = file_states
+        return changed_paths
+
+    def _get_file_space(self, entry: FSTFile) -> int:
+        """
+        Get the number of bytes from the start of a file to the next file or the end of the image.
+        """
+        end_offset = self.iso.file_contents.stream_size
+        for other in self._entries.values():
+            if entry.data_offset < other.data_offset < end_offset:
+                end_offset = other.data_offset
+        return end_offset - entry.data_offset
+
+    def patch_file(self, fst_path: str):
+        """
+        Write the current contents of a file from the tree into the image and update its FST entry.
+        """
+        entry = self._entries[fst_path]
+        file_bytes = self.files_directory.joinpath(fst_path).read_bytes()
+        file_size = len(file_bytes)
+        image_stream = self.iso.file_contents
+
+        if file_size <= self._get_file_space(entry):
+            # clear what's left of the old contents so no stale bytes are left behind
+            image_stream.write_bytes_at_offset(
+                entry.data_offset, file_bytes + bytes(max(0, entry.data_size - file_size))
+            )
+        else:
+            image_stream.write_bytes_at_offset(entry.data_offset, bytes(entry.data_size))
+            entry.data_offset = image_stream.stream_size
+            padding = bytes(Stream.align_bytes(entry.data_offset + file_size))
+            image_stream.write_bytes_at_offset(entry.data_offset, file_bytes + padding)
+        entry.data_size = file_size
+        self.iso.table_of_contents.invalidate()
+
+    def write_fst(self):
+        """
+        Write the FST back over itself and flush the image.
+        The names don't change so neither does its size.
+        """
+        fst_bytes = self.iso.table_of_contents.to_bytes()
+        self.iso.file_contents.write_bytes_at_offset(self.iso.disc_header.fst_offset, fst_bytes)
+        self.iso.file_contents.flush()
+
+    def _watch_directories(self):
+        import inotify_simple
+
+        for root, _, _ in os.walk(self.directory):
+            path = Path(root)
+            if path not in self._watched_directories:
+                flags = inotify_simple.flags
+                watch_flags = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM
+                watch_flags |= flags.CREATE | flags.DELETE | flags.ATTRIB
+                self._inotify.add_watch(path, watch_flags)
+                self._watched_directories.add(path)
+
+    def wait_for_changes(self, timeout: float = None):
+        """
+        Block until something in the tree may have changed, or the timeout passes.
+        """
+        if timeout is None:
+            timeout = self.poll_interval
+
+        if self._inotify is None:
+            try:
+                import inotify_simple
+            except ImportError:
+                time.sleep(timeout)
+                return
+            self._inotify = inotify_simple.INotify()
+        self._watch_directories()
+        ready, _, _ = select.select([self._inotify.fileno()], [], [], timeout)
+        if len(ready) > 0:
+            self._inotify.read(timeout=0)
+
+    def watch(
+        self,
+        on_update: "Callable[[list[str]], None]" = None,
+        stop_event: threading.Event = None,
+    ):
+        """
+        Keep the image up to date until the stop event is set, calling on_update with the
+        changed paths after each update.
+        """
+        while stop_event is None or not stop_event.is_set():
+            self.wait_for_changes()
+            changed_paths = self.update()
+            if len(changed_paths) > 0 and on_update is not None:
+                on_update(changed_paths)
+
+    def close_image(self):
+        if self.iso is not None:
+            self.iso.file_contents.close()
+            self.iso = None
+
+    def close(self):
+        self.close_image()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
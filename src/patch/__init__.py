@@ -1,28 +1,45 @@
-
-import bsdiff4
 from pathlib import Path
-from zipfile import ZipFile
 from ..gamecube import GamecubeFileFactory
-from .. import GamecubeISO, AbstractFileArchive, MMapStream, SystemCodes
+from .. import GamecubeISO, AbstractFileArchive, Instrumentation, MemoryStream, SystemCodes
+
+def apply_patch(game_archive: AbstractFileArchive, patch_file_path: Path) -> "list[str]":
+    """
+    Apply each file patch in a patch archive to the opened files of a game archive and return
+    the names of the patched files. Nothing is written, the patched files are pending changes
+    until the archive is saved.
+    """
+    import bsdiff4
+    from zipfile import ZipFile
+
+    patched_file_names = []
+    phase = game_archive.instrumentation.phase("apply_patch")
+    with phase, ZipFile(patch_file_path) as patch_archive:
+        for file_name in patch_archive.namelist():
+            if file_name.endswith("patch"):
+                original_file_name = file_name.rsplit(".", 1)[0]
+                file_patch = patch_archive.read(file_name)
+                file = game_archive.open_file(original_file_name)
+                patched_file = bsdiff4.patch(bytes(file.to_bytes()), file_patch)
+                # todo: another layer of factories
+                new_file = GamecubeFileFactory.read_file(original_file_name, MemoryStream(patched_file))
+                game_archive.replace_file(new_file)
+                patched_file_names.append(original_file_name)
+                phase.update(files=1, bytes_read=len(file_patch), bytes_written=len(patched_file))
+    return patched_file_names
 
-def patch(patch_file_path: Path, rom_file_path: Path, patched_rom_file_path: Path):
-    with patch_file_path.open('r') as patch_file:
-        with ZipFile(patch_file) as patch_archive:
-            game_archive: AbstractFileArchive = None
-            syscode = patch_archive.read("SYSCODE")[0]
-            if syscode == SystemCodes.Gamecube:
-                game_archive = GamecubeISO.open_image_file(rom_file_path)
-            
-            for file_name in patch_archive.namelist():
-                if file_name.endswith("patch"):
-                    original_file_name = file_name.rsplit(".", 1)[0]
-                    file_patch = patch_archive.read(file_name)
-                    file = game_archive.open_file(original_file_name)
-                    patched_file = bsdiff4.patch(file, file_patch)
-                    # todo: another layer of factories
-                    new_file = GamecubeFileFactory.read_file(original_file_name, patched_file)
-                    game_archive.replace_file(new_file)
+def patch(
+    patch_file_path: Path,
+    rom_file_path: Path,
+    patched_rom_file_path: Path,
+    instrumentation: Instrumentation = None,
+):
+    from zipfile import ZipFile
 
-    with MMapStream.from_file(patched_rom_file_path) as patched_rom:
-        game_archive.build_archive(patched_rom)
+    with ZipFile(patch_file_path) as patch_archive:
+        game_archive: AbstractFileArchive = None
+        syscode = patch_archive.read("SYSCODE")[0]
+        if syscode == SystemCodes.Gamecube.value:
+            game_archive = GamecubeISO.open_image_file(rom_file_path, instrumentation=instrumentation)
 
+    apply_patch(game_archive, patch_file_path)
+    game_archive.save_to_disk(patched_rom_file_path)
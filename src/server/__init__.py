@@ -0,0 +1,2 @@
+from .server import ImageServer, RPCError
+from .client import ImageClient
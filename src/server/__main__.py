@@ -0,0 +1,76 @@
+import argparse
+import sys
+from pathlib import Path
+
+from . import ImageClient, ImageServer, RPCError
+
+def cmdline_args():
+    p = argparse.ArgumentParser(description="Serve image operations over a Unix socket, or send requests to a running server.")
+    p.add_argument("-s", "--socket", type=Path, default=Path("dolphin-disc-drive.sock"),
+                   help="Path of the server socket (default: %(default)s)")
+    actions = p.add_subparsers(dest="action", required=True)
+
+    serve = actions.add_parser("serve", help="Run the server until it is shut down.")
+    serve.add_argument("-b", "--backend", type=str, choices=['mmap', 'file'], default='mmap',
+                       help="How to read images (default: %(default)s)")
+
+    list_files = actions.add_parser("list", help="List the files in an image.")
+    list_files.add_argument("image", type=Path)
+
+    read = actions.add_parser("read", help="Write the contents of a file in an image to stdout or a file.")
+    read.add_argument("image", type=Path)
+    read.add_argument("file_name", type=str)
+    read.add_argument("-o", "--output", type=Path)
+
+    replace = actions.add_parser("replace", help="Replace a file in an image with the contents of a local file.")
+    replace.add_argument("image", type=Path)
+    replace.add_argument("file_name", type=str)
+    replace.add_argument("input", type=Path)
+
+    save = actions.add_parser("save", help="Save an image with its pending changes.")
+    save.add_argument("image", type=Path)
+    save.add_argument("output", type=Path)
+    save.add_argument("-f", "--format", type=str, choices=['iso', 'ciso', 'gcz'], default='iso')
+
+    patch = actions.add_parser("patch", help="Apply a patch file to an image, save it to write the changes.")
+    patch.add_argument("image", type=Path)
+    patch.add_argument("patch_file", type=Path)
+
+    close = actions.add_parser("close", help="Close an image, dropping its pending changes.")
+    close.add_argument("image", type=Path)
+
+    actions.add_parser("shutdown", help="Stop the server.")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = cmdline_args()
+    if args.action == "serve":
+        ImageServer(args.socket, args.backend).serve_forever()
+        sys.exit(0)
+
+    # paths are resolved here since the server may run from another directory
+    with ImageClient(args.socket) as client:
+        try:
+            if args.action == "list":
+                for file in client.list_files(args.image.resolve()):
+                    print(f"{file['offset']:#010x} {file['size']:>10} {file['path']}")
+            elif args.action == "read":
+                file_bytes = client.read_file(args.image.resolve(), args.file_name)
+                if args.output is not None:
+                    args.output.write_bytes(file_bytes)
+                else:
+                    sys.stdout.buffer.write(file_bytes)
+            elif args.action == "replace":
+                client.replace_file(args.image.resolve(), args.file_name, args.input.read_bytes())
+            elif args.action == "save":
+                client.save(args.image.resolve(), args.output.resolve(), args.format)
+            elif args.action == "patch":
+                for file_name in client.patch(args.image.resolve(), args.patch_file.resolve()):
+                    print(f"Patched {file_name}")
+            elif args.action == "close":
+                client.close_image(args.image.resolve())
+            elif args.action == "shutdown":
+                client.shutdown()
+        except RPCError as e:
+            print(f"Error: {e.message}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,68 @@
+import base64
+import itertools
+import json
+import socket
+from pathlib import Path
+
+from .server import RPCError
+
+
+class ImageClient:
+    """
+    A client for ImageServer. The connection is kept open so each call is a single round trip.
+    """
+
+    def __init__(self, socket_path: "Path | str", timeout: float = None) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(str(socket_path))
+        self._reader = self._socket.makefile("rb")
+        self._request_ids = itertools.count(1)
+
+    def call(self, method: str, **params):
+        """
+        Send a request and wait for its result, errors are raised as RPCError.
+        """
+        request = {"jsonrpc": "2.0", "id": next(self._request_ids), "method": method, "params": params}
+        self._socket.sendall(json.dumps(request).encode() + b"\n")
+        line = self._reader.readline()
+        if len(line) == 0:
+            raise ConnectionError("The server closed the connection.")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RPCError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def list_files(self, image: "Path | str") -> "list[dict]":
+        return self.call("list", image=str(image))
+
+    def read_file(self, image: "Path | str", file_name: str, offset: int = 0, size: int = -1) -> bytes:
+        data = self.call("read", image=str(image), file_name=file_name, offset=offset, size=size)
+        return base64.b64decode(data)
+
+    def replace_file(self, image: "Path | str", file_name: str, data: bytes) -> int:
+        encoded_data = base64.b64encode(data).decode()
+        return self.call("replace", image=str(image), file_name=file_name, data=encoded_data)
+
+    def save(self, image: "Path | str", output: "Path | str", image_format: str = "iso") -> int:
+        return self.call("save", image=str(image), output=str(output), image_format=image_format)
+
+    def patch(self, image: "Path | str", patch_file: "Path | str") -> "list[str]":
+        return self.call("patch", image=str(image), patch_file=str(patch_file))
+
+    def close_image(self, image: "Path | str") -> bool:
+        return self.call("close", image=str(image))
+
+    def shutdown(self) -> bool:
+        return self.call("shutdown")
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self) -> "ImageClient":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
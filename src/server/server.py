@@ -0,0 +1,205 @@
+import base64
+import inspect
+import json
+import os
+import socketserver
+import threading
+from pathlib import Path
+from typing import Callable
+
+from ..gamecube import GamecubeFileFactory
+from ..patch import apply_patch
+from .. import GamecubeISO, MemoryStream
+
+
+class RPCError(Exception):
+    """
+    An error returned by a JSON-RPC request.
+    """
+
+    PARSE_ERROR = -32700
+    INVALID_REQUEST = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS = -32602
+    SERVER_ERROR = -32000
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class ResidentImage:
+    """
+    An image kept open by the server, along with a lock so requests on it run one at a time.
+    """
+
+    def __init__(self, path: Path, backend: str) -> None:
+        self.path = path
+        self.iso = GamecubeISO.open_image_file(path, backend)
+        self.lock = threading.Lock()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            response = self.server.image_server.handle_request(line)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ImageServer:
+    """
+    Keeps parsed images open and serves operations on them as JSON-RPC 2.0 over a Unix socket.
+    Each request and response is one line of JSON. Images are opened the first time a request
+    names them and stay resident until they are closed, so the disc header, apploader, FST and DOL
+    are only parsed once.
+
+    Methods take the image path as their first parameter: list, read, replace, save, patch and
+    close. File contents are sent as base64. shutdown stops the server.
+    """
+
+    def __init__(self, socket_path: "Path | str", backend: str = "mmap") -> None:
+        self.socket_path = Path(socket_path)
+        self.backend = backend
+        self.images: "dict[str, ResidentImage]" = {}
+        self._images_lock = threading.Lock()
+        self._server: _UnixServer = None
+        self.ready = threading.Event()
+        self.methods: "dict[str, Callable[..., object]]" = {
+            "list": self.list_files,
+            "read": self.read_file,
+            "replace": self.replace_file,
+            "save": self.save,
+            "patch": self.patch,
+            "close": self.close_image,
+            "shutdown": self.shutdown,
+        }
+
+    def get_image(self, image_path: str) -> ResidentImage:
+        """
+        Get a resident image, opening it if this is the first request for it.
+        """
+        path = Path(image_path).resolve()
+        with self._images_lock:
+            if str(path) not in self.images:
+                self.images[str(path)] = ResidentImage(path, self.backend)
+            return self.images[str(path)]
+
+    def _get_file_name(self, resident_image: ResidentImage, file_path: str) -> str:
+        """
+        Files are looked up by name, so take the last part of a path from list.
+        """
+        file_name = file_path.rsplit("/", 1)[-1]
+        if file_name != "system.bin":
+            if resident_image.iso.table_of_contents.search_file_by_name(file_name) is None:
+                raise RPCError(RPCError.INVALID_PARAMS, f"No file named {file_path} in the image.")
+        return file_name
+
+    def list_files(self, image: str) -> "list[dict]":
+        resident_image = self.get_image(image)
+        with resident_image.lock:
+            return [
+                {"path": file_path, "offset": entry.data_offset, "size": entry.data_size}
+                for file_path, entry in resident_image.iso.table_of_contents.get_fst_file_paths()
+            ]
+
+    def read_file(self, image: str, file_name: str, offset: int = 0, size: int = -1) -> str:
+        resident_image = self.get_image(image)
+        with resident_image.lock:
+            file_name = self._get_file_name(resident_image, file_name)
+            file_bytes = resident_image.iso.open_file(file_name).to_bytes()
+        end_offset = len(file_bytes) if size < 0 else offset + size
+        return base64.b64encode(bytes(file_bytes[offset:end_offset])).decode()
+
+    def replace_file(self, image: str, file_name: str, data: str) -> int:
+        file_bytes = base64.b64decode(data)
+        resident_image = self.get_image(image)
+        with resident_image.lock:
+            file_name = self._get_file_name(resident_image, file_name)
+            new_file = GamecubeFileFactory.read_file(file_name, MemoryStream(file_bytes))
+            resident_image.iso.replace_file(new_file)
+        return len(file_bytes)
+
+    def save(self, image: str, output: str, image_format: str = "iso") -> int:
+        resident_image = self.get_image(image)
+        with resident_image.lock:
+            resident_image.iso.save_to_disk(output, image_format)
+        return Path(output).stat().st_size
+
+    def patch(self, image: str, patch_file: str) -> "list[str]":
+        resident_image = self.get_image(image)
+        with resident_image.lock:
+            return apply_patch(resident_image.iso, Path(patch_file))
+
+    def close_image(self, image: str) -> bool:
+        path = str(Path(image).resolve())
+        with self._images_lock:
+            resident_image = self.images.pop(path, None)
+        if resident_image is None:
+            return False
+        with resident_image.lock:
+            resident_image.iso.file_contents.close()
+        return True
+
+    def shutdown(self) -> bool:
+        # shutdown blocks until serve_forever returns, so it can't run on a request thread
+        threading.Thread(target=self._server.shutdown).start()
+        return True
+
+    def handle_request(self, line: bytes) -> dict:
+        """
+        Run one JSON-RPC request and build its response.
+        """
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RPCError(RPCError.PARSE_ERROR, str(e))
+            if not isinstance(request, dict) or "method" not in request:
+                raise RPCError(RPCError.INVALID_REQUEST, "Requests need a method.")
+
+            request_id = request.get("id")
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise RPCError(RPCError.METHOD_NOT_FOUND, f"Unknown method: {request['method']}")
+
+            params = request.get("params", {})
+            args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
+            try:
+                inspect.signature(method).bind(*args, **kwargs)
+            except TypeError as e:
+                raise RPCError(RPCError.INVALID_PARAMS, str(e))
+            result = method(*args, **kwargs)
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RPCError as e:
+            error = {"code": e.code, "message": e.message}
+        except Exception as e:
+            error = {"code": RPCError.SERVER_ERROR, "message": f"{type(e).__name__}: {e}"}
+        return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+    def serve_forever(self):
+        """
+        Listen on the socket until shutdown is requested, then close every image.
+        """
+        if self.socket_path.exists():
+            os.unlink(self.socket_path)
+
+        self._server = _UnixServer(str(self.socket_path), _RequestHandler)
+        self._server.image_server = self
+        self.ready.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.ready.clear()
+            self._server.server_close()
+            os.unlink(self.socket_path)
+            for image in list(self.images):
+                self.close_image(image)
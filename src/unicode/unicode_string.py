@@ -10,12 +10,17 @@ class UnicodeString:
             if isinstance(initial_string, UnicodeString):
                 self.chars = [c for c in initial_string.chars]
             else:
-                self.chars = [c.encode("unicode") for c in initial_string]
+                # names on the disc are shift_jis, which is a superset of ASCII
+                self.chars = [UnicodeCharacter(b) for b in initial_string.encode("shift_jis")]
 
     def add_character(self, char: UnicodeCharacter):
         self.chars.append(char)
 
     def __str__(self) -> str:
+        name_bytes = bytes(c.char_byte for c in self.chars)
+        if name_bytes.isascii():
+            return name_bytes.decode("ascii")
+
         chars = []
         for c in self.chars:
             byte = c.char_byte.to_bytes(1, "big")
@@ -1,2 +1,16 @@
-from .stream_test import MemoryStreamTest
+from .stream_test import MemoryStreamTest, FileStreamTest, SubStreamTest, OverlayStreamTest
 from .dol_test import DOLTest
+from .ciso_test import CISOStreamTest
+from .gcz_test import GCZStreamTest
+from .iso_test import GamecubeISOTest
+from .concurrency_test import ConcurrentReadTest
+from .async_iso_test import AsyncGamecubeISOTest
+from .image_builder_test import DirectoryImageBuilderTest
+from .watcher_test import ImageWatcherTest
+from .server_test import ImageServerTest
+from .catalog_test import ImageCatalogTest
+from .fst_cache_test import FSTCacheTest
+from .junk_test import JunkGeneratorTest
+from .memory_budget_test import MemoryBudgetTest
+from .instrumentation_test import InstrumentationTest
+from .diff_test import ImageDiffTest
@@ -1,6 +1,6 @@
 import unittest
 
-from . import MemoryStreamTest
+from . import MemoryStreamTest, FileStreamTest, SubStreamTest, OverlayStreamTest, DOLTest, CISOStreamTest, GCZStreamTest, GamecubeISOTest, ConcurrentReadTest, AsyncGamecubeISOTest, DirectoryImageBuilderTest, ImageWatcherTest, ImageServerTest, ImageCatalogTest, FSTCacheTest, JunkGeneratorTest, MemoryBudgetTest, InstrumentationTest, ImageDiffTest
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.definitions import OperationCancelled
+from src.gamecube import AsyncGamecubeISO, GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class AsyncGamecubeISOTest(unittest.IsolatedAsyncioTestCase):
+    """
+    This class contains tests for the asyncio wrapper around GamecubeISO.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._files = [(f"file{i}.bin", bytes([i + 1]) * (0x200 * (i + 1))) for i in range(6)]
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._temp_path = Path(cls._temp_dir.name)
+        cls._image_path = cls._temp_path.joinpath("image.iso")
+        cls._image_path.write_bytes(build_test_image(cls._files))
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._temp_dir.cleanup()
+
+    async def asyncSetUp(self) -> None:
+        self._iso = await AsyncGamecubeISO.open(self._image_path, max_concurrency=2)
+
+    async def asyncTearDown(self) -> None:
+        await self._iso.close()
+
+    async def test_iter_files(self):
+        """
+        Test that iterating yields every file in FST order.
+        """
+        files = [(file_path, file.to_bytes()) async for file_path, file in self._iso]
+        self.assertEqual(files, self._files)
+
+    async def test_extract_to(self):
+        out_path = self._temp_path.joinpath("extracted")
+        self.assertEqual(await self._iso.extract_to(out_path), len(self._files))
+        for file_name, contents in self._files:
+            self.assertEqual(out_path.joinpath(file_name).read_bytes(), contents)
+
+    async def test_save_to_disk(self):
+        out_path = self._temp_path.joinpath("saved.iso")
+        await self._iso.save_to_disk(out_path)
+        saved_iso = GamecubeISO.open_image_file(out_path)
+        for file_name, contents in self._files:
+            self.assertEqual(saved_iso.open_file(file_name).to_bytes(), contents)
+
+    def _gate_save(self) -> "tuple[threading.Event, threading.Event, list]":
+        """
+        Make saves block on a gate once they're running on the executor, and record what the
+        real save raised once the gate is opened.
+        """
+        started, gate, results = threading.Event(), threading.Event(), []
+        save_to_disk = self._iso.iso.save_to_disk
+
+        def gated_save(path, image_format, cancel_event):
+            started.set()
+            gate.wait()
+            try:
+                save_to_disk(path, image_format, cancel_event)
+            except BaseException as e:
+                results.append(e)
+                raise
+            results.append(None)
+
+        patcher = mock.patch.object(self._iso.iso, "save_to_disk", gated_save)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(gate.set)
+        return started, gate, results
+
+    async def test_cancel_save(self):
+        """
+        Test that cancelling a save stops it partway and removes the partial image.
+        """
+        started, gate, results = self._gate_save()
+        out_path = self._temp_path.joinpath("cancelled.iso")
+        save_task = asyncio.ensure_future(self._iso.save_to_disk(out_path))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        save_task.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        with self.assertRaises(asyncio.CancelledError):
+            await save_task
+        self.assertEqual([type(result) for result in results], [OperationCancelled])
+        self.assertFalse(out_path.exists())
+
+    async def test_close_waits_for_jobs(self):
+        """
+        Test that closing stops a running save and waits for it before closing the image.
+        """
+        started, gate, results = self._gate_save()
+        out_path = self._temp_path.joinpath("closed.iso")
+        save_task = asyncio.ensure_future(self._iso.save_to_disk(out_path))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+
+        close_task = asyncio.ensure_future(self._iso.close())
+        await asyncio.sleep(0.05)
+        self.assertFalse(close_task.done())
+        gate.set()
+        await close_task
+        self.assertEqual([type(result) for result in results], [OperationCancelled])
+        with self.assertRaises(OperationCancelled):
+            await save_task
+        self.assertFalse(out_path.exists())
@@ -0,0 +1,91 @@
+import gc
+import hashlib
+import os
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+
+from src.catalog import ImageCatalog
+from src.gamecube import GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class ImageCatalogTest(unittest.TestCase):
+    """
+    This class contains tests for indexing images into a SQLite catalog.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._library_path = self._temp_path.joinpath("library")
+        self._library_path.joinpath("nested").mkdir(parents=True)
+
+        self._first_path = self._library_path.joinpath("first.iso")
+        self._first_path.write_bytes(build_test_image([("a.bin", b"A" * 100), ("shared.arc", b"S")]))
+        self._second_path = self._library_path.joinpath("nested", "second.gcm")
+        self._second_path.write_bytes(build_test_image([("shared.arc", b"T" * 10)]))
+        self._library_path.joinpath("broken.iso").write_bytes(b"not an image")
+        self._library_path.joinpath("notes.txt").write_text("not scanned")
+
+        self._catalog = ImageCatalog(self._temp_path.joinpath("catalog.db"))
+
+    def tearDown(self) -> None:
+        self._catalog.close()
+        self._temp_dir.cleanup()
+
+    def test_scan_and_query(self):
+        result = self._catalog.scan([self._library_path], hash_files=True, processes=2)
+        self.assertEqual(result.indexed, 2)
+        self.assertEqual(list(result.errors), [str(self._library_path.joinpath("broken.iso").resolve())])
+
+        self.assertEqual(
+            self._catalog.find_images_with_file("files/shared.arc"),
+            [str(self._first_path.resolve()), str(self._second_path.resolve())],
+        )
+        self.assertEqual(self._catalog.find_images_with_file("a.bin"), [str(self._first_path.resolve())])
+        self.assertEqual(len(self._catalog.find_images_by_game_id("GTSE")), 2)
+        self.assertEqual(self._catalog.find_images_by_game_id("GT_E"), [])
+        self.assertEqual(self._catalog.find_images_by_game_id("%"), [])
+
+        iso = GamecubeISO.open_image_file(self._first_path)
+        dol_hash = hashlib.sha1(iso.dol.to_bytes()).hexdigest()
+        iso.file_contents.close()
+        self.assertEqual(len(self._catalog.find_images_by_dol_hash(dol_hash)), 2)
+
+        image = self._catalog.get_image(self._first_path)
+        self.assertEqual(image["title"], "Test Game")
+        self.assertEqual(image["game_id"], "GTSE01")
+        self.assertEqual([file["path"] for file in image["files"]], ["a.bin", "shared.arc"])
+        self.assertEqual(image["files"][0]["hash"], hashlib.sha1(b"A" * 100).hexdigest())
+
+    def test_broken_image_is_closed(self):
+        """
+        Test that an image that fails to open doesn't leave its file open.
+        """
+        for backend in ["mmap", "file"]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+                with self.assertRaises(Exception):
+                    GamecubeISO.open_image_file(self._library_path.joinpath("broken.iso"), backend)
+                gc.collect()
+            self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_incremental_scan(self):
+        self._catalog.scan([self._library_path], processes=1)
+
+        result = self._catalog.scan([self._library_path], processes=1)
+        self.assertEqual((result.indexed, result.unchanged, result.removed), (0, 2, 0))
+
+        self._second_path.write_bytes(build_test_image([("other.arc", b"O")]))
+        stat = self._second_path.stat()
+        os.utime(self._second_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self._first_path.unlink()
+
+        result = self._catalog.scan([self._library_path], processes=1)
+        self.assertEqual((result.indexed, result.unchanged, result.removed), (1, 0, 1))
+        self.assertEqual(self._catalog.find_images_with_file("shared.arc"), [])
+        self.assertEqual(
+            self._catalog.find_images_with_file("other.arc"), [str(self._second_path.resolve())]
+        )
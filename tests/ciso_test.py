@@ -0,0 +1,67 @@
+import tempfile
+import unittest
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+
+from src.definitions import MemoryStream, MMapStream
+from src.gamecube import CISOStream
+
+
+class CISOStreamTest(unittest.TestCase):
+    """
+    This class contains tests for the CISOStream class.
+    A CISO image only stores the blocks of the disc that aren't empty.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        block_size = CISOStream.MIN_BLOCK_SIZE
+        cls._block_size = block_size
+        cls._image_bytes = bytearray(block_size * 5)
+        cls._image_bytes[0:block_size] = bytes(range(256)) * (block_size // 256)
+        cls._image_bytes[block_size * 2 + 10 : block_size * 2 + 20] = [0xAB] * 10
+        cls._image_bytes[block_size * 4 - 1] = 0xCD
+
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._image_path = Path(cls._temp_dir.name).joinpath("image.ciso")
+        cls._image_size = CISOStream.write_image(MemoryStream(cls._image_bytes), cls._image_path)
+
+        with cls._image_path.open("rb") as image_file:
+            cls._ciso = CISOStream(MMapStream(mmap(image_file.fileno(), 0, access=ACCESS_READ)))
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._ciso.close()
+        cls._temp_dir.cleanup()
+
+    def test_write_image(self):
+        """
+        Test that empty blocks are left out of the written image.
+        """
+        self.assertEqual(self._image_size, CISOStream.HEADER_SIZE + 3 * self._block_size)
+        self.assertEqual(self._ciso.block_size, self._block_size)
+
+    def test_stream_size(self):
+        """
+        Test that the logical size ends with the last stored block.
+        """
+        self.assertEqual(self._ciso.stream_size, self._block_size * 4)
+
+    def test_get_bytes(self):
+        """
+        Test reading ranges that span stored and empty blocks.
+        """
+        block_size = self._block_size
+        ranges = [(0, 16), (block_size - 8, 32), (block_size * 2, 64), (100, block_size * 4)]
+        for offset, count in ranges:
+            self.assertEqual(
+                self._ciso.get_bytes_at_offset(offset, count),
+                self._image_bytes[offset : min(offset + count, self._block_size * 4)],
+            )
+
+    def test_write_to_empty_block(self):
+        """
+        Test that writing to a block that isn't stored is rejected.
+        """
+        with self.assertRaises(NotImplementedError):
+            self._ciso.write_bytes_at_offset(self._block_size, [1])
@@ -0,0 +1,105 @@
+import random
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+
+from src.definitions import FileStream, MemoryStream, MMapStream, Stream
+from src.gamecube import CISOStream, GamecubeISO, GCZStream
+from .synthetic_image import build_test_image
+
+
+class ConcurrentReadTest(unittest.TestCase):
+    """
+    This class hammers a single open stream or image from many threads at once
+    and checks that every read returns the bytes at the requested offset.
+    """
+
+    THREAD_COUNT = 16
+    READS_PER_THREAD = 500
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        generator = random.Random(0x30)
+        cls._image_bytes = bytearray(generator.getrandbits(8) for _ in range(0x40000))
+        cls._image_bytes[0x20000:0x30000] = bytes(0x10000)
+
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._temp_path = Path(cls._temp_dir.name)
+        cls._raw_path = cls._temp_path.joinpath("image.bin")
+        cls._raw_path.write_bytes(cls._image_bytes)
+
+        cls._gcz_path = cls._temp_path.joinpath("image.gcz")
+        GCZStream.write_image(MemoryStream(cls._image_bytes), cls._gcz_path, 0x1000)
+        cls._ciso_path = cls._temp_path.joinpath("image.ciso")
+        CISOStream.write_image(MemoryStream(cls._image_bytes), cls._ciso_path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._temp_dir.cleanup()
+
+    def setUp(self) -> None:
+        # switch threads as often as possible to give reads every chance to interleave
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self) -> None:
+        sys.setswitchinterval(self._switch_interval)
+
+    def _map_file(self, path: Path) -> MMapStream:
+        with path.open("rb") as image_file:
+            return MMapStream(mmap(image_file.fileno(), 0, access=ACCESS_READ))
+
+    def _hammer(self, stream: Stream):
+        def read_randomly(seed: int) -> int:
+            generator = random.Random(seed)
+            mismatches = 0
+            for _ in range(self.READS_PER_THREAD):
+                offset = generator.randrange(0, stream.stream_size)
+                count = generator.choice([1, 4, 0x20, 0x800, 0x3000])
+                expected = self._image_bytes[offset : offset + count]
+                if stream.get_bytes_at_offset(offset, count) != expected:
+                    mismatches += 1
+            return mismatches
+
+        with ThreadPoolExecutor(self.THREAD_COUNT) as executor:
+            mismatches = sum(executor.map(read_randomly, range(self.THREAD_COUNT)))
+        self.assertEqual(mismatches, 0)
+
+    def test_mmap_stream(self):
+        stream = self._map_file(self._raw_path)
+        self._hammer(stream)
+        stream.close()
+
+    def test_file_stream(self):
+        stream = FileStream.from_file(self._raw_path, block_size=0x400, cache_size=8)
+        self._hammer(stream)
+        stream.close()
+
+    def test_gcz_stream(self):
+        stream = GCZStream(self._map_file(self._gcz_path), cache_size=4)
+        self._hammer(stream)
+        stream.close()
+
+    def test_ciso_stream(self):
+        stream = CISOStream(FileStream.from_file(self._ciso_path, block_size=0x400, cache_size=8))
+        self._hammer(stream)
+        stream.close()
+
+    def test_image_extraction(self):
+        """
+        Extract the files of one open image from many threads at once.
+        """
+        files = [(f"file{i}.bin", bytes([i]) * (0x300 * (i + 1))) for i in range(8)]
+        image_path = self._temp_path.joinpath("files.iso")
+        image_path.write_bytes(build_test_image(files, junk_seed=2))
+        iso = GamecubeISO.open_image_file(image_path)
+
+        def extract(index: int) -> bool:
+            file_name, contents = files[index % len(files)]
+            return iso._extract_file(file_name).to_bytes() == contents
+
+        with ThreadPoolExecutor(self.THREAD_COUNT) as executor:
+            self.assertTrue(all(executor.map(extract, range(self.THREAD_COUNT * 20))))
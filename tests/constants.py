@@ -1,4 +0,0 @@
-from pathlib import Path
-
-
-PATH_TO_TEST_SYSTEM_FILES = Path("/home/mike/Downloads/ExtractedGames/Colosseum")
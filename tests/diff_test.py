@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.definitions import MemoryStream, NotImplementedFile
+from src.gamecube import AccessTrace, GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class ImageDiffTest(unittest.TestCase):
+    """
+    This class contains tests for comparing two images file by file.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._files = [
+            ("a.bin", bytes(range(256)) * 20),
+            ("b.rel", b"B" * 3000),
+            ("c.txt", b"hello"),
+            ("e.bin", b"E" * 4000),
+            ("f.bin", b"F" * 100),
+        ]
+        self._image_path = self._temp_path.joinpath("image.iso")
+        self._image_path.write_bytes(build_test_image(self._files))
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _open(self, path: Path) -> GamecubeISO:
+        iso = GamecubeISO.open_image_file(path)
+        self.addCleanup(iso.file_contents.close)
+        return iso
+
+    def test_compare_images(self):
+        """
+        Test that every kind of change between two image files is reported, at the file it happened to.
+        """
+        iso = self._open(self._image_path)
+        iso.open_file("a.bin").replace_bytes(1000, b"XY")
+        iso.replace_file(NotImplementedFile("c.txt", MemoryStream(b"hello world")))
+        iso.delete_file(NotImplementedFile("b.rel", MemoryStream()))
+        iso.add_new_file(NotImplementedFile("d.bin", MemoryStream(b"D" * 50)))
+        # e.bin goes last, which moves f.bin into the space left by b.rel
+        iso.optimize_layout(AccessTrace(["e.bin"]))
+        new_path = self._temp_path.joinpath("new.iso")
+        iso.save_to_disk(new_path)
+
+        diff = self._open(self._image_path).compare(self._open(new_path), threads=2)
+        kinds = {f.path: f.kind for f in diff.files}
+        self.assertEqual(
+            kinds,
+            {
+                "a.bin": "modified",
+                "b.rel": "removed",
+                "c.txt": "resized",
+                "f.bin": "moved",
+                "d.bin": "added",
+            },
+        )
+        (modified,) = diff.get_files("modified")
+        self.assertEqual(modified.first_difference, 1000)
+        (resized,) = diff.get_files("resized")
+        self.assertEqual((resized.old_size, resized.new_size), (5, 11))
+        (moved,) = diff.get_files("moved")
+        self.assertNotEqual(moved.old_offset, moved.new_offset)
+        self.assertIn("fst.bin", diff.system_files)
+        self.assertNotIn("main.dol", diff.system_files)
+        self.assertTrue(diff.complete)
+        self.assertFalse(diff.is_identical())
+        self.assertEqual(diff.to_json_obj()["added"][0]["new_size"], 50)
+
+        identical = self._open(new_path).compare(self._open(new_path))
+        self.assertTrue(identical.is_identical())
+
+    def test_compare_pending_changes(self):
+        """
+        Test that comparing an image with the changes made to it only reads the changed files.
+        """
+        iso = self._open(self._image_path)
+        iso.open_file("e.bin").replace_bytes(0, b"X")
+        diff = self._open(self._image_path).compare(iso)
+        self.assertEqual(
+            [(f.path, f.kind, f.first_difference) for f in diff.files], [("e.bin", "modified", 0)]
+        )
+        self.assertEqual(diff.system_files, [])
+        self.assertEqual((diff.compared_files, diff.skipped_files), (1, 4))
+        self.assertEqual(diff.bytes_read, 2 * 4000)
+
+    def test_stop_at_first_difference(self):
+        copy_path = self._temp_path.joinpath("copy.iso")
+        copy = bytearray(self._image_path.read_bytes())
+        copy_iso = self._open(self._image_path)
+        copy[copy_iso.table_of_contents.search_file_by_name("f.bin").data_offset] ^= 0xFF
+        copy_path.write_bytes(copy)
+
+        diff = self._open(self._image_path).compare(
+            self._open(copy_path), stop_at_first_difference=True
+        )
+        self.assertEqual([f.path for f in diff.files], ["f.bin"])
+        self.assertFalse(diff.complete)
+        self.assertFalse(diff.is_identical())
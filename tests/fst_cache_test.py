@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.gamecube import FSTCache, GamecubeISO, TableOfContents
+from .synthetic_image import build_test_image
+
+
+class FSTCacheTest(unittest.TestCase):
+    """
+    This class contains tests for the on-disk cache of parsed FSTs.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._files = [("a.bin", b"A" * 5000), ("b.rel", b"B" * 3000), ("c.txt", b"hello")]
+        self._image_path = self._temp_path.joinpath("image.iso")
+        self._image_path.write_bytes(build_test_image(self._files))
+        self._cache = FSTCache(self._temp_path.joinpath("cache"))
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _open(self) -> GamecubeISO:
+        iso = GamecubeISO.open_image_file(self._image_path, "file", fst_cache=self._cache)
+        self.addCleanup(iso.file_contents.close)
+        return iso
+
+    def test_reopen_skips_parsing(self):
+        first_iso = self._open()
+        first_entries = first_iso.table_of_contents.get_entries()
+        self.assertEqual(len(list(self._cache.directory.iterdir())), 1)
+
+        with mock.patch.object(
+            TableOfContents, "_read_entries"
+        ) as read_entries, mock.patch.object(TableOfContents, "_add_entries") as add_entries:
+            second_iso = self._open()
+            self.assertEqual(second_iso.table_of_contents.get_entries(), first_entries)
+            self.assertEqual(
+                second_iso.table_of_contents.get_game_file_size(),
+                first_iso.table_of_contents.get_game_file_size(),
+            )
+            read_entries.assert_not_called()
+            add_entries.assert_not_called()
+
+        self.assertEqual(
+            second_iso.table_of_contents.to_bytes(), first_iso.table_of_contents.to_bytes()
+        )
+        self.assertEqual(
+            [path for path, _ in second_iso.table_of_contents.get_fst_file_paths()],
+            [path for path, _ in first_iso.table_of_contents.get_fst_file_paths()],
+        )
+        for file_name, contents in self._files:
+            self.assertEqual(second_iso.open_file(file_name).to_bytes(), contents)
+
+    def test_changed_image_is_parsed_again(self):
+        self._open().table_of_contents
+        self._image_path.write_bytes(build_test_image([("d.bin", b"D" * 10)]))
+        stat = self._image_path.stat()
+        os.utime(self._image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        iso = self._open()
+        self.assertIsNone(iso._get_cached_layout())
+        self.assertEqual(iso.open_file("d.bin").to_bytes(), b"D" * 10)
+        self.assertIsNotNone(self._cache.load(self._image_path, iso.disc_header.to_bytes()))
@@ -0,0 +1,86 @@
+import random
+import tempfile
+import unittest
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+
+from src.definitions import MemoryStream, MMapStream
+from src.gamecube import GCZStream
+
+
+class GCZStreamTest(unittest.TestCase):
+    """
+    This class contains tests for the GCZStream class.
+    A GCZ image stores each block of the disc compressed with zlib.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._block_size = 0x1000
+        cls._image_bytes = bytearray(cls._block_size * 6 + 0x123)
+        cls._image_bytes[0:0x2000] = bytes(range(256)) * 0x20
+        # random looking data that zlib can't compress, so it gets stored as is
+        generator = random.Random(0x1000)
+        cls._image_bytes[0x3000:0x4000] = bytes(generator.getrandbits(8) for _ in range(0x1000))
+
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._image_path = Path(cls._temp_dir.name).joinpath("image.gcz")
+        GCZStream.write_image(
+            MemoryStream(cls._image_bytes), cls._image_path, cls._block_size, threads=2
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._temp_dir.cleanup()
+
+    def setUp(self) -> None:
+        with self._image_path.open("rb") as image_file:
+            mmap_stream = mmap(image_file.fileno(), 0, access=ACCESS_READ)
+        self._gcz = GCZStream(MMapStream(mmap_stream), cache_size=2)
+
+    def tearDown(self) -> None:
+        self._gcz.close()
+
+    def test_init(self):
+        """
+        Test that the header of the written image is read back.
+        """
+        self.assertEqual(self._gcz.stream_size, len(self._image_bytes))
+        self.assertEqual(self._gcz.block_size, self._block_size)
+        self.assertEqual(self._gcz.block_count, 7)
+        self.assertTrue(self._gcz.block_pointers[3] & GCZStream.UNCOMPRESSED_FLAG)
+        self.assertFalse(self._gcz.block_pointers[0] & GCZStream.UNCOMPRESSED_FLAG)
+
+    def test_get_bytes(self):
+        """
+        Test reading ranges that span several blocks, including the partial last block.
+        """
+        block_size = self._block_size
+        ranges = [(0, 16), (block_size - 8, 32), (0x2FF0, 0x1020), (100, len(self._image_bytes))]
+        for offset, count in ranges:
+            self.assertEqual(
+                self._gcz.get_bytes_at_offset(offset, count),
+                self._image_bytes[offset : offset + count],
+            )
+        self.assertLessEqual(len(self._gcz._block_cache), 2)
+
+    def test_write_bytes(self):
+        """
+        Test that writes are visible to reads and are kept when the image is written again.
+        """
+        self.assertEqual(self._gcz.write_bytes_at_offset(self._block_size - 2, [0xAA] * 4), 4)
+        self.assertEqual(
+            self._gcz.get_bytes_at_offset(self._block_size - 3, 6),
+            bytearray([0xFD, 0xAA, 0xAA, 0xAA, 0xAA, 0x02]),
+        )
+
+        expected_bytes = bytearray(self._image_bytes)
+        expected_bytes[self._block_size - 2 : self._block_size + 2] = [0xAA] * 4
+
+        copy_path = Path(self._temp_dir.name).joinpath("copy.gcz")
+        GCZStream.write_image(self._gcz, copy_path, self._block_size)
+        with copy_path.open("rb") as image_file:
+            mmap_stream = mmap(image_file.fileno(), 0, access=ACCESS_READ)
+        gcz_copy = GCZStream(MMapStream(mmap_stream))
+        self.assertEqual(gcz_copy.get_bytes_at_offset(0, gcz_copy.stream_size), expected_bytes)
+        gcz_copy.close()
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.gamecube import DirectoryImageBuilder, GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class DirectoryImageBuilderTest(unittest.TestCase):
+    """
+    This class contains tests for building images from extracted directory trees.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        image_path = self._temp_path.joinpath("image.iso")
+        image_path.write_bytes(build_test_image([("a.bin", b"A" * 5000)], junk_seed=1))
+        self._iso = GamecubeISO.open_image_file(image_path)
+
+        self._files = {
+            "Zebra.bin": b"Z" * 3000,
+            "audio/music.adp": bytes(range(256)) * 40,
+            "audio/empty.bin": b"",
+            "audio/voices/en/line.adp": b"hello",
+            "bin/main.rel": b"R" * 0x2345,
+        }
+        self._tree_path = self._temp_path.joinpath("tree")
+        for file_path, contents in self._files.items():
+            out_path = self._tree_path.joinpath(file_path)
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            out_path.write_bytes(contents)
+
+    def tearDown(self) -> None:
+        self._iso.file_contents.close()
+        self._temp_dir.cleanup()
+
+    def _check_image(self, image_path: Path, image_size: int):
+        self.assertEqual(image_path.stat().st_size, image_size)
+        built_iso = GamecubeISO.open_image_file(image_path)
+        file_paths = built_iso.table_of_contents.get_fst_file_paths()
+        self.assertEqual(
+            [file_path for file_path, _ in file_paths],
+            sorted(self._files, key=lambda p: [part.lower() for part in p.split("/")]),
+        )
+        for file_path, entry in file_paths:
+            extracted_file = built_iso._extract_file_by_entry(entry)
+            self.assertEqual(extracted_file.to_bytes(), self._files[file_path])
+            self.assertEqual(entry.data_offset % 2048, 0)
+
+        self.assertEqual(built_iso.dol.to_bytes(), self._iso.dol.to_bytes())
+        self.assertEqual(bytes(built_iso.disc_header.game_name.to_bytes()), b"Test Game\0")
+        built_iso.file_contents.close()
+
+    def test_build_with_system_image(self):
+        """
+        Test that a plain directory is packed with the system files of another image.
+        """
+        image_path = self._temp_path.joinpath("built.iso")
+        image_size = DirectoryImageBuilder(self._tree_path, self._iso).build(image_path, threads=2)
+        self._check_image(image_path, image_size)
+
+    def test_build_from_sys_and_files(self):
+        """
+        Test that the sys/ and files/ layout is packed without a system image.
+        """
+        system_path = self._tree_path.joinpath("sys")
+        system_path.mkdir()
+        system_path.joinpath("boot.bin").write_bytes(self._iso.disc_header.to_bytes())
+        system_path.joinpath("bi2.bin").write_bytes(self._iso.disc_header_information.to_bytes())
+        app_loader_size = self._iso.app_loader.get_app_loader_size()
+        system_path.joinpath("apploader.img").write_bytes(
+            self._iso.app_loader.to_bytes()[:app_loader_size]
+        )
+        system_path.joinpath("main.dol").write_bytes(self._iso.dol.to_bytes())
+
+        files_path = self._tree_path.joinpath("files")
+        files_path.mkdir()
+        for file_path in ("Zebra.bin", "audio", "bin"):
+            self._tree_path.joinpath(file_path).rename(files_path.joinpath(file_path))
+
+        image_path = self._temp_path.joinpath("built.iso")
+        image_size = DirectoryImageBuilder(self._tree_path).build(image_path)
+        self._check_image(image_path, image_size)
+
+    def test_missing_system_files(self):
+        with self.assertRaises(ValueError):
+            DirectoryImageBuilder(self._tree_path)
@@ -0,0 +1,114 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.definitions import (
+    Instrumentation,
+    InstrumentationEvent,
+    JSONLinesInstrumentation,
+    MemoryStream,
+    NotImplementedFile,
+    ProfilingInstrumentation,
+)
+from src.gamecube import GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class RecordingInstrumentation(Instrumentation):
+    """
+    Keeps every event it receives.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.events: "list[InstrumentationEvent]" = []
+
+    def on_event(self, event: InstrumentationEvent):
+        self.events.append(event)
+
+    def get_ends(self, phase: str) -> "list[InstrumentationEvent]":
+        return [e for e in self.events if e.kind == "end" and e.phase == phase]
+
+
+class InstrumentationTest(unittest.TestCase):
+    """
+    This class contains tests for the events reported while working on an image.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._files = [("a.bin", b"A" * 5000), ("b.rel", b"B" * 3000), ("c.txt", b"hello")]
+        self._image_path = self._temp_path.joinpath("image.iso")
+        self._image_path.write_bytes(build_test_image(self._files))
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _save_changed_image(self, instrumentation: Instrumentation = None) -> GamecubeISO:
+        iso = GamecubeISO.open_image_file(self._image_path, instrumentation=instrumentation)
+        self.addCleanup(iso.file_contents.close)
+        iso.open_file("c.txt").replace_bytes(0, b"J")
+        iso.replace_file(NotImplementedFile("b.rel", MemoryStream(b"R" * 100)))
+        iso.save_to_disk(self._temp_path.joinpath("saved.iso"))
+        return iso
+
+    def test_events(self):
+        """
+        Test that each phase reports its start, progress and totals, nested in the phase it runs in.
+        """
+        instrumentation = RecordingInstrumentation()
+        iso = self._save_changed_image(instrumentation)
+        iso.build_patch_file()
+
+        starts = [(e.phase, e.depth) for e in instrumentation.events if e.kind == "start"]
+        # the FST is loaded the first time a file is opened
+        self.assertEqual(starts[:3], [("load", 0), ("extract", 0), ("load_fst", 1)])
+        self.assertIn(("save", 0), starts)
+        self.assertIn(("build", 1), starts)
+        self.assertIn(("files", 2), starts)
+        self.assertIn(("patch", 0), starts)
+        self.assertIn(("system_files", 2), starts)
+
+        (files_end,) = instrumentation.get_ends("files")
+        self.assertEqual(files_end.fields["files"], 3)
+        self.assertEqual(files_end.fields["bytes_read"], 5000)
+        self.assertEqual(files_end.fields["bytes_written"], 5000 + 100 + 5)
+        self.assertGreater(files_end.fields["duration"], 0)
+        self.assertIsNone(files_end.fields["error"])
+        progress = [e for e in instrumentation.events if e.kind == "progress" and e.phase == "files"]
+        self.assertEqual([e.fields["files"] for e in progress], [1, 2, 3])
+        self.assertEqual(progress[0].fields["total"], 3)
+
+        (save_end,) = instrumentation.get_ends("save")
+        self.assertTrue(save_end.fields["rebuilt"])
+        self.assertEqual(save_end.fields["bytes_written"], self._temp_path.joinpath("saved.iso").stat().st_size)
+        (patch_end,) = instrumentation.get_ends("patch")
+        self.assertEqual(patch_end.fields["files"], 2)
+
+    def test_silent_by_default(self):
+        """
+        Test that nothing is printed without instrumentation.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            self._save_changed_image()
+        self.assertEqual(output.getvalue(), "")
+
+    def test_json_lines(self):
+        output = io.StringIO()
+        self._save_changed_image(JSONLinesInstrumentation(output))
+        events = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertTrue(all(e["event"] in ("start", "end") for e in events))
+        self.assertIn({"event": "end", "phase": "files"}, [{k: e[k] for k in ("event", "phase")} for e in events])
+
+    def test_profiling(self):
+        instrumentation = ProfilingInstrumentation()
+        self._save_changed_image(instrumentation)
+        self.assertIn("build", instrumentation.profiles)
+        self.assertIn("files", instrumentation.profiles)
+        self.assertGreater(instrumentation.peak_memory["build"], 0)
+        self.assertGreaterEqual(instrumentation.peak_memory["save"], instrumentation.peak_memory["build"])
@@ -0,0 +1,468 @@
+import hashlib
+import io
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from src.definitions import AbstractFileArchive, MemoryStream, NotImplementedFile, SubStream
+from src.gamecube import AccessTrace, GamecubeISO, VirtualImageView
+from src.patch import patch
+from .synthetic_image import SyntheticImage, build_test_image
+
+
+class NestedArchive(AbstractFileArchive):
+    """
+    An archive that writes a fixed payload, and records the streams it was built into.
+    """
+
+    def __init__(self, file_name: str, payload: bytes) -> None:
+        super().__init__(file_name, MemoryStream(payload))
+        self.payload = payload
+        self.build_streams = []
+
+    def get_file_list(self):
+        return []
+
+    def _extract_file(self, file_name: str):
+        return None
+
+    def get_archive_size(self):
+        return len(self.payload)
+
+    def build_archive(self, write_stream):
+        self.build_streams.append(write_stream)
+        write_stream.write_bytes_at_offset(0, self.payload)
+
+    def add_new_file(self, file, parent_directory=None):
+        pass
+
+    def replace_file(self, file):
+        pass
+
+    def delete_file(self, file):
+        pass
+
+
+class GamecubeISOTest(unittest.TestCase):
+    """
+    This class contains tests for the GamecubeISO class using a small synthetic image.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._files = [("a.bin", b"A" * 5000), ("b.rel", b"B" * 3000), ("c.txt", b"hello")]
+        cls._image_bytes = build_test_image(cls._files, junk_seed=1)
+
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._temp_path = Path(cls._temp_dir.name)
+        cls._image_path = cls._temp_path.joinpath("image.iso")
+        cls._image_path.write_bytes(cls._image_bytes)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._temp_dir.cleanup()
+
+    def setUp(self) -> None:
+        self._iso = GamecubeISO.open_image_file(self._image_path)
+
+    def test_open_file(self):
+        """
+        Test that files are read from the offsets in the FST.
+        """
+        for file_name, contents in self._files:
+            self.assertEqual(self._iso.open_file(file_name).to_bytes(), contents)
+
+    def test_file_changes(self):
+        """
+        Test that pending changes are applied when a file is serialized and saved.
+        """
+        file = self._iso.open_file("c.txt")
+        file.replace_bytes(0, b"J")
+        file.insert_bytes(5, b" world")
+        file.delete_bytes(1, 1)
+        self.assertEqual(file.to_bytes(), b"Jllo world")
+        self.assertEqual(file.get_file_size(), 10)
+        self.assertEqual(file.file_contents.stream, b"hello")
+
+        saved_path = self._temp_path.joinpath("changed.iso")
+        self._iso.save_to_disk(saved_path)
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        self.assertEqual(saved_iso.open_file("c.txt").to_bytes(), b"Jllo world")
+        saved_iso.file_contents.close()
+
+    def test_scrub(self):
+        """
+        Test that scrubbing zeros the junk between files and keeps everything else.
+        """
+        scrubbed_path = self._temp_path.joinpath("scrubbed.iso")
+        reclaimed_bytes = self._iso.scrub(scrubbed_path)
+
+        scrubbed_bytes = scrubbed_path.read_bytes()
+        self.assertEqual(len(scrubbed_bytes), len(self._image_bytes))
+
+        used_bytes = 0
+        current_offset = 0
+        for offset, size in self._iso.get_used_extents():
+            used_bytes += size
+            self.assertEqual(
+                scrubbed_bytes[offset : offset + size], self._image_bytes[offset : offset + size]
+            )
+            self.assertFalse(any(scrubbed_bytes[current_offset:offset]))
+            current_offset = offset + size
+        self.assertFalse(any(scrubbed_bytes[current_offset:]))
+        self.assertEqual(reclaimed_bytes, len(self._image_bytes) - used_bytes)
+
+        scrubbed_iso = GamecubeISO.open_image_file(scrubbed_path)
+        for file_name, contents in self._files:
+            self.assertEqual(scrubbed_iso.open_file(file_name).to_bytes(), contents)
+
+        sparse_path = self._temp_path.joinpath("sparse.iso")
+        self._iso.scrub(sparse_path, sparse=True)
+        self.assertEqual(sparse_path.read_bytes(), scrubbed_bytes)
+
+    def test_virtual_image(self):
+        """
+        Test that the virtual view matches the image that would be built, with and without changes.
+        """
+        saved_path = self._temp_path.joinpath("saved.iso")
+        self._iso.save_to_disk(saved_path)
+        view = VirtualImageView(self._iso)
+        self.assertEqual(view.read(), saved_path.read_bytes())
+
+        self._iso.replace_file(NotImplementedFile("b.rel", MemoryStream(b"R" * 0x1800)))
+        view = VirtualImageView(self._iso)
+        self._iso.save_to_disk(saved_path)
+        saved_bytes = saved_path.read_bytes()
+
+        self.assertEqual(view.size, len(saved_bytes))
+        for offset in range(0, view.size, 0x7FF):
+            self.assertEqual(view.read_at(offset, 0x1234), saved_bytes[offset : offset + 0x1234])
+
+        view.seek(0)
+        hashed_view = hashlib.sha1(io.BufferedReader(view).read()).hexdigest()
+        self.assertEqual(hashed_view, hashlib.sha1(saved_bytes).hexdigest())
+
+    def test_probe(self):
+        """
+        Test that probing reads the disc header without opening the image.
+        """
+        disc_header = GamecubeISO.probe_image_file(self._image_path)
+        self.assertEqual(bytes(disc_header.game_code), b"TS")
+        self.assertEqual(str(disc_header.game_name), "Test Game")
+        self.assertEqual(disc_header.fst_offset, self._iso.disc_header.fst_offset)
+
+    def test_lazy_system_files(self):
+        """
+        Test that the FST, apploader and DOL are only parsed when first used.
+        """
+        self.assertIsNone(self._iso._table_of_contents)
+        self.assertIsNone(self._iso._dol)
+        table_of_contents = self._iso.table_of_contents
+        self.assertIs(self._iso.table_of_contents, table_of_contents)
+        self.assertIsNone(self._iso._dol)
+
+        heavy_modules = "{'tqdm', 'bsdiff4', 'zipfile', 'asyncio'}"
+        result = subprocess.run(
+            [sys.executable, "-c", f"import sys, src; print(sorted({heavy_modules} & set(sys.modules)))"],
+            cwd=Path(__file__).parent.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_nested_archive(self):
+        """
+        Test that nested archives are built in place in the image instead of in a buffer.
+        """
+        archive = NestedArchive("b.rel", bytes(range(256)) * 20)
+        self._iso.replace_file(archive)
+        saved_path = self._temp_path.joinpath("nested.iso")
+        self._iso.save_to_disk(saved_path)
+
+        self.assertEqual(len(archive.build_streams), 1)
+        self.assertIsInstance(archive.build_streams[0], SubStream)
+
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        self.assertEqual(saved_iso.open_file("b.rel").to_bytes()[: len(archive.payload)], archive.payload)
+        self.assertEqual(saved_iso.open_file("c.txt").to_bytes(), b"hello")
+        saved_iso.file_contents.close()
+
+    def test_dirty_tracking(self):
+        """
+        Test that only changed files are dirty and that saving an unchanged image copies it.
+        """
+        self.assertFalse(self._iso.is_dirty())
+        saved_path = self._temp_path.joinpath("unchanged.iso")
+        self._iso.save_to_disk(saved_path)
+        self.assertEqual(saved_path.read_bytes(), self._image_bytes)
+        self.assertIsNone(self._iso._table_of_contents)
+
+        file = self._iso.open_file("a.bin")
+        self.assertFalse(self._iso.is_dirty())
+        file.replace_bytes(0, b"Z")
+        self.assertEqual(self._iso.dirty_files, {"a.bin"})
+        file.undo_change()
+        self.assertFalse(self._iso.is_dirty())
+
+        self._iso.replace_file(NotImplementedFile("c.txt", MemoryStream(b"HELLO")))
+        self.assertEqual(self._iso.dirty_files, {"c.txt"})
+        self.assertTrue(self._iso.is_dirty())
+
+    def test_patch_file(self):
+        """
+        Test that patches only hold the changed files and apply back to the changed image.
+        """
+        self._iso.open_file("a.bin")
+        self._iso.replace_file(NotImplementedFile("c.txt", MemoryStream(b"HELLO")))
+        patch_path = self._temp_path.joinpath("changes.zip")
+        patch_path.write_bytes(self._iso.build_patch_file())
+
+        with zipfile.ZipFile(patch_path) as patch_archive:
+            self.assertEqual(sorted(patch_archive.namelist()), ["SYSCODE", "c.txt.patch"])
+
+        patched_path = self._temp_path.joinpath("patched.iso")
+        patch(patch_path, self._image_path, patched_path)
+        patched_iso = GamecubeISO.open_image_file(patched_path)
+        self.assertEqual(patched_iso.open_file("c.txt").to_bytes(), b"HELLO")
+        self.assertEqual(patched_iso.open_file("a.bin").to_bytes(), b"A" * 5000)
+        patched_iso.file_contents.close()
+
+    def test_patch_system_files(self):
+        """
+        Test that a patch with a changed disc header applies along with the changed files.
+        """
+        self._iso.disc_header.replace_bytes(0x20, b"Patched")
+        self._iso.replace_file(NotImplementedFile("c.txt", MemoryStream(b"HELLO")))
+        patch_path = self._temp_path.joinpath("system_changes.zip")
+        patch_path.write_bytes(self._iso.build_patch_file())
+
+        with zipfile.ZipFile(patch_path) as patch_archive:
+            self.assertEqual(
+                sorted(patch_archive.namelist()), ["SYSCODE", "c.txt.patch", "system.bin.patch"]
+            )
+
+        patched_path = self._temp_path.joinpath("system_patched.iso")
+        patch(patch_path, self._image_path, patched_path)
+        patched_iso = GamecubeISO.open_image_file(patched_path)
+        self.assertEqual(bytes(patched_iso.disc_header.to_bytes()[0x20:0x27]), b"Patched")
+        self.assertEqual(patched_iso.open_file("c.txt").to_bytes(), b"HELLO")
+        for file_name, contents in self._files[:2]:
+            self.assertEqual(patched_iso.open_file(file_name).to_bytes(), contents)
+        self.assertEqual(patched_iso.dol.to_bytes(), self._iso.dol.to_bytes())
+        patched_iso.file_contents.close()
+
+    def _apply_changes(self, iso: GamecubeISO, batch):
+        batch.replace_file(NotImplementedFile("a.bin", MemoryStream(b"Z" * 9000)))
+        batch.add_file(NotImplementedFile("d.bin", MemoryStream(b"D" * 100)))
+        batch.remove_file("b.rel")
+        batch.move_file("c.txt", new_name="renamed.txt")
+        batch.add_file(NotImplementedFile("a_much_longer_file_name.bin", MemoryStream(b"E" * 10)))
+
+    def test_batch(self):
+        """
+        Test that a batch of changes gives the same image as making the changes one at a time.
+        """
+        with self._iso.batch() as batch:
+            self._apply_changes(self._iso, batch)
+
+        one_at_a_time_iso = GamecubeISO.open_image_file(self._image_path)
+        self._apply_changes(one_at_a_time_iso, _OneAtATime(one_at_a_time_iso))
+        self.assertEqual(
+            self._iso.table_of_contents.to_bytes(), one_at_a_time_iso.table_of_contents.to_bytes()
+        )
+
+        saved_path = self._temp_path.joinpath("batch.iso")
+        self._iso.save_to_disk(saved_path)
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        file_paths = [path for path, _ in saved_iso.table_of_contents.get_fst_file_paths()]
+        self.assertEqual(
+            file_paths, ["a.bin", "d.bin", "renamed.txt", "a_much_longer_file_name.bin"]
+        )
+        self.assertEqual(saved_iso.open_file("a.bin").to_bytes(), b"Z" * 9000)
+        self.assertEqual(saved_iso.open_file("renamed.txt").to_bytes(), b"hello")
+        self.assertEqual(saved_iso.open_file("d.bin").to_bytes(), b"D" * 100)
+        self.assertEqual(saved_iso.open_file("a_much_longer_file_name.bin").to_bytes(), b"E" * 10)
+        for _, entry in saved_iso.table_of_contents.get_fst_file_paths():
+            self.assertEqual(entry.data_offset % 2048, 0)
+        saved_iso.file_contents.close()
+
+    def test_failed_batch(self):
+        """
+        Test that a batch that raises partway leaves the FST as it was before the batch.
+        """
+        table_of_contents = self._iso.table_of_contents
+        fst_bytes = table_of_contents.to_bytes()
+        with self.assertRaises(ValueError):
+            with self._iso.batch() as batch:
+                self._apply_changes(self._iso, batch)
+                batch.remove_file("nope.bin")
+
+        self.assertEqual(table_of_contents.to_bytes(), fst_bytes)
+        self.assertEqual(
+            [path for path, _ in table_of_contents.get_fst_file_paths()], ["a.bin", "b.rel", "c.txt"]
+        )
+        self.assertEqual(table_of_contents.added_files, [])
+        self.assertEqual(self._iso.dirty_files, set())
+
+        # the tree is still consistent, so a later batch works as usual
+        with self._iso.batch() as batch:
+            batch.remove_file("a.bin")
+        self.assertEqual(table_of_contents.root_directory.next_offset, 3)
+
+    def test_defragment_then_replace(self):
+        """
+        Test that changes after a defragment keep the files where the defragment put them.
+        """
+        toc = self._iso.table_of_contents
+        toc.defragment(0x10000)
+        offsets = {str(f.filename): f.data_offset for f in toc.get_fst_file_list()}
+        self.assertEqual(offsets["a.bin"], 0x10000)
+
+        self._iso.replace_file(NotImplementedFile("c.txt", MemoryStream(b"HELLO")))
+        self.assertEqual({str(f.filename): f.data_offset for f in toc.get_fst_file_list()}, offsets)
+
+        saved_path = self._temp_path.joinpath("defragmented.iso")
+        self._iso.save_to_disk(saved_path)
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        self.assertEqual(
+            {str(f.filename): f.data_offset for f in saved_iso.table_of_contents.get_fst_file_list()},
+            offsets,
+        )
+        for file_name, contents in [("a.bin", b"A" * 5000), ("b.rel", b"B" * 3000), ("c.txt", b"HELLO")]:
+            self.assertEqual(saved_iso.open_file(file_name).to_bytes(), contents)
+        saved_iso.file_contents.close()
+
+    def test_cached_fst_list(self):
+        """
+        Test that the flattened FST is reused until the tree changes.
+        """
+        toc = self._iso.table_of_contents
+        files_by_offset = toc.get_files_by_offset()
+        self.assertIs(toc.get_files_by_offset(), files_by_offset)
+        self.assertEqual([str(entry.filename) for entry in files_by_offset], ["a.bin", "b.rel", "c.txt"])
+        self.assertEqual(toc.search_file_by_name("b.rel"), files_by_offset[1])
+
+        self._iso.delete_file(self._iso.open_file("b.rel"))
+        self.assertIsNot(toc.get_files_by_offset(), files_by_offset)
+        self.assertEqual(
+            [str(entry.filename) for entry in toc.get_fst_file_list()], ["a.bin", "c.txt"]
+        )
+        self.assertIsNone(toc.search_file_by_name("b.rel"))
+
+        files_by_offset = toc.get_files_by_offset()
+        toc.invalidate()
+        self.assertIsNot(toc.get_files_by_offset(), files_by_offset)
+
+    def test_optimize_layout(self):
+        """
+        Test that files in an access trace are moved after the others in the order they're read.
+        """
+        trace_path = self._temp_path.joinpath("trace.txt")
+        c_offset = self._iso.table_of_contents.search_file_by_name("c.txt").data_offset
+        trace_path.write_text(f"# boot\n{hex(c_offset + 2)}\n\na.bin\nc.txt\nmissing.bin\n/a.bin\n")
+
+        report = self._iso.optimize_layout(AccessTrace.from_file(trace_path), end_offset=0x100000)
+        self.assertEqual(report.unresolved, ["missing.bin"])
+        self.assertEqual(report.moved_files, 3)
+        self.assertLess(report.seek_distance_after, report.seek_distance_before)
+
+        # adding a file lays it out after the planned layout instead of undoing it
+        self._iso.add_new_file(NotImplementedFile("d.bin", MemoryStream(b"D" * 100)))
+        saved_path = self._temp_path.joinpath("optimized.iso")
+        self._iso.save_to_disk(saved_path)
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        files_by_offset = saved_iso.table_of_contents.get_files_by_offset()
+        self.assertEqual(
+            [str(f.filename) for f in files_by_offset], ["b.rel", "c.txt", "a.bin", "d.bin"]
+        )
+        self.assertLessEqual(files_by_offset[2].data_offset + files_by_offset[2].data_size, 0x100000)
+        self.assertEqual(files_by_offset[1].data_offset + 2048, files_by_offset[2].data_offset)
+        for file_name, contents in self._files:
+            self.assertEqual(saved_iso.open_file(file_name).to_bytes(), contents)
+        saved_iso.file_contents.close()
+
+    def test_grow_file_after_optimize_layout(self):
+        """
+        Test that a file that grows after the layout is optimized keeps the planned order.
+        """
+        self._iso.optimize_layout(AccessTrace(["a.bin", "c.txt"]), end_offset=0x100000)
+        planned_offset = self._iso.table_of_contents.search_file_by_name("a.bin").data_offset
+        self._iso.open_file("a.bin").insert_bytes(5000, b"Z" * 4000)
+        saved_path = self._temp_path.joinpath("grown.iso")
+        self._iso.save_to_disk(saved_path)
+
+        saved_iso = GamecubeISO.open_image_file(saved_path)
+        files_by_offset = saved_iso.table_of_contents.get_files_by_offset()
+        self.assertEqual([str(f.filename) for f in files_by_offset], ["b.rel", "a.bin", "c.txt"])
+        # the grown file stays where it was planned and only the files after it move
+        self.assertEqual(files_by_offset[1].data_offset, planned_offset)
+        self.assertGreaterEqual(
+            files_by_offset[2].data_offset, planned_offset + files_by_offset[1].data_size
+        )
+        self.assertEqual(saved_iso.open_file("a.bin").to_bytes(), b"A" * 5000 + b"Z" * 4000)
+        self.assertEqual(saved_iso.open_file("b.rel").to_bytes(), b"B" * 3000)
+        self.assertEqual(saved_iso.open_file("c.txt").to_bytes(), b"hello")
+        saved_iso.file_contents.close()
+
+    def test_remove_file_after_optimize_layout(self):
+        """
+        Test that a removed file's planned offset is dropped and isn't given to a new file.
+        """
+        self._iso.optimize_layout(AccessTrace(["a.bin", "c.txt"]), end_offset=0x100000)
+        toc = self._iso.table_of_contents
+        removed_entry = toc.search_file_by_name("a.bin")
+        self.assertIn(removed_entry, toc.planned_offsets)
+
+        self._iso.delete_file(self._iso.open_file("a.bin"))
+        self.assertNotIn(removed_entry, toc.planned_offsets)
+        del removed_entry
+        self._iso.add_new_file(NotImplementedFile("d.bin", MemoryStream(b"D" * 100)))
+        added_entry = toc.search_file_by_name("d.bin")
+        self.assertNotIn(added_entry, toc.planned_offsets)
+        last_file = max(toc.get_fst_file_list(), key=lambda f: f.data_offset)
+        self.assertIs(last_file, added_entry)
+
+    def test_synthetic_image(self):
+        """
+        Test that a generated image with nested directories opens with the same files and DOL it was
+        generated with, and that the same arguments generate the same image.
+        """
+        synthetic_image = SyntheticImage(data_size=0x40000, file_count=40, directory_depth=2, seed=3)
+        image_path = self._temp_path.joinpath("synthetic.iso")
+        self.assertEqual(synthetic_image.write(image_path), image_path.stat().st_size)
+        self.assertEqual(image_path.read_bytes(), SyntheticImage(0x40000, 40, 2, seed=3).to_bytes())
+        self.assertNotEqual(image_path.read_bytes(), SyntheticImage(0x40000, 40, 2, seed=4).to_bytes())
+
+        iso = GamecubeISO.open_image_file(image_path)
+        self.addCleanup(iso.file_contents.close)
+        self.assertEqual(str(iso.disc_header.game_name), "Synthetic Game")
+        self.assertEqual(iso.dol.to_bytes(), synthetic_image.dol)
+        file_paths = iso.table_of_contents.get_fst_file_paths()
+        self.assertEqual([path for path, _ in file_paths], list(synthetic_image.files))
+        self.assertEqual(max(path.count("/") for path, _ in file_paths), 2)
+        for path, entry in file_paths:
+            self.assertEqual(entry.data_size, synthetic_image.files[path])
+            self.assertEqual(
+                iso.open_file(path.rsplit("/", 1)[-1]).to_bytes(),
+                synthetic_image.get_file_contents(path),
+            )
+
+
+class _OneAtATime:
+    """
+    Makes each change to an image in a batch of its own.
+    """
+
+    def __init__(self, iso: GamecubeISO) -> None:
+        self.iso = iso
+
+    def __getattr__(self, name: str):
+        def apply_change(*args, **kwargs):
+            with self.iso.batch() as batch:
+                getattr(batch, name)(*args, **kwargs)
+
+        return apply_change
@@ -0,0 +1,116 @@
+import gc
+import tempfile
+import unittest
+import weakref
+from pathlib import Path
+
+from src.definitions import FileStream, MemoryBudget, MemoryStream, NotImplementedFile
+from src.gamecube import GamecubeISO
+from .synthetic_image import build_test_image
+
+
+class RecordingStream(MemoryStream):
+    """
+    A memory stream that records the size of the largest write made to it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.largest_write = 0
+
+    def write_bytes_at_offset(self, offset: int, value: bytearray) -> int:
+        self.largest_write = max(self.largest_write, len(value))
+        return super().write_bytes_at_offset(offset, value)
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    """
+    This class contains tests for building images with a cap on the file data held in memory.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._files = [("a.bin", b"A" * 0x30000), ("b.rel", b"B" * 3000), ("c.txt", b"hello")]
+        self._image_path = self._temp_path.joinpath("image.iso")
+        self._image_path.write_bytes(build_test_image(self._files, junk_seed=1))
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _change_files(self, iso: GamecubeISO):
+        iso.replace_file(NotImplementedFile("b.rel", MemoryStream(bytes(range(256)) * 0x200)))
+        iso.open_file("a.bin").insert_bytes(0x100, b"inserted")
+        iso.open_file("c.txt").replace_bytes(0, b"J")
+
+    def test_chunked_writes(self):
+        """
+        Test that files are written a chunk at a time and give the same bytes as serializing them.
+        """
+        file = NotImplementedFile("a.bin", MemoryStream(bytes(range(256)) * 0x100))
+        file.insert_bytes(0x10, b"inserted")
+        file.delete_bytes(0x8000, 0x20)
+
+        write_stream = RecordingStream()
+        self.assertEqual(file.write_to_stream(write_stream, 0x10, 0x1000), file.get_file_size())
+        self.assertEqual(write_stream.largest_write, 0x1000)
+        self.assertEqual(bytes(write_stream.stream[0x10:]), bytes(file.to_bytes()))
+
+    def test_spill_and_build(self):
+        """
+        Test that a budgeted build spills changed files to disk and builds the same image.
+        """
+        iso = GamecubeISO.open_image_file(self._image_path)
+        self.addCleanup(iso.file_contents.close)
+        self._change_files(iso)
+        unbudgeted_path = self._temp_path.joinpath("unbudgeted.iso")
+        iso.save_to_disk(unbudgeted_path)
+
+        budgeted_iso = GamecubeISO.open_image_file(self._image_path)
+        self.addCleanup(budgeted_iso.file_contents.close)
+        self._change_files(budgeted_iso)
+        budgeted_path = self._temp_path.joinpath("budgeted.iso")
+        with MemoryBudget(0x40000, self._temp_path) as memory_budget:
+            budgeted_iso.save_to_disk(budgeted_path, memory_budget=memory_budget)
+            self.assertEqual(memory_budget.chunk_size, 0x8000)
+            self.assertEqual(memory_budget.spilled_files, 1)
+            self.assertEqual(memory_budget.spilled_bytes, 0x30000)
+            self.assertLessEqual(memory_budget.peak_buffered, memory_budget.limit)
+            self.assertIsInstance(budgeted_iso.open_file("a.bin").file_contents, FileStream)
+            self.assertIsNotNone(memory_budget.to_json_obj()["peak_rss"])
+
+        self.assertEqual(budgeted_path.read_bytes(), unbudgeted_path.read_bytes())
+        saved_iso = GamecubeISO.open_image_file(budgeted_path)
+        self.assertEqual(saved_iso.open_file("a.bin").to_bytes()[0xF8:0x110], b"A" * 8 + b"inserted" + b"A" * 8)
+        saved_iso.file_contents.close()
+
+    def test_spill_releases_contents(self):
+        """
+        Test that the in-memory contents of a spilled file aren't kept while the budget is open.
+        """
+        file = NotImplementedFile("a.bin", MemoryStream(b"A" * 0x30000))
+        contents = weakref.ref(file.file_contents)
+        with MemoryBudget(0x20000, self._temp_path) as memory_budget:
+            memory_budget.enforce([file])
+            gc.collect()
+            self.assertIsNone(contents())
+            self.assertIsInstance(file.file_contents, FileStream)
+        self.assertIsInstance(file.file_contents, MemoryStream)
+        self.assertEqual(bytes(file.to_bytes()), b"A" * 0x30000)
+
+    def test_save_after_budget(self):
+        """
+        Test that an image can be saved again once the budget it was saved under is closed.
+        """
+        iso = GamecubeISO.open_image_file(self._image_path)
+        self.addCleanup(iso.file_contents.close)
+        self._change_files(iso)
+        budgeted_path = self._temp_path.joinpath("budgeted.iso")
+        with MemoryBudget(0x40000, self._temp_path) as memory_budget:
+            iso.save_to_disk(budgeted_path, memory_budget=memory_budget)
+            self.assertEqual(memory_budget.spilled_files, 1)
+        self.assertIsInstance(iso.open_file("a.bin").file_contents, MemoryStream)
+
+        saved_again_path = self._temp_path.joinpath("saved_again.iso")
+        iso.save_to_disk(saved_again_path)
+        self.assertEqual(saved_again_path.read_bytes(), budgeted_path.read_bytes())
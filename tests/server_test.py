@@ -0,0 +1,79 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from zipfile import ZipFile
+
+import bsdiff4
+
+from src.gamecube import GamecubeISO
+from src.server import ImageClient, ImageServer, RPCError
+from .synthetic_image import build_test_image
+
+
+class ImageServerTest(unittest.TestCase):
+    """
+    This class contains tests for serving image operations over a Unix socket.
+    """
+
+    def setUp(self) -> None:
+        self._files = [("a.bin", b"A" * 5000), ("b.rel", b"B" * 3000), ("c.txt", b"hello")]
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        self._image_path = self._temp_path.joinpath("image.iso")
+        self._image_path.write_bytes(build_test_image(self._files, junk_seed=1))
+
+        self._server = ImageServer(self._temp_path.joinpath("server.sock"))
+        self._server_thread = threading.Thread(target=self._server.serve_forever)
+        self._server_thread.start()
+        self._server.ready.wait()
+        self._client = ImageClient(self._server.socket_path, timeout=10)
+
+    def tearDown(self) -> None:
+        self._client.shutdown()
+        self._client.close()
+        self._server_thread.join()
+        self._temp_dir.cleanup()
+
+    def test_list_and_read(self):
+        files = self._client.list_files(self._image_path)
+        self.assertEqual([file["path"] for file in files], [name for name, _ in self._files])
+        for name, contents in self._files:
+            self.assertEqual(self._client.read_file(self._image_path, name), contents)
+        self.assertEqual(self._client.read_file(self._image_path, "a.bin", 10, 4), b"AAAA")
+
+        # the image is only parsed once
+        self.assertEqual(len(self._server.images), 1)
+
+    def test_replace_and_save(self):
+        self.assertEqual(self._client.replace_file(self._image_path, "c.txt", b"x" * 4000), 4000)
+        output_path = self._temp_path.joinpath("out.iso")
+        self.assertEqual(self._client.save(self._image_path, output_path), output_path.stat().st_size)
+
+        saved_iso = GamecubeISO.open_image_file(output_path)
+        self.assertEqual(saved_iso.open_file("c.txt").to_bytes(), b"x" * 4000)
+        self.assertEqual(saved_iso.open_file("a.bin").to_bytes(), b"A" * 5000)
+        saved_iso.file_contents.close()
+
+    def test_patch(self):
+        patch_path = self._temp_path.joinpath("patch.zip")
+        with ZipFile(patch_path, "w") as patch_file:
+            patch_file.writestr("b.rel.patch", bsdiff4.diff(b"B" * 3000, b"patched"))
+        self.assertEqual(self._client.patch(self._image_path, patch_path), ["b.rel"])
+        self.assertEqual(self._client.read_file(self._image_path, "b.rel"), b"patched")
+
+    def test_errors(self):
+        with self.assertRaises(RPCError) as context:
+            self._client.call("format_disk")
+        self.assertEqual(context.exception.code, RPCError.METHOD_NOT_FOUND)
+
+        with self.assertRaises(RPCError) as context:
+            self._client.read_file(self._image_path, "missing.bin")
+        self.assertEqual(context.exception.code, RPCError.INVALID_PARAMS)
+
+        with self.assertRaises(RPCError) as context:
+            self._client.call("list")
+        self.assertEqual(context.exception.code, RPCError.INVALID_PARAMS)
+
+        self.assertTrue(self._client.close_image(self._image_path))
+        self.assertFalse(self._client.close_image(self._image_path))
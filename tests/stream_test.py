@@ -1,5 +1,11 @@
+import array
+import importlib.util
+import random
+import tempfile
 import unittest
-from src.definitions import MemoryStream
+from pathlib import Path
+
+from src.definitions import FileStream, MemoryStream, OverlayStream, SubStream
 
 
 class MemoryStreamTest(unittest.TestCase):
@@ -47,7 +53,177 @@ class MemoryStreamTest(unittest.TestCase):
         """
         Test writing multiple bytes to the test stream.
         """
-        self._stream.write_bytes_at_offset(0x8, [0xF, 0xF, 0xF])
+        self.assertEqual(self._stream.write_bytes_at_offset(0x8, [0xF, 0xF, 0xF]), 3)
         self.assertEqual(self._stream.stream[0x8], 0xF)
         self.assertEqual(self._stream.stream[0x9], 0xF)
         self.assertEqual(self._stream.stream[0xA], 0xF)
+
+    def test_structs(self):
+        """
+        Test reading and writing big endian structs and arrays.
+        """
+        stream = MemoryStream(bytes(range(0x10)))
+        self.assertEqual(stream.read_struct("IH", 2), (0x02030405, 0x0607))
+        self.assertEqual(stream.read_struct("<H", 0), (0x0100,))
+        self.assertEqual(stream.read_structs("HH", 0, 2), [(0x0001, 0x0203), (0x0405, 0x0607)])
+        self.assertEqual(list(stream.read_array("I", 4, 2)), [0x04050607, 0x08090A0B])
+
+        stream.write_struct("HB", 0, 0xBEEF, 0x7F)
+        stream.write_array(3, array.array("H", [0x1234, 0x5678]))
+        self.assertEqual(stream.get_bytes_at_offset(0, 7), bytearray.fromhex("beef7f12345678"))
+
+    @unittest.skipIf(importlib.util.find_spec("numpy") is None, "NumPy isn't installed")
+    def test_numpy_arrays(self):
+        import numpy
+
+        stream = MemoryStream(bytes(range(0x10)))
+        values = stream.read_array("u4", 0, 4)
+        self.assertEqual(values.tolist(), list(stream.read_array("I", 0, 4)))
+        stream.write_array(0, numpy.array([1, 2], dtype="u2"))
+        self.assertEqual(stream.get_bytes_at_offset(0, 4), bytearray.fromhex("00010002"))
+
+
+class FileStreamTest(unittest.TestCase):
+    """
+    This class contains tests for the FileStream class.
+    A FileStream reads and writes a file with positional reads and writes through a block cache.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._file_bytes = bytearray(i & 0xFF for i in range(0x5000))
+        self._path = Path(self._temp_dir.name).joinpath("stream.bin")
+        self._path.write_bytes(self._file_bytes)
+        self._stream = FileStream.from_file(
+            self._path, writable=True, block_size=0x400, cache_size=4, write_buffer_size=0x100
+        )
+
+    def tearDown(self) -> None:
+        self._stream.close()
+        self._temp_dir.cleanup()
+
+    def test_get_bytes(self):
+        """
+        Test small cached reads, reads across blocks and large uncached reads.
+        """
+        for offset, count in [(0x8, 3), (0x3FE, 4), (0x100, 0x1200), (0x4FF0, 0x100)]:
+            self.assertEqual(
+                self._stream.get_bytes_at_offset(offset, count),
+                self._file_bytes[offset : offset + count],
+            )
+        self.assertLessEqual(len(self._stream._block_cache), 4)
+
+    def test_write_bytes(self):
+        """
+        Test that buffered writes are visible before and after they are written back.
+        """
+        self.assertEqual(self._stream.write_bytes_at_offset(0x3FF, [0xAA, 0xBB]), 2)
+        self._stream.get_bytes_at_offset(0x3F0, 0x20)
+        self.assertEqual(self._stream.get_bytes_at_offset(0x3FF, 2), bytearray([0xAA, 0xBB]))
+
+        self._stream.write_bytes_at_offset(0x5000, [0xCC] * 0x200)
+        self.assertEqual(self._stream.stream_size, 0x5200)
+        self.assertEqual(self._stream.get_bytes_at_offset(0x3FF, 2), bytearray([0xAA, 0xBB]))
+
+        self._stream.close()
+        written_bytes = self._path.read_bytes()
+        self.assertEqual(written_bytes[0x3FF:0x401], bytes([0xAA, 0xBB]))
+        self.assertEqual(written_bytes[0x5000:], bytes([0xCC] * 0x200))
+
+    def test_insert_delete(self):
+        """
+        Test inserting and deleting bytes in the middle of the file.
+        """
+        self._stream.insert_into_stream(0x10, [1, 2, 3])
+        self.assertEqual(self._stream.get_bytes_at_offset(0xF, 5), bytearray([0xF, 1, 2, 3, 0x10]))
+        self._stream.delete_from_stream(0x10, 3)
+        self.assertEqual(
+            self._stream.get_bytes_at_offset(0, self._stream.stream_size), self._file_bytes
+        )
+
+    def test_sequential_read_ahead(self):
+        """
+        Test that a sequential hint caches the blocks following a miss.
+        """
+        self._stream.advise("sequential")
+        self._stream.get_bytes_at_offset(0, 1)
+        self.assertIn(1, self._stream._block_cache)
+
+
+class SubStreamTest(unittest.TestCase):
+    """
+    This class contains tests for windows of another stream.
+    """
+
+    def setUp(self) -> None:
+        self._parent = MemoryStream(bytearray(range(0x20)))
+        self._stream = SubStream(self._parent, 0x10, 0x8)
+
+    def test_read(self):
+        self.assertEqual(self._stream.get_bytes_at_offset(0, 4), bytearray(range(0x10, 0x14)))
+        self.assertEqual(self._stream.get_bytes_at_offset(6, 10), bytearray([0x16, 0x17]))
+        self.assertEqual(self._stream.copy().stream, bytearray(range(0x10, 0x18)))
+
+    def test_write(self):
+        self.assertEqual(self._stream.write_bytes_at_offset(2, b"\xff\xff"), 2)
+        self.assertEqual(self._parent.get_bytes_at_offset(0x12, 2), bytearray(b"\xff\xff"))
+        self.assertEqual(self._parent.stream_size, 0x20)
+
+        with self.assertRaises(ValueError):
+            self._stream.write_bytes_at_offset(7, b"\x00\x00")
+        with self.assertRaises(NotImplementedError):
+            self._stream.insert_into_stream(0, b"\x00")
+
+
+class OverlayStreamTest(unittest.TestCase):
+    """
+    This class contains tests for copy-on-write overlays of a base stream.
+    """
+
+    def setUp(self) -> None:
+        self._base = MemoryStream(bytearray(range(0x40)))
+        self._stream = OverlayStream(self._base)
+
+    def test_write(self):
+        self.assertEqual(self._stream.write_bytes_at_offset(0x10, b"\xff" * 4), 4)
+        self.assertEqual(self._stream.write_bytes_at_offset(0x10, b""), 0)
+        self._stream.write_bytes_at_offset(0x3E, b"\xee" * 4)
+        self.assertEqual(self._stream.get_bytes_at_offset(0xE, 4), bytearray([0xE, 0xF, 0xFF, 0xFF]))
+        self.assertEqual(self._stream.stream_size, 0x42)
+        self.assertEqual(self._stream.get_changed_extents(), [(0x10, 4), (0x3E, 4)])
+        self.assertEqual(self._base.stream, bytearray(range(0x40)))
+
+    def test_copy(self):
+        self._stream.write_bytes_at_offset(0, b"\xaa")
+        snapshot = self._stream.copy()
+        self._stream.write_bytes_at_offset(1, b"\xbb")
+        snapshot.delete_from_stream(0x20, 0x10)
+
+        self.assertEqual(self._stream.get_bytes_at_offset(0, 3), bytearray([0xAA, 0xBB, 2]))
+        self.assertEqual(snapshot.get_bytes_at_offset(0, 3), bytearray([0xAA, 1, 2]))
+        self.assertEqual(self._stream.stream_size, 0x40)
+        self.assertEqual(snapshot.stream_size, 0x30)
+
+    def test_matches_memory_stream(self):
+        """
+        Test that a random sequence of edits gives the same bytes as applying them to a copy.
+        """
+        rng = random.Random(4)
+        expected = MemoryStream(bytearray(self._base.stream))
+        for _ in range(200):
+            offset = rng.randrange(0, expected.stream_size + 8)
+            data = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 12)))
+            operation = rng.randrange(3)
+            if operation == 0:
+                expected.write_bytes_at_offset(offset, data)
+                self._stream.write_bytes_at_offset(offset, data)
+            elif operation == 1:
+                expected.insert_into_stream(offset, bytearray(data))
+                self._stream.insert_into_stream(offset, data)
+            elif offset < expected.stream_size:
+                count = min(len(data), expected.stream_size - offset)
+                expected.delete_from_stream(offset, count)
+                self._stream.delete_from_stream(offset, count)
+
+            self.assertEqual(self._stream.stream_size, expected.stream_size)
+        self.assertEqual(self._stream.get_bytes_at_offset(0, expected.stream_size), expected.stream)
@@ -0,0 +1,252 @@
+import random
+import struct
+from pathlib import Path
+
+from src.definitions import MemoryStream, Stream
+from src.gamecube import JunkGenerator
+from src.gamecube.dol import DOLHeaderFormat
+
+
+def build_dol(
+    text_sizes: "tuple[int, ...]" = (0x200,),
+    data_sizes: "tuple[int, ...]" = (0x100,),
+    bss: "tuple[int, int]" = (0, 0),
+    text_address: int = 0x80003100,
+    data_address: int = 0x80005000,
+) -> bytearray:
+    """
+    Build a DOL with text and data sections of the given sizes stored back to back after the header.
+    Sections are loaded one after the other from the given addresses, and the entry point is the
+    start of the first text section.
+    """
+    offsets, addresses, contents = [[], []], [[], []], bytearray()
+    for kind, (sizes, address) in enumerate([(text_sizes, text_address), (data_sizes, data_address)]):
+        for i, size in enumerate(sizes):
+            offsets[kind].append(0x100 + len(contents))
+            addresses[kind].append(address)
+            address += size
+            if kind == 0:
+                contents += bytes((i + j) & 0xFF for j in range(size))
+            else:
+                contents += bytes([0x11 + i] * size)
+
+    def pad(values: "list[int]", count: int) -> "list[int]":
+        return values + [0] * (count - len(values))
+
+    header = struct.pack(
+        DOLHeaderFormat,
+        *pad(offsets[0], 7),
+        *pad(offsets[1], 11),
+        *pad(addresses[0], 7),
+        *pad(addresses[1], 11),
+        *pad(list(text_sizes), 7),
+        *pad(list(data_sizes), 11),
+        *bss,
+        text_address,
+    )
+    return bytearray(header.ljust(0x100, b"\0")) + contents
+
+
+def _build_boot(game_name: bytes) -> bytearray:
+    boot = bytearray(0x440)
+    boot[0:6] = b"GTSE01"
+    boot[0x1C:0x20] = (0xC2339F3D).to_bytes(4, "big")
+    boot[0x20 : 0x20 + len(game_name)] = game_name
+    return boot
+
+
+def _build_app_loader() -> bytearray:
+    app_loader = bytearray(0x120)
+    app_loader[0:10] = b"2003/01/01"
+    app_loader[0x14:0x18] = (0x100).to_bytes(4, "big")
+    return app_loader
+
+
+def build_test_image(
+    files: "list[tuple[str, bytes]]", junk_seed: int = None, nintendo_junk: bool = False
+) -> bytearray:
+    """
+    Build a small but valid Gamecube image with the given files in the root directory.
+    If a junk seed is given, the space between the system files and game files is filled
+    with random bytes like the junk data on retail discs. If nintendo_junk is set, it's filled
+    with the junk data itself.
+    """
+    boot = _build_boot(b"Test Game")
+    app_loader = _build_app_loader()
+    dol = build_dol()
+
+    dol_offset = 0x2440 + len(app_loader)
+    dol_offset += Stream.align_bytes(dol_offset)
+    fst_offset = dol_offset + len(dol)
+    fst_offset += Stream.align_bytes(fst_offset)
+
+    entry_count = 1 + len(files)
+    fst = bytearray(struct.pack(">BxxxII", 1, 0, entry_count))
+    string_table = bytearray()
+    data_offset = fst_offset + entry_count * 0xC + sum(len(name) + 1 for name, _ in files)
+    data_offset += Stream.align_bytes(data_offset)
+
+    file_offsets = []
+    for name, contents in files:
+        fst += struct.pack(">III", len(string_table), data_offset, len(contents))
+        string_table += name.encode() + b"\0"
+        file_offsets.append(data_offset)
+        data_offset += len(contents) + Stream.align_bytes(len(contents))
+    fst += string_table
+
+    boot[0x420:0x424] = dol_offset.to_bytes(4, "big")
+    boot[0x424:0x428] = fst_offset.to_bytes(4, "big")
+    boot[0x428:0x42C] = len(fst).to_bytes(4, "big")
+    boot[0x42C:0x430] = len(fst).to_bytes(4, "big")
+
+    image = bytearray(data_offset)
+    if junk_seed is not None:
+        generator = random.Random(junk_seed)
+        image[:] = bytes(generator.getrandbits(8) for _ in range(len(image)))
+
+    image[0:0x440] = boot
+    image[0x440:0x2440] = bytes(0x2000)
+    image[0x2440 : 0x2440 + len(app_loader)] = app_loader
+    image[dol_offset : dol_offset + len(dol)] = dol
+    image[fst_offset : fst_offset + len(fst)] = fst
+    for offset, (_, contents) in zip(file_offsets, files):
+        image[offset : offset + len(contents)] = contents
+
+    if nintendo_junk:
+        extents = [(0, 0x2440 + len(app_loader)), (dol_offset, len(dol)), (fst_offset, len(fst))]
+        extents.extend((offset, len(contents)) for offset, (_, contents) in zip(file_offsets, files))
+        JunkGenerator(bytes(boot[0:4]), boot[6]).fill_gaps(MemoryStream(image), extents, len(image))
+    return image
+
+
+class SyntheticImage:
+    """
+    A deterministic image of any size for tests and benchmarks, with a disc header, apploader,
+    a DOL with several sections and BSS, and an FST of nested directories. Each level of
+    directories has directory_count subdirectories down to directory_depth, and the files are
+    spread over all of them with random sizes that add up to about data_size. Every file has a
+    unique name so it can be opened by name. The same arguments always give the same image.
+    """
+
+    EXTENSIONS = (".bin", ".rel", ".adp", ".thp", ".txt")
+
+    def __init__(
+        self,
+        data_size: int = 0x1000000,
+        file_count: int = 64,
+        directory_depth: int = 2,
+        directory_count: int = 3,
+        seed: int = 0,
+    ) -> None:
+        generator = random.Random(seed)
+        self._pool = generator.getrandbits(0x10000 * 8).to_bytes(0x10000, "little")
+
+        directories = [""]
+        level = [""]
+        for depth in range(directory_depth):
+            level = [f"{parent}dir{depth}_{i}/" for parent in level for i in range(directory_count)]
+            directories.extend(level)
+
+        weights = [generator.expovariate(1) for _ in range(file_count)]
+        total_weight = sum(weights) or 1
+        tree = {}
+        for directory in directories:
+            node = tree
+            for name in directory.split("/")[:-1]:
+                node = node.setdefault(name, {})
+        for index, weight in enumerate(weights):
+            node = tree
+            for name in generator.choice(directories).split("/")[:-1]:
+                node = node[name]
+            node[f"file{index:05}{generator.choice(self.EXTENSIONS)}"] = (
+                index,
+                int(data_size * weight / total_weight),
+            )
+
+        # (name, path, directory parent or file index, directory end or file size)
+        self.entries: "list[tuple[str, str, int, int]]" = []
+        self._add_entries(tree, "", 0)
+        files = [(path, index, size) for _, path, index, size in self.entries if not path.endswith("/")]
+        self.files = {path: size for path, _, size in files}
+        self._file_indices = {path: index for path, index, _ in files}
+        self.dol = build_dol(
+            text_sizes=(0x2000, 0x400),
+            data_sizes=(0x800, 0x200, 0x100),
+            bss=(0x80100000, 0x4000),
+            data_address=0x80005800,
+        )
+        self._layout()
+
+    def _add_entries(self, tree: dict, directory: str, parent_index: int):
+        # names are sorted case insensitively like the FSTs on retail discs
+        for name in sorted(tree, key=lambda n: (n.lower(), n)):
+            value = tree[name]
+            if isinstance(value, dict):
+                index = len(self.entries)
+                self.entries.append((name, f"{directory}{name}/", parent_index, 0))
+                self._add_entries(value, f"{directory}{name}/", index + 1)
+                self.entries[index] = self.entries[index][:3] + (len(self.entries) + 1,)
+            else:
+                file_index, size = value
+                self.entries.append((name, directory + name, file_index, size))
+
+    def _layout(self):
+        dol_offset = 0x2440 + 0x120
+        dol_offset += Stream.align_bytes(dol_offset)
+        fst_offset = dol_offset + len(self.dol)
+        fst_offset += Stream.align_bytes(fst_offset)
+
+        fst = bytearray(struct.pack(">BxxxII", 1, 0, len(self.entries) + 1))
+        string_table = bytearray()
+        data_offset = fst_offset + (len(self.entries) + 1) * 0xC
+        data_offset += sum(len(name) + 1 for name, *_ in self.entries)
+        self.file_offsets: "dict[str, int]" = {}
+        for name, path, a, b in self.entries:
+            if path.endswith("/"):
+                fst += struct.pack(">III", 1 << 24 | len(string_table), a, b)
+            else:
+                data_offset += Stream.align_bytes(data_offset)
+                self.file_offsets[path] = data_offset
+                fst += struct.pack(">III", len(string_table), data_offset, b)
+                data_offset += b
+            string_table += name.encode() + b"\0"
+        fst += string_table
+        self.image_size = data_offset + Stream.align_bytes(data_offset)
+
+        boot = _build_boot(b"Synthetic Game")
+        boot[0x420:0x430] = struct.pack(">IIII", dol_offset, fst_offset, len(fst), len(fst))
+        system_area = bytearray(fst_offset + len(fst))
+        system_area[0 : len(boot)] = boot
+        system_area[0x2440 : 0x2440 + 0x120] = _build_app_loader()
+        system_area[dol_offset : dol_offset + len(self.dol)] = self.dol
+        system_area[fst_offset:] = fst
+        self.system_area = system_area
+
+    def get_file_contents(self, path: str) -> bytes:
+        """
+        Get the contents of a file, a window of the random pool starting at a place picked by its index.
+        """
+        size = self.files[path]
+        start = self._file_indices[path] * 0x9E3 % len(self._pool)
+        rotated = self._pool[start:] + self._pool[:start]
+        return (rotated * (size // len(rotated) + 1))[:size]
+
+    def write(self, path: "Path | str") -> int:
+        """
+        Write the image to path and return its size.
+        """
+        with Path(path).open("wb") as image_file:
+            image_file.write(self.system_area)
+            for file_path, offset in self.file_offsets.items():
+                image_file.seek(offset)
+                image_file.write(self.get_file_contents(file_path))
+            image_file.truncate(self.image_size)
+        return self.image_size
+
+    def to_bytes(self) -> bytearray:
+        image = bytearray(self.image_size)
+        image[0 : len(self.system_area)] = self.system_area
+        for file_path, offset in self.file_offsets.items():
+            contents = self.get_file_contents(file_path)
+            image[offset : offset + len(contents)] = contents
+        return image
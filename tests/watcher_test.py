@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.gamecube import GamecubeISO, ImageWatcher
+from .synthetic_image import build_test_image
+
+
+class ImageWatcherTest(unittest.TestCase):
+    """
+    This class contains tests for keeping an image up to date with a directory tree.
+    """
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = Path(self._temp_dir.name)
+        source_path = self._temp_path.joinpath("source.iso")
+        source_path.write_bytes(build_test_image([("a.bin", b"A" * 10)]))
+        self._system_image = GamecubeISO.open_image_file(source_path)
+
+        self._tree_path = self._temp_path.joinpath("tree")
+        self._tree_path.joinpath("data").mkdir(parents=True)
+        self._write("data/first.bin", b"1" * 3000)
+        self._write("data/second.bin", b"2" * 100)
+        self._write("third.bin", b"3" * 5000)
+
+        self._image_path = self._temp_path.joinpath("out.iso")
+        self._watcher = ImageWatcher(self._tree_path, self._image_path, self._system_image)
+
+    def tearDown(self) -> None:
+        self._watcher.close()
+        self._system_image.file_contents.close()
+        self._temp_dir.cleanup()
+
+    def _write(self, file_path: str, contents: bytes):
+        path = self._tree_path.joinpath(file_path)
+        path.write_bytes(contents)
+        # make sure the change is seen even on file systems with coarse timestamps
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def _read_image(self) -> "dict[str, bytes]":
+        iso = GamecubeISO.open_image_file(self._image_path, "file")
+        files = {
+            file_path: bytes(iso._extract_file_by_entry(entry).to_bytes())
+            for file_path, entry in iso.table_of_contents.get_fst_file_paths()
+        }
+        iso.file_contents.close()
+        return files
+
+    def test_patch_in_place(self):
+        """
+        Test that files which still fit are patched without moving anything.
+        """
+        image_size = self._image_path.stat().st_size
+        self._write("data/first.bin", b"x" * 2000)
+        self._write("third.bin", b"y" * 5000)
+        self.assertEqual(sorted(self._watcher.update()), ["data/first.bin", "third.bin"])
+        self.assertEqual(self._image_path.stat().st_size, image_size)
+
+        files = self._read_image()
+        self.assertEqual(files["data/first.bin"], b"x" * 2000)
+        self.assertEqual(files["data/second.bin"], b"2" * 100)
+        self.assertEqual(files["third.bin"], b"y" * 5000)
+        self.assertEqual(self._watcher.update(), [])
+
+    def test_grown_file(self):
+        """
+        Test that a file that no longer fits is moved to the end of the image.
+        """
+        self._write("data/second.bin", b"z" * 9000)
+        self.assertEqual(self._watcher.update(), ["data/second.bin"])
+
+        files = self._read_image()
+        self.assertEqual(files["data/second.bin"], b"z" * 9000)
+        self.assertEqual(files["data/first.bin"], b"1" * 3000)
+        self.assertEqual(files["third.bin"], b"3" * 5000)
+        self.assertEqual(self._image_path.stat().st_size % 2048, 0)
+
+    def test_new_file(self):
+        """
+        Test that adding a file rebuilds the image.
+        """
+        self._write("data/fourth.bin", b"4" * 10)
+        self.assertEqual(self._watcher.update(), ["data/fourth.bin"])
+        self.assertEqual(self._read_image()["data/fourth.bin"], b"4" * 10)